@@ -1,32 +1,30 @@
-import json
 from pathlib import Path
 import pandas as pd
 
+from src.io_excel import read_workbook
+from src.utils.resources import load_json
+
 def load_config():
-    return json.loads(Path("config.json").read_text(encoding="utf-8"))
+    # config.json se lee una vez por proceso (y de nuevo solo si cambia)
+    return load_json("config.json")
 
 def read_excel(xlsx_path: Path, cfg: dict):
-    df = pd.read_excel(xlsx_path, sheet_name=cfg["sheet_activos"], engine="openpyxl")
-    df.columns = [str(c).strip() for c in df.columns]
-
-    missing = [c for c in cfg["required_columns"] if c not in df.columns]
-    if missing:
-        raise ValueError("Faltan columnas en InputActivos: " + ", ".join(missing))
-
-    for col in ["Peso", "Valor en USD", "ScoreActivoFinal", "VolatilidadFinal", "CountryContextScore"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
+    # una sola apertura del libro para InputActivos y Resumen
+    columns, rows, resumen = read_workbook(
+        xlsx_path,
+        sheet_activos=cfg["sheet_activos"],
+        sheet_resumen=cfg["sheet_resumen"],
+        required_columns=cfg["required_columns"],
+        numeric_columns=["Peso", "Valor en USD", "ScoreActivoFinal", "VolatilidadFinal", "CountryContextScore"],
+        drop_invalid=False,
+        strip_headers=True,
+    )
+    df = pd.DataFrame(rows, columns=columns)
 
     wsum = df["Peso"].sum(skipna=True)
     if wsum and abs(wsum - 1.0) > 0.02:
         df["Peso"] = df["Peso"] / wsum
 
-    res = pd.read_excel(xlsx_path, sheet_name=cfg["sheet_resumen"], header=None, engine="openpyxl")
-    res = res.iloc[:, :2].dropna(how="all")
-    res.columns = ["key", "value"]
-    res = res.dropna(subset=["key"])
-    res["key"] = res["key"].astype(str).str.strip()
-    resumen = dict(zip(res["key"], res["value"]))
-
     return df, resumen
 
 def weighted_avg(df, value_col):
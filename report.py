@@ -1,46 +1,45 @@
 from pathlib import Path
 from datetime import datetime
 
-def save_html(output_dir: Path, cliente: dict, metrics: dict, df_top):
-    output_dir.mkdir(parents=True, exist_ok=True)
-    out = output_dir / "reporte_cliente.html"
+from src.templating import Rows, Template, load_template
 
-    rows = ""
-    for _, r in df_top.iterrows():
-        rows += f"""
-        <tr>
-          <td>{r.get('Activo','')}</td>
-          <td>{r.get('Tipo','')}</td>
-          <td>{r.get('Pais','')}</td>
-          <td>{r.get('ISO','')}</td>
-          <td>{r.get('Peso',0):.4f}</td>
-          <td>{r.get('ScoreActivoFinal',0):.2f}</td>
-        </tr>
-        """
+# plantillas compiladas una vez al importar el módulo
+_REPORTE_CLIENTE = load_template("report_cliente.html")
+_ROW = Template("""
+    <tr>
+      <td>{{ activo }}</td>
+      <td>{{ tipo }}</td>
+      <td>{{ pais }}</td>
+      <td>{{ iso }}</td>
+      <td>{{ peso }}</td>
+      <td>{{ score }}</td>
+    </tr>""")
 
-    html = f"""
-    <html>
-    <body>
-    <h1>Reporte de Cartera – {cliente.get('Nombre','Cliente')}</h1>
-    <p>Generado: {datetime.now()}</p>
 
-    <h3>Métricas</h3>
-    <ul>
-      <li>Score promedio: {metrics['score_avg']:.2f}</li>
-      <li>Concentración Top 3: {metrics['top3']*100:.0f}%</li>
-    </ul>
+def _row_context(r) -> dict:
+    return {
+        "activo": r.get("Activo", ""),
+        "tipo": r.get("Tipo", ""),
+        "pais": r.get("Pais", ""),
+        "iso": r.get("ISO", ""),
+        "peso": f"{r.get('Peso', 0):.4f}",
+        "score": f"{r.get('ScoreActivoFinal', 0):.2f}",
+    }
 
-    <h3>Top holdings</h3>
-    <table border="1">
-      <tr>
-        <th>Activo</th><th>Tipo</th><th>Pais</th><th>ISO</th><th>Peso</th><th>Score</th>
-      </tr>
-      {rows}
-    </table>
 
-    </body>
-    </html>
-    """
+def save_html(output_dir: Path, cliente: dict, metrics: dict, df_top):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    out = output_dir / "reporte_cliente.html"
 
-    out.write_text(html, encoding="utf-8")
+    # las filas se escriben al archivo de a bloques, sin concatenar el documento
+    rows = Rows(_ROW, df_top.to_dict("records"), _row_context)
+    with open(out, "w", encoding="utf-8") as f:
+        _REPORTE_CLIENTE.stream(
+            f,
+            nombre=cliente.get("Nombre", "Cliente"),
+            now=datetime.now(),
+            score_avg=f"{metrics['score_avg']:.2f}",
+            top3=f"{metrics['top3']*100:.0f}%",
+            rows=rows,
+        )
     return out
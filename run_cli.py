@@ -1,3 +1,9 @@
+import argparse
+import csv
+import glob
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 
@@ -5,6 +11,112 @@ from engine import load_config, read_excel, weighted_avg, top_concentration
 from report import save_html
 
 
+def compute_report(xlsx_path: Path, cfg: dict, out_dir: Path, nombre: str) -> dict:
+    df, _ = read_excel(xlsx_path, cfg)
+
+    metrics = {
+        "score_avg": weighted_avg(df, "ScoreActivoFinal"),
+        "top3": top_concentration(df, 3)
+    }
+
+    df_top = df.sort_values(by="Peso", ascending=False).head(cfg["top_n"])
+    cliente = {"Nombre": nombre}
+
+    out_path = save_html(out_dir, cliente, metrics, df_top)
+    return {"metrics": metrics, "n_activos": len(df), "out_path": out_path}
+
+
+def _process_one(task: tuple) -> dict:
+    """
+    Worker del modo batch: nunca levanta excepción, devuelve ok/error por archivo.
+    """
+    xlsx_path, out_dir, cfg, nombre = task
+    try:
+        res = compute_report(xlsx_path, cfg, out_dir, nombre)
+        return {
+            "ok": True,
+            "cliente": nombre,
+            "archivo": str(xlsx_path),
+            "n_activos": res["n_activos"],
+            "score_avg": res["metrics"]["score_avg"],
+            "top3": res["metrics"]["top3"],
+            "reporte": str(res["out_path"]),
+        }
+    except Exception as e:
+        return {
+            "ok": False,
+            "cliente": nombre,
+            "archivo": str(xlsx_path),
+            "error": f"{type(e).__name__}: {e}",
+            "traceback": traceback.format_exc(),
+        }
+
+
+def find_workbooks(source: str) -> list:
+    """
+    Carpeta -> todos los .xlsx adentro; cualquier otra cosa se usa como glob.
+    Se ignoran los archivos temporales de Excel (~$...).
+    """
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, "*.xlsx"))
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(Path(p) for p in paths if not Path(p).name.startswith("~$"))
+
+
+def run_batch(source: str, out_base: Path, workers: int | None = None) -> dict:
+    cfg = load_config()
+    files = find_workbooks(source)
+    if not files:
+        print(f"No se encontraron archivos .xlsx en: {source}")
+        return {"ok": 0, "errores": 0}
+
+    out_base.mkdir(parents=True, exist_ok=True)
+
+    # un directorio por cliente (nombre = archivo; si se repite, se numera)
+    tasks = []
+    seen = {}
+    for f in files:
+        nombre = f.stem
+        seen[nombre] = seen.get(nombre, 0) + 1
+        if seen[nombre] > 1:
+            nombre = f"{nombre}_{seen[nombre]}"
+        tasks.append((f, out_base / nombre, cfg, nombre))
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Procesando {len(tasks)} carteras con {workers} workers...")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_process_one, t) for t in tasks]
+        for done, fut in enumerate(as_completed(futures), start=1):
+            r = fut.result()
+            results.append(r)
+            status = "✅" if r["ok"] else "❌"
+            print(f"[{done}/{len(tasks)}] {status} {r['cliente']}")
+
+    ok = sorted((r for r in results if r["ok"]), key=lambda r: r["cliente"])
+    errores = sorted((r for r in results if not r["ok"]), key=lambda r: r["cliente"])
+
+    summary_path = out_base / "resumen.csv"
+    with open(summary_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["cliente", "archivo", "n_activos", "score_avg", "top3", "reporte"])
+        writer.writeheader()
+        for r in ok:
+            writer.writerow({k: r[k] for k in writer.fieldnames})
+
+    errors_path = out_base / "errores.log"
+    with open(errors_path, "w", encoding="utf-8") as f:
+        for r in errores:
+            f.write(f"{r['archivo']}\n{r['error']}\n{r['traceback']}\n")
+
+    print(f"\n✅ {len(ok)} reportes generados, ❌ {len(errores)} con error.")
+    print(f"Resumen: {summary_path.resolve()}")
+    if errores:
+        print(f"Errores: {errors_path.resolve()}")
+    return {"ok": len(ok), "errores": len(errores)}
+
+
 def main():
     cfg = load_config()
 
@@ -20,22 +132,24 @@ def main():
 
     nombre = input("Nombre del cliente: ").strip() or "Cliente"
 
-    df, _ = read_excel(xlsx_path, cfg)
-
-    metrics = {
-        "score_avg": weighted_avg(df, "ScoreActivoFinal"),
-        "top3": top_concentration(df, 3)
-    }
-
-    df_top = df.sort_values(by="Peso", ascending=False).head(cfg["top_n"])
-    cliente = {"Nombre": nombre}
-
     out_dir = Path("output") / datetime.now().strftime("%Y-%m-%d")
-    out_path = save_html(out_dir, cliente, metrics, df_top)
+    out_path = compute_report(xlsx_path, cfg, out_dir, nombre)["out_path"]
 
     print(f"\n✅ Reporte generado: {out_path.resolve()}")
 
 
 if __name__ == "__main__":
-    main()
-
+    parser = argparse.ArgumentParser(description="Reporte de cartera (interactivo o batch).")
+    parser.add_argument("--batch", metavar="CARPETA_O_GLOB",
+                        help="Procesa todos los .xlsx de una carpeta (o un glob) sin preguntar nada.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Procesos en paralelo (default: cantidad de CPUs).")
+    parser.add_argument("--out", default=None,
+                        help="Carpeta de salida (default: output/batch_YYYY-MM-DD).")
+    args = parser.parse_args()
+
+    if args.batch:
+        out = Path(args.out) if args.out else Path("output") / f"batch_{datetime.now().strftime('%Y-%m-%d')}"
+        run_batch(args.batch, out, args.workers)
+    else:
+        main()
@@ -0,0 +1,4 @@
+# Los módulos de src/ se cargan como `engine_v1` (src/ en sys.path: páginas de
+# Streamlit) o como `src.engine_v1` (desde la raíz del repo). Los imports entre
+# módulos hermanos van con `if __package__:` para resolverse en el mismo espacio de
+# nombres que el módulo que importa y no cargar dos copias del mismo módulo.
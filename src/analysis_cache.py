@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class AnalysisCache:
+    """
+    Cache LRU en memoria, compartido por todas las sesiones del proceso.
+
+    Se desaloja por cantidad de entradas y por tamaño aproximado (bytes del pickle).
+    El cálculo de un miss se hace fuera del lock para no bloquear otras sesiones.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = compute()
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size <= self.max_bytes:
+                self._entries[key] = (value, size)
+                self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+CACHE = AnalysisCache()
+
+
+def upload_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _config_key(obj: dict) -> str:
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def cached_payload(data: bytes, source_name: str = "portfolio.xlsx", digest: str | None = None) -> dict:
+    """
+    Payload parseado del upload, cacheado por hash de los bytes y versión de la
+    historia de precios (un cierre nuevo cambia las vols).
+    Devuelve una copia con las filas de activos copiadas: el llamador puede agregar
+    claves (ej. "analysis") o editar activos sin tocar lo cacheado.
+    """
+    # imports diferidos: openpyxl y el engine se cargan con el primer upload, no al abrir la página
+    if __package__:
+        from .io_excel import read_portfolio_bytes
+        from .price_store import price_store_version
+    else:
+        from io_excel import read_portfolio_bytes
+        from price_store import price_store_version
+
+    payload = CACHE.get_or_compute(
+        ("payload", digest or upload_digest(data), price_store_version()),
+        lambda: read_portfolio_bytes(data, source_name),
+    )
+    return {
+        **payload,
+        "activos": [dict(a) for a in payload["activos"]],
+        "metadata": {**payload["metadata"], "source_file": source_name},
+    }
+
+
+def cached_analysis(data: bytes, perfil_declarado: str | None,
+                    thresholds: dict | None = None, scenarios: dict | None = None,
+                    source_name: str = "portfolio.xlsx", risk_model: Any = None) -> Tuple[dict, dict]:
+    """
+    (payload, analysis) cacheados por hash del upload + perfil + umbrales + escenarios
+    (+ huella del modelo de riesgo, si hay).
+    El análisis se devuelve como copia profunda: la página le agrega claves
+    (ej. "stress_mc") y no debe tocar la entrada que comparten todas las sesiones.
+    """
+    if __package__:
+        from .engine_v1 import DEFAULT_SCENARIOS, DEFAULT_THRESHOLDS, run_analysis
+        from .price_store import price_store_version
+    else:
+        from engine_v1 import DEFAULT_SCENARIOS, DEFAULT_THRESHOLDS, run_analysis
+        from price_store import price_store_version
+
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    scenarios = scenarios or DEFAULT_SCENARIOS
+    digest = upload_digest(data)
+    payload = cached_payload(data, source_name, digest)
+    risk_key = risk_model.fingerprint if risk_model is not None else None
+    key = ("analysis", digest, price_store_version(), perfil_declarado,
+           _config_key(thresholds), _config_key(scenarios), risk_key)
+    analysis = CACHE.get_or_compute(
+        key, lambda: run_analysis(payload, perfil_declarado, thresholds, scenarios, risk_model)
+    )
+    return payload, copy.deepcopy(analysis)
@@ -1,4 +1,3 @@
-from pathlib import Path
 import streamlit as st
 import os
 import sys
@@ -8,23 +7,11 @@ ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT_DIR not in sys.path:
     sys.path.insert(0, ROOT_DIR)
 import os
-import tempfile
 import json
 from src.ui import load_css
 load_css()
-from src.io_excel import read_portfolio_excel, write_analysis_json
-from src.engine_v1 import run_analysis
-from src.save_messages import save_messages_from_analysis_json
-from src.report_html import generate_html_report
-from src.narrative_v1 import build_client_messages
-def load_css():
-    css_path = Path("src/styles.css")
-    if css_path.exists():
-        st.markdown(
-            f"<style>{css_path.read_text()}</style>",
-            unsafe_allow_html=True
-        )
-
+from src.analysis_cache import cached_analysis
+from src.render_pipeline import render_all, write_outputs
 st.set_page_config(page_title="ACU - Diagnóstico de Cartera", layout="wide")
 load_css()
 st.title("ACU · Diagnóstico de Cartera (MVP)")
@@ -38,28 +25,17 @@ if uploaded is not None:
     st.success("Archivo cargado. Listo para generar diagnóstico.")
 
     if st.button("Generar diagnóstico (1 click)"):
-        # 1) Guardar archivo subido en un tmp
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-            tmp.write(uploaded.getbuffer())
-            tmp_path = tmp.name
-
         try:
-            # 2) Leer Excel
-            payload = read_portfolio_excel(tmp_path)
-
-            # 3) Correr análisis
-            analysis = run_analysis(payload, perfil_declarado=perfil)
+            # 1-3) Leer Excel y correr análisis (cacheado por hash del archivo + perfil + config)
+            payload, analysis = cached_analysis(uploaded.getvalue(), perfil, source_name=uploaded.name)
             payload["analysis"] = analysis
 
-            # 4) Guardar analysis.json en output/YYYY-MM-DD/
-            out_path = write_analysis_json(payload)
-            out_dir = os.path.dirname(out_path)
+            # 4) JSON + mensajes + HTML en memoria, en una sola pasada
+            rendered = render_all(payload, perfil, formats=("json", "messages", "html"))
 
-            # 5) Generar mensajes y guardarlos
-            save_messages_from_analysis_json(out_path)
-
-            # 6) Generar HTML report
-            html_path = generate_html_report(out_path)
+            # 5) Guardarlos en output/YYYY-MM-DD/
+            paths = write_outputs(rendered)
+            out_dir = paths["out_dir"]
 
             st.success(f"✅ Listo. Output generado en: {out_dir}")
 
@@ -87,6 +63,9 @@ if uploaded is not None:
             if recs:
                 for r in recs:
                     st.write(f"**{r['title']}** — {r['detail']}")
+                    if r.get("proposed_weights"):
+                        with st.expander("Pesos propuestos"):
+                            st.dataframe(r["proposed_weights"], use_container_width=True)
             else:
                 st.write("Sin recomendaciones automáticas.")
 
@@ -99,7 +78,7 @@ if uploaded is not None:
 
             # ---- Mensajes listos ----
             st.subheader("💬 Mensajes listos para enviar")
-            messages = build_client_messages(payload)
+            messages = rendered["messages"]
 
             st.text_area("WhatsApp", messages["whatsapp"], height=180)
             st.text_area("Email (subject + body)", f"Subject: {messages['email']['subject']}\n\n{messages['email']['body']}", height=240)
@@ -107,19 +86,10 @@ if uploaded is not None:
 
             # ---- Descargas ----
             st.subheader("📄 Descargas")
-            with open(out_path, "r", encoding="utf-8") as f:
-                st.download_button("Descargar analysis.json", f, file_name="analysis.json")
-
-            with open(html_path, "r", encoding="utf-8") as f:
-                st.download_button("Descargar report.html", f, file_name="report.html")
+            st.download_button("Descargar analysis.json", rendered["json"], file_name="analysis.json")
+            st.download_button("Descargar report.html", rendered["html"], file_name="report.html")
 
             st.info("Tip: el reporte HTML también queda guardado en la carpeta output del día.")
 
         except Exception as e:
             st.error(f"❌ Error: {e}")
-
-        finally:
-            try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List
+
+if __package__:
+    from .render_pipeline import build_view, render_all, render_pdf, write_outputs
+else:
+    from render_pipeline import build_view, render_all, render_pdf, write_outputs
+
+
+class ArtifactWriter:
+    """
+    Pool acotado de hilos para escribir artefactos (JSON, mensajes, HTML, PDF, runs)
+    fuera del request de Streamlit, compartido por todas las sesiones del proceso.
+
+    submit() devuelve un Future que la UI consulta en cada rerun. Con max_pending
+    trabajos en vuelo, submit() espera a que se libere un lugar (contrapresión en
+    vez de una cola sin límite). Al cerrar el proceso se esperan los pendientes.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 32):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="artifacts")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending: List[Future] = []
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        self._slots.acquire()
+        try:
+            fut = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.append(fut)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _done(self, fut: Future) -> None:
+        with self._lock:
+            if fut in self._pending:
+                self._pending.remove(fut)
+            if fut.cancelled() or fut.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+        self._slots.release()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Espera a que terminen los trabajos enviados hasta ahora.
+        Devuelve False si se cumplió el timeout con trabajos pendientes.
+        """
+        with self._lock:
+            pending = list(self._pending)
+        for fut in pending:
+            try:
+                fut.result(timeout=timeout)
+            except FutureTimeout:
+                return False
+            except Exception:
+                pass  # el error queda en el Future; acá solo se espera
+        return True
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pending": len(self._pending), "completed": self.completed, "failed": self.failed}
+
+
+# singleton del proceso; se vacía al salir para no perder artefactos a medio escribir
+WRITER = ArtifactWriter()
+atexit.register(WRITER.shutdown)
+
+
+def _write_reports(payload: dict, view: dict, output_base: str) -> Dict[str, str]:
+    # json + mensajes + HTML en memoria y después un solo paso a disco
+    rendered = render_all(payload, formats=("json", "messages", "html"), view=view)
+    return write_outputs(rendered, output_base=output_base)
+
+
+def submit_diagnosis_artifacts(payload: dict, perfil_declarado: str | None = None, include_pdf: bool = True,
+                               output_base: str = "output", writer: ArtifactWriter | None = None) -> Dict[str, Future]:
+    """
+    Encola los artefactos de un diagnóstico y devuelve sus futures:
+    - "reports": analysis.json + whatsapp/email/simple.txt + report.html (dict de rutas)
+    - "pdf": bytes del PDF (si include_pdf)
+    La vista compartida se arma una sola vez y la usan los dos trabajos.
+    """
+    writer = writer or WRITER
+    view = build_view(payload, perfil_declarado)
+    futures = {"reports": writer.submit(_write_reports, payload, view, output_base)}
+    if include_pdf:
+        futures["pdf"] = writer.submit(render_pdf, payload, view)
+    return futures
+
+
+def submit_run_save(save: Callable[..., Any], *args, writer: ArtifactWriter | None = None, **kwargs) -> Future:
+    """
+    Encola el guardado de un run (save_run_artifacts + historial) en el mismo pool.
+    """
+    return (writer or WRITER).submit(save, *args, **kwargs)
+
+
+def job_status(futures: Dict[str, Future]) -> Dict[str, str]:
+    """
+    Estado de cada artefacto para mostrar en la UI: "pendiente", "listo" o "error: ...".
+    """
+    out = {}
+    for name, fut in futures.items():
+        if not fut.done():
+            out[name] = "pendiente"
+        elif fut.cancelled():
+            out[name] = "error: cancelado"
+        elif fut.exception() is not None:
+            out[name] = f"error: {fut.exception()}"
+        else:
+            out[name] = "listo"
+    return out
@@ -2,7 +2,9 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from typing import Dict, List, Any, Tuple
-import copy
+import sys
+
+import numpy as np
 
 
 DEFAULT_THRESHOLDS = {
@@ -15,6 +17,11 @@ DEFAULT_THRESHOLDS = {
         "Moderada": 18.0,
         "Agresiva": 25.0,
     },
+    "cvar_profile_limits": {  # CVaR 95% a 1 mes, en %; solo con historia o escenarios (ver risk_var)
+        "Conservadora": 7.0,
+        "Moderada": 10.5,
+        "Agresiva": 15.0,
+    },
 }
 
 DEFAULT_SCENARIOS = {
@@ -24,6 +31,9 @@ DEFAULT_SCENARIOS = {
 }
 
 
+CATEGORY_KEYS = ("Pais", "Tipo", "Moneda")
+
+
 def _safe_float(x) -> float:
     try:
         return float(x)
@@ -31,76 +41,224 @@ def _safe_float(x) -> float:
         return float("nan")
 
 
-def _group_weights(activos: List[dict], key: str) -> Dict[str, float]:
-    out: Dict[str, float] = {}
-    for a in activos:
-        k = str(a.get(key, "")).strip() if a.get(key) is not None else ""
-        w = _safe_float(a.get("Peso"))
-        if k == "" or w != w:
+_NAN = float("nan")
+
+
+def _group_key(x) -> str:
+    return str(x).strip() if x is not None else ""
+
+
+def _intern_label(x):
+    if isinstance(x, str):
+        return sys.intern(x)
+    if isinstance(x, float) and x != x:
+        return _NAN  # un único objeto NaN para que funcione como clave
+    return x
+
+
+def _encode_labels(values: List[Any]) -> Tuple[np.ndarray, List[Any]]:
+    labels: List[Any] = []
+    index: Dict[Any, int] = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        v = _intern_label(v)
+        c = index.get(v)
+        if c is None:
+            c = index[v] = len(labels)
+            labels.append(v)
+        codes[i] = c
+    return codes, labels
+
+
+def _group_labels(codes: np.ndarray, labels: List[Any]) -> Tuple[np.ndarray, List[str]]:
+    """
+    Agrupa etiquetas crudas por clave normalizada (strip). Vacías -> código -1.
+    """
+    keys: List[str] = []
+    index: Dict[str, int] = {}
+    mapping = np.empty(len(labels), dtype=np.int32)
+    for j, raw in enumerate(labels):
+        k = _group_key(raw)
+        if k == "":
+            mapping[j] = -1
             continue
-        out[k] = out.get(k, 0.0) + w
-    # ordenar desc
-    return dict(sorted(out.items(), key=lambda kv: kv[1], reverse=True))
+        c = index.get(k)
+        if c is None:
+            c = index[k] = len(keys)
+            keys.append(k)
+        mapping[j] = c
+    return mapping[codes], keys
+
+
+class Portfolio:
+    """
+    Cartera en formato columnar: un array por campo en vez de un dict por activo.
+
+    Pais/Tipo/Moneda se guardan como códigos int32 sobre etiquetas internadas.
+    Escenarios y rebalanceos usan with_columns(), que devuelve una vista que
+    comparte todos los arrays salvo los que reemplaza (copy-on-write).
+    """
+
+    __slots__ = ("activo", "peso", "vol", "score", "country_ctx", "country_ctx_missing", "categories", "groups")
+
+    def __init__(self, activo: List[Any], peso: np.ndarray, vol: np.ndarray, score: np.ndarray,
+                 country_ctx: np.ndarray, country_ctx_missing: np.ndarray,
+                 categories: Dict[str, Tuple[np.ndarray, List[Any]]],
+                 groups: Dict[str, Tuple[np.ndarray, List[str]]]):
+        self.activo = activo
+        self.peso = peso
+        self.vol = vol
+        self.score = score
+        self.country_ctx = country_ctx
+        self.country_ctx_missing = country_ctx_missing
+        self.categories = categories  # etiquetas crudas (para mostrar)
+        self.groups = groups  # etiquetas normalizadas (para agrupar)
+
+    @classmethod
+    def from_records(cls, activos: List[dict]) -> "Portfolio":
+        n = len(activos)
+        categories = {key: _encode_labels([a.get(key) for a in activos]) for key in CATEGORY_KEYS}
+        return cls(
+            activo=[_intern_label(a.get("Activo")) for a in activos],
+            peso=np.fromiter((_safe_float(a.get("Peso")) for a in activos), dtype=float, count=n),
+            vol=np.fromiter((_safe_float(a.get("VolatilidadFinal")) for a in activos), dtype=float, count=n),
+            score=np.fromiter((_safe_float(a.get("ScoreActivoFinal")) for a in activos), dtype=float, count=n),
+            country_ctx=np.fromiter((_safe_float(a.get("CountryContextScore")) for a in activos), dtype=float, count=n),
+            country_ctx_missing=np.fromiter((a.get("CountryContextScore") is None for a in activos), dtype=bool, count=n),
+            categories=categories,
+            groups={key: _group_labels(*categories[key]) for key in CATEGORY_KEYS},
+        )
+
+    @classmethod
+    def from_arrays(cls, activo: List[Any], peso: np.ndarray, vol: np.ndarray, score: np.ndarray,
+                    country_ctx: np.ndarray, country_ctx_missing: np.ndarray,
+                    categories: Dict[str, Tuple[np.ndarray, List[Any]]]) -> "Portfolio":
+        """
+        Construye desde columnas ya tipadas (ej. un snapshot Arrow), sin pasar por dicts.
+        categories: {"Pais"/"Tipo"/"Moneda": (códigos, etiquetas crudas)}.
+        """
+        categories = {
+            key: (np.asarray(codes, dtype=np.int32), [_intern_label(x) for x in labels])
+            for key, (codes, labels) in categories.items()
+        }
+        return cls(
+            activo=[_intern_label(x) for x in activo],
+            peso=np.asarray(peso, dtype=float),
+            vol=np.asarray(vol, dtype=float),
+            score=np.asarray(score, dtype=float),
+            country_ctx=np.asarray(country_ctx, dtype=float),
+            country_ctx_missing=np.asarray(country_ctx_missing, dtype=bool),
+            categories=categories,
+            groups={key: _group_labels(*categories[key]) for key in CATEGORY_KEYS},
+        )
+
+    def __len__(self) -> int:
+        return len(self.activo)
+
+    def with_columns(self, peso: np.ndarray | None = None, vol: np.ndarray | None = None) -> "Portfolio":
+        return Portfolio(
+            self.activo,
+            self.peso if peso is None else peso,
+            self.vol if vol is None else vol,
+            self.score,
+            self.country_ctx,
+            self.country_ctx_missing,
+            self.categories,
+            self.groups,
+        )
 
+    def label(self, key: str, i: int) -> Any:
+        codes, labels = self.categories[key]
+        return labels[codes[i]]
 
-def _top_n_holdings(activos: List[dict], n: int = 10) -> List[dict]:
-    sorted_a = sorted(activos, key=lambda a: _safe_float(a.get("Peso")), reverse=True)
+    def sorted_index(self) -> np.ndarray:
+        # desc por peso; estable (empates en orden original), NaN al final
+        return np.argsort(-self.peso, kind="stable")
+
+    def columns(self) -> Dict[str, Any]:
+        """
+        Columnas tipadas que consume compute_metrics_columnar.
+        """
+        return {
+            "Peso": self.peso,
+            "ScoreActivoFinal": self.score,
+            "VolatilidadFinal": self.vol,
+            "CountryContextScore": self.country_ctx,
+            "CountryContextMissing": self.country_ctx_missing,
+            "Pais": self.groups["Pais"],
+            "Tipo": self.groups["Tipo"],
+            "Moneda": self.groups["Moneda"],
+        }
+
+
+def _as_portfolio(activos: List[dict] | Portfolio) -> Portfolio:
+    return activos if isinstance(activos, Portfolio) else Portfolio.from_records(activos)
+
+
+def _top_n_holdings(activos: List[dict] | Portfolio, n: int = 10) -> List[dict]:
+    p = _as_portfolio(activos)
     out = []
-    for a in sorted_a[:n]:
+    for i in p.sorted_index()[:n]:
         out.append(
             {
-                "Activo": a.get("Activo"),
-                "Tipo": a.get("Tipo"),
-                "Pais": a.get("Pais"),
-                "Moneda": a.get("Moneda"),
-                "Peso": _safe_float(a.get("Peso")),
-                "VolatilidadFinal": _safe_float(a.get("VolatilidadFinal")),
-                "ScoreActivoFinal": _safe_float(a.get("ScoreActivoFinal")),
+                "Activo": p.activo[i],
+                "Tipo": p.label("Tipo", i),
+                "Pais": p.label("Pais", i),
+                "Moneda": p.label("Moneda", i),
+                "Peso": float(p.peso[i]),
+                "VolatilidadFinal": float(p.vol[i]),
+                "ScoreActivoFinal": float(p.score[i]),
             }
         )
     return out
 
 
-def compute_metrics(activos: List[dict]) -> dict:
-    # Promedios ponderados
-    score_w = 0.0
-    vol_w = 0.0
-    country_ctx_w = 0.0
-    country_ctx_ok = True
-
-    hhi = 0.0
-    weights_sum = 0.0
+def _seq_sum(x: np.ndarray) -> float:
+    # suma secuencial: mismo redondeo que el loop original (np.sum usa suma por pares)
+    return float(np.cumsum(x)[-1]) if x.size else 0.0
 
-    for a in activos:
-        w = _safe_float(a.get("Peso"))
-        if w != w:
-            continue
-        weights_sum += w
-        hhi += w * w
 
-        s = _safe_float(a.get("ScoreActivoFinal"))
-        v = _safe_float(a.get("VolatilidadFinal"))
-        if s == s:
-            score_w += w * s
-        if v == v:
-            vol_w += w * v
+def _group_weights_columnar(codes: np.ndarray, labels: List[str], w: np.ndarray, valid: np.ndarray) -> Dict[str, float]:
+    mask = valid & (codes >= 0)
+    c = codes[mask]
+    if c.size == 0:
+        return {}
+    # bincount acumula en orden de fila, igual que el dict original
+    sums = np.bincount(c, weights=w[mask], minlength=len(labels))
+    present, first = np.unique(c, return_index=True)
+    # desc por peso; empates por orden de aparición (sort estable)
+    order = np.lexsort((first, -sums[present]))
+    return {labels[present[i]]: float(sums[present[i]]) for i in order}
 
-        c = a.get("CountryContextScore", None)
-        if c is None:
-            country_ctx_ok = False
-        else:
-            cf = _safe_float(c)
-            if cf == cf:
-                country_ctx_w += w * cf
 
-    # Top1 / Top3
-    weights_sorted = sorted([_safe_float(a.get("Peso")) for a in activos if _safe_float(a.get("Peso")) == _safe_float(a.get("Peso"))], reverse=True)
-    top1 = weights_sorted[0] if weights_sorted else 0.0
-    top3 = sum(weights_sorted[:3]) if len(weights_sorted) >= 3 else sum(weights_sorted)
+def compute_metrics_columnar(cols: Dict[str, Any]) -> dict:
+    w = cols["Peso"]
+    valid = ~np.isnan(w)
+    wv = w[valid]
 
-    exposicion_pais = _group_weights(activos, "Pais")
-    exposicion_tipo = _group_weights(activos, "Tipo")
-    exposicion_moneda = _group_weights(activos, "Moneda")
+    # Promedios ponderados
+    s = cols["ScoreActivoFinal"][valid]
+    v = cols["VolatilidadFinal"][valid]
+    c = cols["CountryContextScore"][valid]
+    s_ok = ~np.isnan(s)
+    v_ok = ~np.isnan(v)
+    c_ok = ~np.isnan(c)
+    score_w = _seq_sum(wv[s_ok] * s[s_ok])
+    vol_w = _seq_sum(wv[v_ok] * v[v_ok])
+    country_ctx_w = _seq_sum(wv[c_ok] * c[c_ok])
+    country_ctx_ok = not bool(cols["CountryContextMissing"][valid].any())
+
+    hhi = _seq_sum(wv * wv)
+
+    # Top1 / Top3 sin ordenar todo el vector
+    k = min(3, wv.size)
+    top = np.sort(np.partition(wv, wv.size - k)[wv.size - k:])[::-1] if k else wv
+    top1 = float(top[0]) if top.size else 0.0
+    top3 = sum(float(x) for x in top)
+
+    exposicion_pais = _group_weights_columnar(*cols["Pais"], w, valid)
+    exposicion_tipo = _group_weights_columnar(*cols["Tipo"], w, valid)
+    exposicion_moneda = _group_weights_columnar(*cols["Moneda"], w, valid)
 
     metrics = {
         "ScorePromedioCartera": score_w,
@@ -119,13 +277,31 @@ def compute_metrics(activos: List[dict]) -> dict:
     return metrics
 
 
+def compute_metrics(activos: List[dict] | Portfolio, risk_model: Any = None) -> dict:
+    """
+    Con un modelo de riesgo (risk_covariance.RiskModel) suma la vol con
+    correlaciones y las contribuciones al riesgo por activo, país y tipo.
+    """
+    p = _as_portfolio(activos)
+    metrics = compute_metrics_columnar(p.columns())
+    if risk_model is not None:
+        if __package__:
+            from .risk_covariance import portfolio_risk
+        else:
+            from risk_covariance import portfolio_risk
+        metrics.update(portfolio_risk(p, risk_model))
+    return metrics
+
+
 def generate_alerts(metrics: dict, perfil_declarado: str | None, thresholds: dict) -> List[dict]:
     alerts: List[dict] = []
 
     top1 = metrics["ConcentracionTop1"]
     top3 = metrics["ConcentracionTop3"]
     hhi = metrics["IndiceHerfindahl"]
-    vol = metrics["VolPromedioCartera"]
+    # con modelo de riesgo, el perfil se compara contra la vol con correlaciones
+    vol = metrics.get("VolCovarianzaCartera", metrics["VolPromedioCartera"])
+    vol_basis = " (con correlaciones)" if "VolCovarianzaCartera" in metrics else ""
 
     if top1 > thresholds["top1_max"]:
         alerts.append({"type": "concentracion_top1", "severity": "alta", "msg": f"Concentración alta en un activo (Top1 {top1:.0%} > {thresholds['top1_max']:.0%})."})
@@ -146,7 +322,18 @@ def generate_alerts(metrics: dict, perfil_declarado: str | None, thresholds: dic
     if perfil_declarado:
         limits = thresholds["vol_profile_limits"]
         if perfil_declarado in limits and vol > limits[perfil_declarado]:
-            alerts.append({"type": "perfil_mismatch", "severity": "alta", "msg": f"Volatilidad {vol:.1f}% alta para perfil {perfil_declarado} (umbral {limits[perfil_declarado]:.1f}%)."})
+            alerts.append({"type": "perfil_mismatch", "severity": "alta", "msg": f"Volatilidad{vol_basis} {vol:.1f}% alta para perfil {perfil_declarado} (umbral {limits[perfil_declarado]:.1f}%)."})
+
+        # pérdida esperada en la cola (risk_var) vs límite del perfil. Solo con
+        # historia o escenarios: el CVaR paramétrico es un múltiplo fijo de la misma
+        # vol que ya compara perfil_mismatch (sería la misma alerta con otro nombre)
+        cvar_limits = thresholds.get("cvar_profile_limits", {})
+        cvar = metrics.get("CVaRCartera")
+        info = metrics.get("RiesgoPerdida", {})
+        if (cvar is not None and info.get("fuente_alerta", "parametrico") != "parametrico"
+                and perfil_declarado in cvar_limits and cvar > cvar_limits[perfil_declarado]):
+            nivel = info.get("nivel_alerta", 0.95)
+            alerts.append({"type": "cvar_perfil", "severity": "alta", "msg": f"Pérdida esperada en escenarios extremos {cvar:.1f}% alta para perfil {perfil_declarado} (CVaR {nivel:.0%} a {info.get('horizonte_dias', 21)} días, {info.get('fuente_alerta', 'parametrico')}; umbral {cvar_limits[perfil_declarado]:.1f}%)."})
 
     # ordenar: alta primero
     sev_order = {"alta": 0, "media": 1, "baja": 2}
@@ -154,131 +341,256 @@ def generate_alerts(metrics: dict, perfil_declarado: str | None, thresholds: dic
     return alerts[:5]
 
 
-def recommend_rebalancing(activos: List[dict], metrics: dict, thresholds: dict) -> List[dict]:
+REBALANCE_LABELS = {
+    "top1": "Top1",
+    "top3": "Top3",
+    "hhi": "HHI",
+    "country": "exposición por país",
+    "vol": "volatilidad del perfil",
+}
+
+
+def _limits_text(binding: List[str], thresholds: dict, perfil_declarado: str | None,
+                 vol_cov: bool = False) -> str:
+    parts = []
+    for name in binding:
+        if name == "top1":
+            parts.append(f"Top1 ≤ {thresholds['top1_max']:.0%}")
+        elif name == "top3":
+            parts.append(f"Top3 ≤ {thresholds['top3_max']:.0%}")
+        elif name == "hhi":
+            parts.append(f"HHI ≤ {thresholds['hhi_max']:.0%}")
+        elif name == "country":
+            parts.append(f"cada país ≤ {thresholds['country_max']:.0%}")
+        elif name == "vol":
+            limit = thresholds["vol_profile_limits"][perfil_declarado]
+            if vol_cov:
+                # el optimizador acota la vol promedio ponderada, que es tope de la vol con correlaciones
+                parts.append(f"volatilidad promedio ponderada ≤ {limit:.1f}% (perfil {perfil_declarado}; "
+                             f"acota también la vol con correlaciones)")
+            else:
+                parts.append(f"volatilidad ≤ {limit:.1f}% (perfil {perfil_declarado})")
+    return ", ".join(parts[:-1]) + (" y " if len(parts) > 1 else "") + parts[-1] if parts else ""
+
+
+def recommend_rebalancing(activos: List[dict] | Portfolio, metrics: dict, thresholds: dict,
+                          perfil_declarado: str | None = None) -> List[dict]:
     """
-    Reglas v1:
-    - Si Top1 > top1_max: bajar el Top1 al límite y redistribuir proporcionalmente en el resto.
-    - Si Top3 > top3_max: bajar el Top1 y Top2 hasta reducir Top3 (simple).
+    Propuesta de rebalanceo de mínima rotación (rebalance_opt): los pesos más
+    cercanos a los actuales que cumplen a la vez tope por activo, Top3, HHI,
+    tope por país y, si hay perfil, la volatilidad del perfil.
+    Devuelve [] si la cartera ya cumple todos los umbrales.
+
+    La vol se evalúa con la misma medida que la alerta (con correlaciones si hay
+    modelo de riesgo). El optimizador acota la vol promedio ponderada (lineal en
+    los pesos), que nunca es menor que la vol con correlaciones: la propuesta
+    también cumple la alerta. La restricción solo se impone si la alerta salta.
     """
-    recs: List[dict] = []
+    if __package__:
+        from .rebalance_opt import solve_rebalancing
+    else:
+        from rebalance_opt import solve_rebalancing
 
-    # ordenar por peso
-    sorted_a = sorted(activos, key=lambda a: _safe_float(a.get("Peso")), reverse=True)
-    if not sorted_a:
+    recs: List[dict] = []
+    vol_limit = thresholds["vol_profile_limits"].get(perfil_declarado, float("inf")) if perfil_declarado else float("inf")
+    vol_cov = "VolCovarianzaCartera" in metrics
+    vol_ok = metrics.get("VolCovarianzaCartera", metrics["VolPromedioCartera"]) <= vol_limit
+    cumple = (
+        metrics["ConcentracionTop1"] <= thresholds["top1_max"]
+        and metrics["ConcentracionTop3"] <= thresholds["top3_max"]
+        and metrics["IndiceHerfindahl"] <= thresholds["hhi_max"]
+        and max(metrics["ExposicionPorPais"].values(), default=0.0) <= thresholds["country_max"]
+        and vol_ok
+    )
+    p = _as_portfolio(activos)
+    order = p.sorted_index()
+    if cumple or order.size == 0:
         return recs
 
-    top1_max = thresholds["top1_max"]
-    top3_max = thresholds["top3_max"]
+    # sin alerta de vol no se restringe la vol promedio (que la alerta no mira)
+    sol = solve_rebalancing(p, thresholds, None if vol_ok else perfil_declarado)
+    if not sol["binding"]:
+        return recs
 
-    top1 = metrics["ConcentracionTop1"]
-    top3 = metrics["ConcentracionTop3"]
+    propuesta = sol["weights"]
+    valid = order[~np.isnan(p.peso[order])]
+    cambios = propuesta[valid] - p.peso[valid]
+
+    def movimiento(i: int) -> str:
+        return f"{p.activo[i]} de {p.peso[i]:.0%} a {propuesta[i]:.0%}"
+
+    bajas = [i for i in valid[np.argsort(cambios, kind="stable")] if propuesta[i] < p.peso[i] - 0.005][:3]
+    suben = int((cambios > 0.005).sum())
+    detalle = "Bajar " + ", ".join(movimiento(i) for i in bajas) if bajas else "Ajustar pesos"
+    if suben:
+        detalle += " y repartir en " + ("1 activo más chico" if suben == 1 else f"{suben} activos más chicos")
+    detalle += f" (rotación {sol['turnover']:.0%})."
+
+    limites = _limits_text(sol["binding"], thresholds, perfil_declarado, vol_cov)
+    if sol["feasible"]:
+        title = "Rebalanceo de mínima rotación"
+        detail = f"{detalle} Con esto la cartera cumple {limites}."
+    else:
+        title = "Rebalanceo sugerido (límites incompatibles)"
+        detail = (f"Con estos activos no se puede cumplir todo a la vez ({limites}). "
+                  f"Propuesta más cercana: {detalle[0].lower()}{detalle[1:]}")
+
+    recs.append({
+        "rule": "rebalanceo_optimo",
+        "title": title,
+        "detail": detail,
+        "constraints": sol["binding"],
+        "feasible": sol["feasible"],
+        "turnover": sol["turnover"],
+        "vol_basis": "promedio ponderado",
+        "proposed_weights_preview": [
+            {"Activo": p.activo[i], "Peso": float(propuesta[i])} for i in valid[:6]
+        ],
+        # pesos completos, en el mismo orden que la vista (por peso actual desc)
+        "proposed_weights": [
+            {"Activo": p.activo[i], "PesoActual": float(p.peso[i]), "Peso": float(propuesta[i])} for i in valid
+        ],
+    })
+    return recs
+
+
+# tipo de escenario -> (columna categórica, clave del escenario con la etiqueta)
+SCENARIO_GROUP_TYPES = {
+    "multiply_vol_by_country": ("Pais", "country"),
+    "multiply_vol_by_type": ("Tipo", "tipo"),
+    "multiply_vol_by_currency": ("Moneda", "currency"),
+}
 
-    # Helper: redistribuir delta al resto proporcionalmente
-    def redistribute(activos_local: List[dict], idx_reduce: List[int], deltas: List[float]) -> List[dict]:
-        new = copy.deepcopy(activos_local)
-        # reducir
-        total_delta = 0.0
-        for idx, d in zip(idx_reduce, deltas):
-            new[idx]["Peso"] = _safe_float(new[idx]["Peso"]) - d
-            total_delta += d
-
-        # distribuir en el resto
-        rest_indices = [i for i in range(len(new)) if i not in idx_reduce]
-        rest_sum = sum(_safe_float(new[i]["Peso"]) for i in rest_indices)
-        if rest_sum <= 0:
-            return new
-
-        for i in rest_indices:
-            w = _safe_float(new[i]["Peso"])
-            new[i]["Peso"] = w + total_delta * (w / rest_sum)
-
-        return new
-
-    # Regla Top1
-    if top1 > top1_max:
-        exceso = top1 - top1_max
-        propuesta = redistribute(sorted_a, [0], [exceso])
-        recs.append({
-            "rule": "cap_top1",
-            "title": "Reducir concentración del principal activo",
-            "detail": f"Bajar {sorted_a[0].get('Activo')} de {top1:.0%} a {top1_max:.0%} y redistribuir el excedente en el resto.",
-            "proposed_weights_preview": [{"Activo": a.get("Activo"), "Peso": _safe_float(a.get("Peso"))} for a in propuesta[:6]],
-        })
 
-    # Regla Top3 (simple)
-    if top3 > top3_max and len(sorted_a) >= 3:
-        exceso_total = top3 - top3_max
-        # reducimos 60% del exceso desde top1, 40% desde top2 (heurística simple)
-        d1 = exceso_total * 0.6
-        d2 = exceso_total * 0.4
-        propuesta = redistribute(sorted_a, [0, 1], [d1, d2])
-        recs.append({
-            "rule": "cap_top3",
-            "title": "Bajar dominancia del Top 3",
-            "detail": f"Reducir peso de los 2 activos más grandes para llevar Top3 a ~{top3_max:.0%} y redistribuir al resto.",
-            "proposed_weights_preview": [{"Activo": a.get("Activo"), "Peso": _safe_float(a.get("Peso"))} for a in propuesta[:6]],
+def compile_scenarios(p: Portfolio, scenarios: Dict[str, dict]) -> np.ndarray:
+    """
+    Compila los escenarios en una matriz de multiplicadores de volatilidad
+    (activos x escenarios). Tipos desconocidos quedan con multiplicador 1.
+    """
+    items = list(scenarios.values())
+    mult = np.ones((len(p), len(items)))
+
+    by_field: Dict[str, List[Tuple[int, str, float]]] = {}
+    for j, sc in enumerate(items):
+        stype = sc.get("type")
+        if stype == "multiply_vol":
+            mult[:, j] = float(sc["multiplier"])
+        elif stype in SCENARIO_GROUP_TYPES:
+            field, label_key = SCENARIO_GROUP_TYPES[stype]
+            by_field.setdefault(field, []).append((j, str(sc[label_key]), float(sc["multiplier"])))
+
+    # una tabla (grupos x escenarios) por columna y un único gather por activo
+    for field, specs in by_field.items():
+        codes, labels = p.groups[field]
+        index = {k: g for g, k in enumerate(labels)}
+        lut = np.ones((len(labels) + 1, len(specs)))  # última fila: etiqueta vacía (código -1)
+        for col, (_, label, m) in enumerate(specs):
+            g = index.get(label)
+            if g is not None:
+                lut[g, col] = m
+        mult[:, [j for j, _, _ in specs]] = lut[codes]
+
+    return mult
+
+
+def evaluate_scenarios(p: Portfolio, metrics: dict, scenarios: Dict[str, dict],
+                       risk_model: Any = None) -> List[dict]:
+    """
+    Evalúa todos los escenarios en una sola operación matricial.
+    Los escenarios solo tocan VolatilidadFinal, así que HHI y Top3 no cambian.
+    Con modelo de riesgo también se recalcula la vol con correlaciones.
+    """
+    mult = compile_scenarios(p, scenarios)
+    cov_after = None
+    if risk_model is not None and "VolCovarianzaCartera" in metrics:
+        if __package__:
+            from .risk_covariance import scenario_vols
+        else:
+            from risk_covariance import scenario_vols
+        cov_after = scenario_vols(p, risk_model.covariance_for(p.activo, p.vol), mult)
+
+    # contribución w*(v*m) de cada activo (0 si falta peso o vol), sumada en orden de
+    # fila como _seq_sum: mismo redondeo que apply_scenario + compute_metrics
+    wv = p.peso[:, None] * (p.vol[:, None] * mult)
+    wv = np.where(np.isnan(wv), 0.0, wv)
+    vol_after = np.cumsum(wv, axis=0)[-1] if len(wv) else np.zeros(mult.shape[1])
+
+    results = []
+    for j, (key, sc) in enumerate(scenarios.items()):
+        after = {
+            "VolPromedioCartera": float(vol_after[j]),
+            "IndiceHerfindahl": metrics["IndiceHerfindahl"],
+            "ConcentracionTop3": metrics["ConcentracionTop3"],
+        }
+        if cov_after is not None:
+            after["VolCovarianzaCartera"] = float(cov_after[j])
+        results.append({
+            "id": key,
+            "label": sc.get("label", key),
+            "delta": {k: v - metrics[k] for k, v in after.items()},
+            "metrics_after": after,
         })
+    return results
 
-    return recs[:3]
 
+def _scenario_multipliers(p: Portfolio, scenario: dict) -> np.ndarray | None:
+    """
+    Multiplicador de volatilidad por activo para el escenario (None si no aplica).
+    """
+    if scenario.get("type") != "multiply_vol" and scenario.get("type") not in SCENARIO_GROUP_TYPES:
+        return None
+    return compile_scenarios(p, {"sc": scenario})[:, 0]
 
-def apply_scenario(activos: List[dict], scenario: dict) -> List[dict]:
-    new = copy.deepcopy(activos)
-    stype = scenario.get("type")
 
-    if stype == "multiply_vol":
-        m = float(scenario["multiplier"])
-        for a in new:
-            v = _safe_float(a.get("VolatilidadFinal"))
-            if v == v:
-                a["VolatilidadFinal"] = v * m
+def apply_scenario(activos: List[dict] | Portfolio, scenario: dict) -> List[dict] | Portfolio:
+    """
+    Con un Portfolio devuelve una vista que solo reemplaza la columna de volatilidad.
+    Con una lista de dicts devuelve filas nuevas (copia superficial, sin deepcopy).
+    """
+    if isinstance(activos, Portfolio):
+        mult = _scenario_multipliers(activos, scenario)
+        return activos if mult is None else activos.with_columns(vol=activos.vol * mult)
 
-    elif stype == "multiply_vol_by_country":
-        country = scenario["country"]
-        m = float(scenario["multiplier"])
-        for a in new:
-            if str(a.get("Pais", "")).strip() == country:
-                v = _safe_float(a.get("VolatilidadFinal"))
-                if v == v:
-                    a["VolatilidadFinal"] = v * m
+    mult = _scenario_multipliers(Portfolio.from_records(activos), scenario)
+    if mult is None:
+        return [dict(a) for a in activos]
 
+    new = []
+    for a, m in zip(activos, mult.tolist()):
+        row = dict(a)
+        v = _safe_float(a.get("VolatilidadFinal"))
+        if m != 1.0 and v == v:
+            row["VolatilidadFinal"] = v * m
+        new.append(row)
     return new
 
 
 def run_analysis(payload: dict, perfil_declarado: str | None = None,
                  thresholds: dict | None = None,
-                 scenarios: dict | None = None) -> dict:
-    activos = payload["activos"]
+                 scenarios: dict | None = None,
+                 risk_model: Any = None,
+                 var_returns: np.ndarray | None = None) -> dict:
+    # una sola conversión a columnas; escenarios y propuestas son vistas sobre ella
+    portfolio = Portfolio.from_records(payload["activos"])
     thresholds = thresholds or DEFAULT_THRESHOLDS
     scenarios = scenarios or DEFAULT_SCENARIOS
 
-    metrics = compute_metrics(activos)
+    metrics = compute_metrics(portfolio, risk_model)
+    # VaR/CVaR: sobre var_returns (días/escenarios x activos) o la historia de precios local
+    if __package__:
+        from .risk_var import loss_metrics
+    else:
+        from risk_var import loss_metrics
+    metrics.update(loss_metrics(portfolio, metrics, var_returns))
     alerts = generate_alerts(metrics, perfil_declarado, thresholds)
-    recs = recommend_rebalancing(activos, metrics, thresholds)
-
-    # escenarios
-    scenario_results = []
-    for key, sc in scenarios.items():
-        shocked_activos = apply_scenario(activos, sc)
-        shocked_metrics = compute_metrics(shocked_activos)
-        scenario_results.append({
-            "id": key,
-            "label": sc.get("label", key),
-            "delta": {
-                "VolPromedioCartera": shocked_metrics["VolPromedioCartera"] - metrics["VolPromedioCartera"],
-                "IndiceHerfindahl": shocked_metrics["IndiceHerfindahl"] - metrics["IndiceHerfindahl"],
-                "ConcentracionTop3": shocked_metrics["ConcentracionTop3"] - metrics["ConcentracionTop3"],
-            },
-            "metrics_after": {
-                "VolPromedioCartera": shocked_metrics["VolPromedioCartera"],
-                "IndiceHerfindahl": shocked_metrics["IndiceHerfindahl"],
-                "ConcentracionTop3": shocked_metrics["ConcentracionTop3"],
-            }
-        })
+    recs = recommend_rebalancing(portfolio, metrics, thresholds, perfil_declarado)
+
+    # escenarios: una matriz (activos x escenarios) en vez de un loop con compute_metrics
+    scenario_results = evaluate_scenarios(portfolio, metrics, scenarios, risk_model)
 
     result = {
         "metrics": metrics,
-        "top_holdings": _top_n_holdings(activos, n=10),
+        "top_holdings": _top_n_holdings(portfolio, n=10),
         "alerts": alerts,
         "recommendations": recs,
         "scenarios": scenario_results,
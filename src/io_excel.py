@@ -1,7 +1,10 @@
+import io
 import os
 import json
 from datetime import datetime
-import pandas as pd
+from typing import Any, BinaryIO, Dict, List, Tuple
+
+from openpyxl import load_workbook
 
 
 REQUIRED_COLUMNS = [
@@ -16,63 +19,163 @@ REQUIRED_COLUMNS = [
 ]
 
 
-def read_portfolio_excel(xlsx_path: str) -> dict:
-    """
-    Lee el Excel del cliente y devuelve un diccionario estructurado.
+NUMERIC_COLUMNS = ["Valor en USD", "Peso", "VolatilidadFinal", "ScoreActivoFinal"]
+
+_NAN = float("nan")
+
+
+def _to_number(v) -> float:
+    # mismo criterio que pd.to_numeric(errors="coerce")
+    if v is None:
+        return _NAN
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        return float(str(v).strip())
+    except ValueError:
+        return _NAN
+
+
+def _header(row: tuple, strip: bool) -> List[Any]:
+    cells = list(row)
+    while cells and cells[-1] is None:
+        cells.pop()
+    out: List[Any] = []
+    seen: Dict[Any, int] = {}
+    for i, c in enumerate(cells):
+        if c is None:
+            name = f"Unnamed: {i}"
+        else:
+            name = str(c).strip() if strip else c
+        # duplicados como pandas: Col, Col.1, Col.2 ...
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        out.append(name)
+    return out
+
+
+def read_workbook(source: str | BinaryIO,
+                  sheet_activos: str = "InputActivos",
+                  sheet_resumen: str | None = None,
+                  required_columns: List[str] = REQUIRED_COLUMNS,
+                  numeric_columns: List[str] = NUMERIC_COLUMNS,
+                  drop_invalid: bool = True,
+                  strip_headers: bool = False) -> Tuple[List[Any], List[dict], Dict[str, Any]]:
     """
+    Lee el Excel en una sola apertura (openpyxl read-only, values-only), sin DataFrames.
 
-    if not os.path.exists(xlsx_path):
-        raise FileNotFoundError(f"No se encontró el archivo: {xlsx_path}")
-
-    # Leer hojas
-    xl = pd.ExcelFile(xlsx_path)
-
-    if "InputActivos" not in xl.sheet_names:
-        raise ValueError("El Excel no tiene la hoja 'InputActivos'.")
+    - Valida las columnas obligatorias contra el encabezado.
+    - Convierte las columnas numéricas fila por fila (inválidos -> NaN).
+    - Saltea filas vacías y, si drop_invalid, filas con numéricos inválidos.
+    - Si se pide sheet_resumen, devuelve sus dos primeras columnas como dict.
 
-    df = xl.parse("InputActivos")
-
-    # Limpiar filas vacías
-    df = df.dropna(how="all")
-
-    # Validar columnas obligatorias
-    for col in REQUIRED_COLUMNS:
-        if col not in df.columns:
-            raise ValueError(f"Falta la columna obligatoria: {col}")
-
-    # Convertir columnas numéricas
-    numeric_cols = ["Valor en USD", "Peso", "VolatilidadFinal", "ScoreActivoFinal"]
-
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    # Eliminar filas con valores inválidos
-    df = df.dropna(subset=numeric_cols)
+    Devuelve (columnas, filas, resumen).
+    """
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        if sheet_activos not in wb.sheetnames:
+            raise ValueError(f"El Excel no tiene la hoja '{sheet_activos}'.")
+
+        rows_iter = wb[sheet_activos].iter_rows(values_only=True)
+        columns = _header(next(rows_iter, ()), strip_headers)
+
+        missing = [c for c in required_columns if c not in columns]
+        if missing:
+            raise ValueError(f"Faltan columnas en {sheet_activos}: " + ", ".join(missing))
+
+        numeric_idx = [i for i, c in enumerate(columns) if c in numeric_columns]
+        width = len(columns)
+        rows: List[dict] = []
+        for raw in rows_iter:
+            values = list(raw[:width])
+            if all(v is None or v == "" for v in values):
+                continue
+            values += [None] * (width - len(values))
+            for i in numeric_idx:
+                values[i] = _to_number(values[i])
+            if drop_invalid and any(values[i] != values[i] for i in numeric_idx):
+                continue
+            rows.append({c: (_NAN if v is None else v) for c, v in zip(columns, values)})
+
+        resumen: Dict[str, Any] = {}
+        if sheet_resumen is not None:
+            if sheet_resumen not in wb.sheetnames:
+                raise ValueError(f"El Excel no tiene la hoja '{sheet_resumen}'.")
+            for raw in wb[sheet_resumen].iter_rows(max_col=2, values_only=True):
+                key, value = (tuple(raw) + (None, None))[:2]
+                if key is None:
+                    continue
+                resumen[str(key).strip()] = _NAN if value is None else value
+    finally:
+        wb.close()
+
+    return columns, rows, resumen
+
+
+def _build_payload(source: str | BinaryIO, source_name: str, use_price_store: bool = True) -> dict:
+    _, activos, _ = read_workbook(source)
 
     # Validar suma de pesos
-    peso_total = df["Peso"].sum()
+    peso_total = sum(a["Peso"] for a in activos)
 
     if peso_total > 1.5:  # probablemente suma 100
-        df["Peso"] = df["Peso"] / 100
-        peso_total = df["Peso"].sum()
+        for a in activos:
+            a["Peso"] = a["Peso"] / 100
+        peso_total = sum(a["Peso"] for a in activos)
 
     if not 0.99 <= peso_total <= 1.01:
         print(f"⚠️ Advertencia: los pesos suman {peso_total:.4f} (debería ser 1).")
 
-    # Convertir a lista de diccionarios
-    activos = df.to_dict(orient="records")
-
     payload = {
         "metadata": {
-            "source_file": os.path.basename(xlsx_path),
+            "source_file": source_name,
             "generated_at": datetime.now().isoformat(),
         },
         "activos": activos,
     }
 
+    # vol desde la historia de precios local (si existe) en vez de la del Excel
+    if use_price_store:
+        if __package__:
+            from .price_store import default_price_store
+        else:
+            from price_store import default_price_store
+
+        store = default_price_store()
+        if store is not None:
+            stats = store.stats()
+            payload["metadata"]["price_store"] = {
+                "version": stats["version"],
+                "as_of": stats["as_of"],
+                "activos_actualizados": store.enrich_holdings(activos),
+            }
+
     return payload
 
 
+def read_portfolio_excel(xlsx_path: str, use_price_store: bool = True) -> dict:
+    """
+    Lee el Excel del cliente y devuelve un diccionario estructurado.
+    Si hay historia de precios local (price_store), VolatilidadFinal sale de ahí
+    para los activos cubiertos.
+    """
+
+    if not os.path.exists(xlsx_path):
+        raise FileNotFoundError(f"No se encontró el archivo: {xlsx_path}")
+
+    return _build_payload(xlsx_path, os.path.basename(xlsx_path), use_price_store)
+
+
+def read_portfolio_bytes(data: bytes, source_name: str = "portfolio.xlsx", use_price_store: bool = True) -> dict:
+    """
+    Igual que read_portfolio_excel pero desde los bytes del upload (sin tempfile).
+    """
+    return _build_payload(io.BytesIO(data), source_name, use_price_store)
+
+
 def write_analysis_json(payload: dict, output_base: str = "output") -> str:
     """
     Guarda el JSON en output/YYYY-MM-DD/analysis.json
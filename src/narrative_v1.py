@@ -28,6 +28,7 @@ def build_client_messages(payload: dict) -> dict:
 
     score = metrics.get("ScorePromedioCartera", None)
     vol = metrics.get("VolPromedioCartera", None)
+    vol_cov = metrics.get("VolCovarianzaCartera", None)
     top1 = metrics.get("ConcentracionTop1", 0.0)
     top3 = metrics.get("ConcentracionTop3", 0.0)
 
@@ -74,6 +75,11 @@ def build_client_messages(payload: dict) -> dict:
         email_lines.append("Métricas principales:")
         if vol is not None:
             email_lines.append(f"- Volatilidad promedio ponderada: {_fmt_vol(vol)}")
+        if vol_cov is not None:
+            email_lines.append(
+                f"- Volatilidad considerando correlaciones: {_fmt_vol(vol_cov)} "
+                f"(ratio de diversificación {metrics.get('RatioDiversificacion', 1.0):.2f})"
+            )
         email_lines.append(f"- Concentración Top 3: {_pct(top3)}")
         email_lines.append(f"- Mayor posición individual (Top 1): {_pct(top1)}")
         if top_pais[0] is not None:
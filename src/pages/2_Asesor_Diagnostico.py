@@ -1,419 +1,49 @@
 import os
 import json
-import tempfile
 import streamlit as st
-import io
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
 from ui import load_css
-from ai_interpretation import interpretacion_basica
-from io_excel import read_portfolio_excel, write_analysis_json
-from engine_v1 import run_analysis
-from save_messages import save_messages_from_analysis_json
-from report_html import generate_html_report
-from narrative_v1 import build_client_messages
-from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
-import io
-import matplotlib.pyplot as plt
-from reportlab.lib.utils import ImageReader
+from analysis_cache import CACHE, cached_analysis, upload_digest
 from src.utils.client_store import new_run_dir, save_run_artifacts, append_history, list_clients
-from datetime import datetime
-import os
-
-client_ids = list_clients()
-
+from src.utils.book_analytics import build_run_summary
+from src.utils.resources import get_resource, warm_up
 
+# módulos pesados (engine/numpy, openpyxl, reportlab): se importan donde se usan
+# y se precargan en segundo plano, una vez por proceso, al entrar a la página
+HEAVY_MODULES = ("engine_v1", "io_excel", "whatif", "stress_mc", "artifact_writer", "report_pdf")
 
 # Defaults para evitar NameError en reruns
 client_id = None
-portfolio_file = None
 perfil_data = None
 analysis = {}
 alerts = []
-client_ids = list_clients()
+# una sola consulta al índice de clientes (paginada por búsqueda)
+client_query = st.text_input("Buscar cliente (nombre o ID)", key="client_query")
+clients = list_clients(prefix=client_query, limit=200)
 
-if not client_ids:
-    st.warning("No hay clientes creados todavía.")
+if not clients:
+    st.warning("No hay clientes creados todavía." if not client_query else "Sin clientes para esa búsqueda.")
     st.stop()
 
-client_id = st.selectbox("Seleccionar cliente", client_ids, key="client_id")
+client_names = {c["client_id"]: c.get("name", c["client_id"]) for c in clients}
+client_id = st.selectbox(
+    "Seleccionar cliente", list(client_names), format_func=lambda cid: f"{client_names[cid]} — {cid}", key="client_id")
 
 if "pdf_bytes" not in st.session_state:
     st.session_state["pdf_bytes"] = None
 if "client_id" not in st.session_state:
     st.session_state["client_id"] = None
 
-
-def build_portfolio_pdf(payload: dict, analysis: dict) -> bytes:
-    metrics = analysis.get("metrics", {}) if isinstance(analysis, dict) else {}
-
-    vol = metrics.get("VolPromedioCartera", 0)
-    score = metrics.get("ScorePromedioCartera", 0)
-    top3 = metrics.get("ConcentracionTop3", 0)
-    top1 = metrics.get("ConcentracionTop1", 0)
-    hhi = metrics.get("IndiceHerfindahl", 0)
-    buf = io.BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    w, h = A4
-
-    y = h - 60
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, y, "AQ Capitals — Diagnóstico de Cartera")
-    y -= 30
-
-    c.setFont("Helvetica", 11)
-    c.drawString(50, y, f"Perfil declarado: {payload.get('perfil_declarado','-')}")
-    y -= 20
-
-    metrics = (analysis or {}).get("metrics", {})
-    c.drawString(50, y, f"Volatilidad: {metrics.get('VolPromedioCartera','-')}")
-    y -= 16
-    c.drawString(50, y, f"Score: {metrics.get('ScorePromedioCartera','-')}")
-    y -= 16
-    c.drawString(50, y, f"Top 3: {metrics.get('ConcentracionTop3','-')}")
-    y -= 16
-    c.drawString(50, y, f"Top 1: {metrics.get('ConcentracionTop1','-')}")
-    y -= 16
-    c.drawString(50, y, f"HHI: {metrics.get('IndiceHerfindahl','-')}")
-    y -= 26
-
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(50, y, "Alertas")
-    y -= 18
-    c.setFont("Helvetica", 10)
-    def pct(v):
-        return f"{v*100:.1f}%" if v <= 1 else f"{v:.1f}%"
-
-    def num(v):
-        if v is None:
-            return "-"
-        return f"{v:.2f}"
-
-    # ---- DRAW ----
-    draw(f"Volatilidad: {pct(vol)}")
-    draw(f"Score: {score:.1f}")
-    draw(f"Top 3: {pct(top3)}")
-    draw(f"Top 1: {pct(top1)}")
-    draw(f"HHI: {num(hhi)}")
-    alerts = (analysis or {}).get("alerts", [])
-    if not alerts:
-        c.drawString(60, y, "- Sin alertas críticas.")
-        y -= 14
-    else:
-        for a in alerts[:12]:
-            msg = a.get("msg", str(a))
-            c.drawString(60, y, f"- {msg[:110]}")
-            y -= 14
-            if y < 80:
-                c.showPage()
-                y = h - 60
-                c.setFont("Helvetica", 10)
-
-    c.showPage()
-    c.save()
-    return buf.getvalue()
-
-def build_portfolio_pdf_bytes(payload, analysis, perfil_declarado, alerts):
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    import io
-
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-
-    width, height = A4
-    margin = 50
-    y = height - margin
-
-    # -------- Helper draw --------
-    def draw(txt, font_size=11, bold=False):
-        nonlocal y
-        txt = "" if txt is None else str(txt)
-        c.setFont("Helvetica-Bold" if bold else "Helvetica", font_size)
-        c.drawString(margin, y, txt)
-        y -= 18
-
-    # -------- Helpers format --------
-    def pct(v):
-        if v is None:
-            return "-"
-        try:
-            v = float(v)
-        except:
-            return "-"
-        return f"{v*100:.1f}%" if v <= 1 else f"{v:.1f}%"
-
-    def num(v):
-        if v is None:
-            return "-"
-        try:
-            return f"{float(v):.2f}"
-        except:
-            return "-"
-
-    # -------- Extraer metrics --------
-    metrics = analysis.get("metrics", {}) if isinstance(analysis, dict) else {}
-
-    vol = metrics.get("VolPromedioCartera")
-    score = metrics.get("ScorePromedioCartera")
-    top3 = metrics.get("ConcentracionTop3")
-    top1 = metrics.get("ConcentracionTop1")
-    hhi = metrics.get("IndiceHerfindahl")
-
-    # -------- Título --------
-    draw("AQ Capitals — Diagnóstico de Cartera", 18, True)
-    y -= 10
-
-    draw(f"Perfil declarado: {perfil_declarado}", 12)
-    y -= 10
-
-    # -------- Métricas --------
-    draw("Resumen cuantitativo", 14, True)
-    y -= 5
-
-    draw(f"Volatilidad: {pct(vol)}")
-    draw(f"Score: {num(score)}")
-    draw(f"Top 3: {pct(top3)}")
-    draw(f"Top 1: {pct(top1)}")
-    draw(f"HHI: {num(hhi)}")
-
-    y -= 10
-        # -------- Activos en cartera --------
-        # -------- Activos en cartera --------
-    y -= 10
-    draw("Activos en cartera", 14, True)
-    y -= 5
-
-    def _pick_name(d: dict) -> str:
-        for k in (
-            "nombre", "activo", "instrumento", "especie", "descripcion",
-            "ticker", "symbol", "name", "security", "asset"
-        ):
-            v = d.get(k)
-            if v:
-                s = str(v).strip()
-                if s.lower() not in ("nan", "none", "-"):
-                    return s
-
-        # fallback: primer valor util
-        for v in d.values():
-            if v:
-                s = str(v).strip()
-                if s.lower() not in ("nan", "none", "-") and len(s) < 80:
-                    return s
-
-        return "Activo"
-
-    rows = []
-    # ---- sacar lista de activos desde payload ----
-    candidates = []
-
-    candidates = []
-
-    if isinstance(payload, dict):
-        # probá varias llaves típicas
-        for k in ("activos", "assets", "positions", "posiciones", "holdings", "tenencias"):
-            v = payload.get(k)
-            if isinstance(v, list) and v:
-                candidates = v
-                break
-
-        # fallback: si no está directo, a veces viene en payload["portfolio"]
-        if not candidates:
-            p = payload.get("portfolio")
-            if isinstance(p, dict):
-                for k in ("activos", "assets", "positions", "posiciones", "holdings", "tenencias"):
-                    v = p.get(k)
-                    if isinstance(v, list) and v:
-                        candidates = v
-                        break
-
-    # si sigue vacío, al menos no rompe
-    if not candidates:
-        candidates = []
-
-
-
-# si sigue vacío, al menos no rompe
-    if not candidates:
-        candidates = []
-
-    def _to_float(x):
-        if x is None:
-            return None
-        try:
-            if isinstance(x, str):
-                s = x.strip().replace("%", "").replace(",", ".")
-                if s == "" or s.lower() in ("nan", "none", "-"):
-                    return None
-                return float(s)
-            return float(x)
-        except Exception:
-            return None
-
-
-
-    for it in candidates:
-        if isinstance(it, dict):
-            nombre = _pick_name(it)
-
-            peso = (
-                it.get("peso")
-                or it.get("weight")
-                or it.get("ponderacion")
-                or it.get("%")
-                or it.get("pct")
-            )
-
-            peso_f = _to_float(peso)
-
-            monto = it.get("monto") or it.get("amount") or it.get("valor") or it.get("value")
-            monto_f = _to_float(monto)
-
-            moneda = it.get("moneda") or it.get("currency") or ""
-            rows.append((str(nombre), peso_f, monto_f, str(moneda)))
-        else:
-            rows.append((str(it), None, None, ""))
-
-    
-    # Orden: por peso desc si existe
-    rows.sort(key=lambda r: (r[1] is not None, r[1] or 0), reverse=True)
-
-    if not rows:
-        draw("No se encontraron activos en el payload.")
-    else:
-        # mostramos hasta 25 para no romper el layout
-        max_items = 25  
-        for i, (nombre, peso_f, monto_f, moneda) in enumerate(rows[:max_items], start=1):
-            parts = [f"{i}. {nombre}"]
-            if peso_f is not None:
-                parts.append(f"({pct(peso_f)})")
-            if monto_f is not None:
-                parts.append(f"- {monto_f:,.2f} {moneda}".strip())
-            draw(" ".join(parts))
-
-        if len(rows) > max_items:
-            draw(f"... y {len(rows) - max_items} activos más.")
-
-    # -------- Alertas --------
-    draw("Alertas detectadas", 14, True)
-    y -= 5
-
-    if alerts:
-        for a in alerts:
-            if isinstance(a, dict): 
-                msg = a.get("msg") or str(a)
-            else:
-                msg = str(a)
-            draw(f"- {msg}")
-    else:
-        draw("No se detectaron alertas críticas.")   
-
-    c.save()
-    buffer.seek(0)
-    # -------- Pie Chart Distribución por Peso --------
-    draw(f"DEBUG rows: {len(rows)}")
-    y -= 10
-    # Helper interno para generar el gráfico
-    def _make_pie_chart_png(labels, values, title="Distribución por peso (Top 10)"):
-        data = [(l, v) for l, v in zip(labels, values) if v is not None and v > 0]
-        if not data:
-            return None
-
-        labels, values = zip(*data)
-
-        fig, ax = plt.subplots(figsize=(4.5, 4.5), dpi=200)
-        ax.pie(values, autopct="%1.1f%%", startangle=90)
-        ax.axis("equal")
-        ax.set_title(title)
-
-        ax.legend(labels, loc="center left", bbox_to_anchor=(1.02, 0.5), fontsize=7)
-
-        buf = io.BytesIO()
-        plt.tight_layout()
-        fig.savefig(buf, format="png", bbox_inches="tight")
-        plt.close(fig)
-        buf.seek(0)
-        return buf
-
-    # Tomamos Top 10 por peso
-    top_rows = [r for r in rows if r[1] is not None and r[1] > 0][:10]
-
-    if top_rows:
-        labels = [r[0] for r in top_rows]
-        values = [r[1] for r in top_rows]
-
-        pie_buf = _make_pie_chart_png(labels, values)
-
-        if pie_buf:
-            draw("Distribución por peso (Top 10)", 14, True)
-            y -= 10
-
-            img = ImageReader(pie_buf)
-            img_w = 320
-            img_h = 240
-
-            # Si no entra en la página, salto
-            if y - img_h < 60:
-                c.showPage()
-                y = height - margin
-
-            c.drawImage(
-                img,
-                margin,
-                y - img_h,
-                width=img_w,
-                height=img_h,
-                preserveAspectRatio=True,
-                mask="auto",
-            )
-
-            y -= (img_h + 20)
-    else:
-        draw("Distribución por peso: sin datos suficientes.")
-        y -= 10
-    draw(f"DEBUG top_rows: {len(top_rows)}")
-    y -= 10
-    return buffer.getvalue()
-pdf_data = st.session_state.get("pdf_bytes")
-if pdf_data and st.button("💾 Guardar diagnóstico en historial"):
-
-    run = new_run_dir(client_id)
-    run_id = run["run_id"]
-    run_base = run["run_base"]
-
-    metrics = analysis.get("metrics", {}) if isinstance(analysis, dict) else {}
-
-    summary = {
-        "client_id": client_id,
-        "run_id": run_id,
-        "score": metrics.get("ScorePromedioCartera"),
-        "vol": metrics.get("VolPromedioCartera"),
-        "top1": metrics.get("ConcentracionTop1"),
-        "top3": metrics.get("ConcentracionTop3"),
-        "hhi": metrics.get("HHI"),
-        "alerts_count": len(alerts) if alerts else 0,
-    }
-
-    save_run_artifacts(
-        run_base=run_base,
-        excel_bytes=portfolio_file.getvalue(),
-        perfil_data=perfil_data if isinstance(perfil_data, dict) else {},
-        pdf_bytes=pdf_data,
-        summary=summary,
-    )
-
-    append_history(client_id, {"event": "RUN_SAVED", **summary})
-
-    st.success(f"Diagnóstico guardado correctamente (Run: {run_id})")
-
-
-
+# el PDF se arma en segundo plano: cuando el future terminó, se pasa a la sesión
+_pdf_future = (st.session_state.get("artifacts") or {}).get("pdf")
+if _pdf_future is not None and _pdf_future.done() and _pdf_future.exception() is None:
+    st.session_state["pdf_bytes"] = _pdf_future.result()
 
 
+def _save_run(client_id, run_base, summary, event, **artifacts):
+    # corre en el pool de artefactos: escribe el run y después registra el evento
+    save_run_artifacts(run_base=run_base, summary=summary, **artifacts)
+    append_history(client_id, {"event": event, **summary})
+    return run_base
 
 
 # ✅ Siempre primero
@@ -460,12 +90,23 @@ if pwd != ADVISOR_PASSWORD:
     st.stop()
 
 st.success("✅ Acceso concedido")
+warm_up(HEAVY_MODULES, name="asesor")
 # ---- Inputs ----
 st.sidebar.subheader("Perfil")
 perfil_declarado = st.sidebar.selectbox(
     "Perfil declarado", [
         "Moderada", "Conservadora", "Agresiva"], index=0)
 
+st.sidebar.subheader("Stress test")
+usar_stress_mc = st.sidebar.checkbox("Incluir stress test Monte Carlo", value=False)
+stress_draws = st.sidebar.number_input(
+    "Simulaciones", min_value=1_000, max_value=1_000_000, value=100_000, step=10_000)
+
+st.sidebar.subheader("Modelo de riesgo (opcional)")
+risk_file = st.sidebar.file_uploader(
+    "Matriz de correlación/covarianza o precios (.csv, .npz)", type=["csv", "npz"])
+usar_modelo_riesgo = st.sidebar.checkbox("Volatilidad con correlaciones", value=risk_file is not None)
+
 st.sidebar.subheader("Perfil del cliente (opcional)")
 perfil_json = st.sidebar.file_uploader(
     "Subir perfil_cliente.json", type=["json"])
@@ -495,41 +136,60 @@ except Exception as e:
 
 
 
+cache_stats = CACHE.stats()
+st.sidebar.caption(f"Cache de análisis: {cache_stats['hits']} hits · {cache_stats['misses']} misses · {cache_stats['entries']} entradas")
+
 uploaded = st.file_uploader("Subir Excel del cliente (.xlsx)", type=["xlsx"])
 
 if uploaded is not None:
     st.success("Archivo cargado. Listo para generar diagnóstico.")
 
 if st.button("Generar diagnóstico (1 click)"):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-        tmp.write(uploaded.getbuffer())
-        tmp_path = tmp.name
-
     try:
-        payload = read_portfolio_excel(tmp_path)
-        analysis = run_analysis(payload, perfil_declarado=perfil_declarado)
+        from artifact_writer import submit_diagnosis_artifacts
+        from whatif import IncrementalMetrics
+
+        risk_model = None
+        if usar_modelo_riesgo:
+            from risk_covariance import default_risk_model, risk_model_from_bytes
+            if risk_file is not None:
+                # un modelo por archivo subido, compartido por las sesiones del proceso
+                risk_model = get_resource(
+                    ("risk_model", upload_digest(risk_file.getvalue())),
+                    lambda: risk_model_from_bytes(risk_file.getvalue(), risk_file.name),
+                )
+            else:
+                risk_model = default_risk_model()
+            if risk_model is None:
+                st.warning("No hay modelo de riesgo: se usa la volatilidad promedio ponderada.")
+
+        # parseo + análisis cacheados por hash del archivo, perfil, config y modelo de riesgo
+        payload, analysis = cached_analysis(uploaded.getvalue(), perfil_declarado, source_name=uploaded.name,
+                                            risk_model=risk_model)
+        if usar_stress_mc:
+            from stress_mc import run_stress_mc
+            analysis["stress_mc"] = run_stress_mc(
+                payload["activos"], perfil_declarado, config={"n_draws": int(stress_draws)})
         payload["analysis"] = analysis
+        st.session_state["activos"] = payload["activos"]
+        # lo que guarda el botón "Guardar diagnóstico" (en un rerun posterior)
+        st.session_state["analysis"] = analysis
+        st.session_state["portfolio_bytes"] = uploaded.getvalue()
+        st.session_state["run_saved"] = False
+        # simulador what-if: se construye una vez por diagnóstico y vive en la sesión
+        st.session_state["whatif"] = IncrementalMetrics.from_records(payload["activos"], perfil_declarado)
+        for k in [k for k in st.session_state if str(k).startswith("whatif_w_")]:
+            del st.session_state[k]
         alerts = []
         if isinstance(analysis, dict):
             alerts = analysis.get("alerts", []) or []
 
-        alerts = []
-        if isinstance(analysis, dict):
-           alerts = analysis.get("alerts", []) or []
-
-        st.session_state["pdf_bytes"] = build_portfolio_pdf_bytes(
-           payload,
-           analysis,
-           perfil_declarado,
-           alerts
-)
-        out_path = write_analysis_json(payload)
-        out_dir = os.path.dirname(out_path)
-
-        save_messages_from_analysis_json(out_path)
-        html_path = generate_html_report(out_path)
+        # JSON, mensajes, HTML y PDF se escriben en segundo plano:
+        # las métricas y alertas se muestran sin esperar el disco
+        st.session_state["pdf_bytes"] = None
+        st.session_state["artifacts"] = submit_diagnosis_artifacts(payload, perfil_declarado)
 
-        st.success(f"✅ Listo. Output generado en: {out_dir}")
+        st.success("✅ Diagnóstico listo. Los reportes se generan en segundo plano.")
 
         perfil_implicito = analysis.get("perfil_implicito") if isinstance(analysis, dict) else None
         if perfil_implicito and perfil_implicito != perfil_declarado:
@@ -549,6 +209,26 @@ if st.button("Generar diagnóstico (1 click)"):
             col3.metric("Top 3", f"{metrics.get('ConcentracionTop3', 0)*100:.0f}%")
             col4.metric("Top 1", f"{metrics.get('ConcentracionTop1', 0)*100:.0f}%")
             col5.metric("HHI", f"{metrics.get('IndiceHerfindahl', 0):.2f}")
+            perdida = metrics.get("RiesgoPerdida")
+            if perdida:
+                nivel = f"{perdida['nivel_alerta'] * 100:g}"
+                fuente = perdida.get("historico", perdida["parametrico"]) if perdida["fuente_alerta"] != "parametrico" else perdida["parametrico"]
+                col1, col2 = st.columns(2)
+                col1.metric(f"VaR {nivel}% ({perdida['horizonte_dias']} días)", f"{fuente[nivel]['VaR'] * 100:.1f}%")
+                col2.metric(f"CVaR {nivel}% ({perdida['fuente_alerta']})", f"{metrics['CVaRCartera']:.1f}%")
+            precios = payload["metadata"].get("price_store")
+            if precios:
+                st.caption(
+                    f"Volatilidad desde historia de precios al {precios['as_of']} "
+                    f"({precios['activos_actualizados']} de {len(payload['activos'])} activos; el resto, del Excel)."
+                )
+            if "VolCovarianzaCartera" in metrics:
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Vol. con correlaciones", f"{metrics['VolCovarianzaCartera']:.1f}%")
+                col2.metric("Ratio de diversificación", f"{metrics['RatioDiversificacion']:.2f}")
+                col3.metric("Cobertura del modelo", f"{metrics['CoberturaModeloRiesgo']*100:.0f}%")
+                with st.expander("Contribución al riesgo por activo"):
+                    st.dataframe(metrics["ContribucionRiesgoPorActivo"])
 
         st.subheader("⚠️ Alertas")
         alerts = analysis.get("alerts", []) if isinstance(analysis, dict) else []
@@ -559,6 +239,23 @@ if st.button("Generar diagnóstico (1 click)"):
                 st.write("•", clean)
         else:
             st.write("Sin alertas críticas.")
+
+        stress = analysis.get("stress_mc") if isinstance(analysis, dict) else None
+        if stress and stress.get("metrics"):
+            from stress_mc import DEFAULT_MC_CONFIG, headline_percentiles, percentile_key
+
+            st.subheader("🎲 Stress test Monte Carlo")
+            vol_mc = stress["metrics"]["VolPromedioCartera"]
+            breach = stress.get("breach_prob", {})
+            q_mid, q_high = headline_percentiles(stress)
+            tail = stress.get("tail", DEFAULT_MC_CONFIG["tail"])
+            s1, s2, s3, s4 = st.columns(4)
+            s1.metric(f"Vol P{q_mid:g}", f"{vol_mc['percentiles'].get(percentile_key(q_mid), 0):.1f}%")
+            s2.metric(f"Vol P{q_high:g}", f"{vol_mc['percentiles'].get(percentile_key(q_high), 0):.1f}%")
+            s3.metric(f"Vol cola {tail:.0%}", f"{vol_mc['tail_mean_high']:.1f}%")
+            if "VolPromedioCartera" in breach:
+                s4.metric(f"Prob. > {stress['vol_limit']:.0f}%", f"{breach['VolPromedioCartera']*100:.1f}%")
+            st.caption(f"{stress['n_draws']:,} simulaciones · semilla {stress['seed']}")
             # === Executive Summary + Plan de acción (AQ Capitals) ===
         st.subheader("📌 Resumen Ejecutivo")
 
@@ -646,7 +343,71 @@ if st.button("Generar diagnóstico (1 click)"):
         st.exception(e)
 st.divider()
 
+# ---- Simulador what-if (rebalanceo interactivo) ----
+whatif = st.session_state.get("whatif")
+if whatif is not None:
+    st.subheader("🎛️ Simulador de rebalanceo")
+    st.caption("Cada cambio actualiza métricas y alertas de forma incremental, sin recalcular el diagnóstico.")
+
+    nombres = [whatif.portfolio.activo[i] for i in whatif.portfolio.sorted_index()[:10]]
+
+    with st.expander("Mover peso entre activos"):
+        m1, m2, m3 = st.columns(3)
+        src = m1.selectbox("Desde", nombres, key="whatif_src")
+        dst = m2.selectbox("Hacia", list(whatif.portfolio.activo), key="whatif_dst")
+        delta_pct = m3.number_input("Puntos de peso (%)", min_value=0.0, max_value=100.0, value=1.0, step=0.5)
+        if st.button("Mover"):
+            try:
+                whatif.move_weight(src, dst, delta_pct / 100)
+                # sincroniza los sliders afectados antes de dibujarlos
+                for name in (src, dst):
+                    if f"whatif_w_{name}" in st.session_state:
+                        st.session_state[f"whatif_w_{name}"] = whatif.weight(name) * 100
+            except ValueError as e:
+                st.error(str(e))
+
+    for name in nombres:
+        key = f"whatif_w_{name}"
+        if key not in st.session_state:
+            st.session_state[key] = whatif.weight(name) * 100
+        nuevo = st.slider(str(name), 0.0, 100.0, step=0.5, key=key)
+        if abs(nuevo / 100 - whatif.weight(name)) > 1e-12:
+            whatif.update_weight(name, nuevo / 100)
+
+    wm = whatif.metrics()
+    w1, w2, w3, w4, w5 = st.columns(5)
+    w1.metric("Volatilidad", f"{wm['VolPromedioCartera']:.1f}%")
+    w2.metric("Score", f"{wm['ScorePromedioCartera']:.1f}")
+    w3.metric("Top 3", f"{wm['ConcentracionTop3']*100:.0f}%")
+    w4.metric("Top 1", f"{wm['ConcentracionTop1']*100:.0f}%")
+    w5.metric("HHI", f"{wm['IndiceHerfindahl']:.2f}")
+    st.caption(f"Suma de pesos: {sum(w for w in whatif.peso if w == w)*100:.1f}%")
+
+    for a in whatif.alerts():
+        st.write("•", a["msg"])
+
+    if st.button("Restablecer pesos originales"):
+        whatif.reset()
+        for k in [k for k in st.session_state if str(k).startswith("whatif_w_")]:
+            del st.session_state[k]
+        st.rerun()
+
+
+
+artifacts = st.session_state.get("artifacts")
+if artifacts:
+    from artifact_writer import WRITER, job_status
+
+    status = job_status(artifacts)
+    st.caption("Reportes: " + " · ".join(f"{name}: {estado}" for name, estado in status.items()))
+    reports = artifacts["reports"]
+    if reports.done() and reports.exception() is None:
+        st.caption(f"Output generado en: {reports.result()['out_dir']}")
+    if "pendiente" in status.values() and st.button("Actualizar estado de reportes"):
+        WRITER.flush(timeout=5)
+        st.rerun()
 
+pdf_data = st.session_state.get("pdf_bytes")
 if isinstance(pdf_data, bytes) and len(pdf_data) > 0:
     st.download_button(
         "📄 Descargar reporte PDF (AQ Capitals)",
@@ -657,42 +418,31 @@ if isinstance(pdf_data, bytes) and len(pdf_data) > 0:
     )
 else:
     st.info("Primero generá el reporte para habilitar la descarga.")
+
+# guardar el run: todo sale de la sesión (el diagnóstico se generó en un rerun anterior)
 if (
     client_id
-    and portfolio_file is not None
-    and "pdf_bytes" in st.session_state
-    and st.session_state["pdf_bytes"] is not None
+    and isinstance(pdf_data, bytes)
+    and st.session_state.get("analysis")
+    and st.session_state.get("portfolio_bytes") is not None
+    and not st.session_state.get("run_saved")
+    and st.button("💾 Guardar diagnóstico en historial")
 ):
     run = new_run_dir(client_id)  # crea /runs/<run_id>/
     run_id = run["run_id"]
     run_base = run["run_base"]
 
-    metrics = analysis.get("metrics", {}) if isinstance(analysis, dict) else {}
-    summary = {
-        "client_id": client_id,
-        "run_id": run_id,
-        "score": metrics.get("ScorePromedioCartera"),
-        "vol": metrics.get("VolPromedioCartera"),
-        "top1": metrics.get("ConcentracionTop1"),
-        "top3": metrics.get("ConcentracionTop3"),
-        "alerts_count": len(alerts) if alerts else 0,
-    }
-
-    save_run_artifacts(
-        run_base=run_base,
-        excel_bytes=portfolio_file.getvalue(),
-        perfil_data=perfil_data if isinstance(perfil_data, dict) else None,
-        pdf_bytes=st.session_state["pdf_bytes"],
-        summary=summary,
-    )
-    append_history(client_id, {"event": "diagnostico_guardado", **summary})
-    st.success(f"Diagnóstico guardado para {client_id} (run: {run_id})")
-pdf_data = st.session_state.get("pdf_bytes")
+    analysis = st.session_state["analysis"]
+    summary = build_run_summary(client_id, run_id, analysis, st.session_state.get("activos"))
+
+    from artifact_writer import submit_run_save
 
-st.write("DEBUG", {
-    "client_id": st.session_state.get("diagnostico_client_id"),
-    "portfolio_uploaded": portfolio_file is not None,
-    "pdf_key_exists": "pdf_bytes" in st.session_state,
-    "pdf_type": str(type(pdf_data)),
-    "pdf_len": len(pdf_data) if isinstance(pdf_data, (bytes, bytearray)) else None,
-})
+    st.session_state["run_save"] = submit_run_save(
+        _save_run, client_id, run_base, summary, "RUN_SAVED",
+        excel_bytes=st.session_state["portfolio_bytes"],
+        perfil_data=perfil_data if isinstance(perfil_data, dict) else {},
+        pdf_bytes=pdf_data,
+        holdings=st.session_state.get("activos"),
+    )
+    st.session_state["run_saved"] = True  # un run por diagnóstico
+    st.success(f"Guardando diagnóstico para {client_id} en segundo plano (run: {run_id})")
@@ -1,5 +1,5 @@
 import streamlit as st
-from src.utils.client_store import list_clients, save_client_meta, ensure_client_dirs, read_history
+from src.utils.client_store import list_clients, count_clients, save_client_meta, ensure_client_dirs, read_history
 
 st.title("AQ Capitals — Registro de clientes")
 
@@ -17,11 +17,19 @@ with st.expander("➕ Crear / actualizar cliente", expanded=True):
 
 st.divider()
 
-clients = list_clients()
-if not clients:
-    st.info("Todavía no hay clientes cargados.")
+PAGE_SIZE = 50
+
+q = st.text_input("Buscar por nombre o ID", placeholder="Empieza con...")
+total = count_clients(q)
+if not total:
+    st.info("Todavía no hay clientes cargados." if not q else "Sin resultados para la búsqueda.")
     st.stop()
 
+n_pages = (total - 1) // PAGE_SIZE + 1
+page = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, value=1, step=1) if n_pages > 1 else 1
+st.caption(f"{total} clientes")
+clients = list_clients(prefix=q, limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
+
 options = {f'{c.get("name","")} — {c.get("client_id","")}': c.get("client_id","") for c in clients}
 sel_label = st.selectbox("Seleccioná un cliente", list(options.keys()))
 sel_id = options[sel_label]
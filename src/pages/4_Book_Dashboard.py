@@ -0,0 +1,127 @@
+import streamlit as st
+from ui import load_css
+from src.utils.book_analytics import cached_book_view, rebuild_book, sync_book
+
+st.set_page_config(page_title="AQ Capitals · Libro", layout="wide")
+load_css()
+
+st.title("AQ Capitals — Libro consolidado")
+st.caption("Último diagnóstico guardado de cada cliente. Se actualiza solo al guardar un run.")
+
+c1, c2 = st.columns(2)
+if c1.button("Sincronizar runs nuevos"):
+    n = sync_book()
+    st.success(f"{n} clientes actualizados.")
+if c2.button("Reconstruir desde cero"):
+    n = rebuild_book()
+    st.success(f"Libro reconstruido con {n} clientes.")
+
+view = cached_book_view()
+if not view["n_clients"]:
+    st.info("Todavía no hay diagnósticos guardados. Guardá un run desde Diagnóstico o reconstruí el libro.")
+    st.stop()
+
+col1, col2, col3 = st.columns(3)
+col1.metric("Clientes", f"{view['n_clients']:,}")
+col2.metric("Valor total (USD)", f"{view['valor_total']:,.0f}")
+col3.metric("Clientes con alertas", f"{view['clients_with_alerts']:,}")
+st.caption(f"Actualizado: {view['updated_at']}")
+
+LABELS = {"Pais": "País", "Tipo": "Tipo de activo", "Moneda": "Moneda"}
+st.subheader("Exposición de la firma")
+cols = st.columns(len(LABELS))
+for col, (key, label) in zip(cols, LABELS.items()):
+    col.markdown(f"**{label}**")
+    col.dataframe(
+        [{"Categoría": k, "Peso": f"{v * 100:.1f}%"} for k, v in list(view["exposures"][key].items())[:15]],
+        hide_index=True, use_container_width=True,
+    )
+
+st.subheader("Clientes por alerta")
+if view["alert_counts"]:
+    st.bar_chart(view["alert_counts"])
+else:
+    st.caption("Ningún cliente con alertas en su último diagnóstico.")
+
+st.subheader("Distribución entre clientes")
+METRICS = {"vol": ("Volatilidad", "{:.1f}%", 1), "score": ("Score", "{:.1f}", 1),
+           "hhi": ("HHI", "{:.2f}", 1), "top3": ("Top 3", "{:.0f}%", 100), "top1": ("Top 1", "{:.0f}%", 100)}
+rows = []
+for key, (label, fmt, scale) in METRICS.items():
+    d = view["distributions"][key]
+    if not d["n"]:
+        continue
+    rows.append({"Métrica": label, "Clientes": d["n"], "Promedio": fmt.format(d["mean"] * scale),
+                 **{k.upper(): fmt.format(v * scale) for k, v in d["percentiles"].items()}})
+st.dataframe(rows, hide_index=True, use_container_width=True)
+
+metric = st.selectbox("Histograma", list(METRICS), format_func=lambda k: METRICS[k][0])
+hist = view["distributions"][metric].get("histogram")
+if hist:
+    label, fmt, scale = METRICS[metric]
+    edges = hist["edges"]
+    st.bar_chart({f"{fmt.format(edges[i] * scale)}–{fmt.format(edges[i + 1] * scale)}": c
+                  for i, c in enumerate(hist["counts"])})
+
+st.subheader("Clientes por perfil")
+st.bar_chart(view["perfiles"])
+
+st.subheader("Screening de clientes")
+st.caption("Último run de cada cliente. Exposición como Pais.Argentina, Tipo.Bono o Moneda.ARS; pesos y Top en %, HHI entre 0 y 1.")
+n_filters = st.number_input("Cantidad de filtros", min_value=1, max_value=5, value=1, step=1)
+filters = []
+PERCENT_FIELDS = {"top1", "top3"}  # HHI se carga 0-1, como se muestra
+for i in range(int(n_filters)):
+    f1, f2, f3 = st.columns([3, 1, 2])
+    field = f1.text_input("Campo", value="Pais.Argentina" if i == 0 else "", key=f"screen_field_{i}")
+    op = f2.selectbox("Op", [">", ">=", "<", "<=", "=", "!="], key=f"screen_op_{i}")
+    raw = f3.text_input("Valor", value="40" if i == 0 else "", key=f"screen_value_{i}")
+    if not field or raw == "":
+        continue
+    try:
+        value = float(raw)
+        if "." in field or field in PERCENT_FIELDS:
+            value /= 100
+    except ValueError:
+        value = raw  # texto: perfil, client_id
+    filters.append((field.strip(), op, value))
+
+if filters:
+    from src.utils.run_index import count_runs, screen_runs
+    try:
+        total = count_runs(filters)
+        sort_by = filters[0][0] if isinstance(filters[0][2], float) else None
+        rows = screen_runs(filters, sort_by=sort_by, limit=200)
+    except ValueError as e:
+        st.error(str(e))
+    else:
+        st.caption(f"{total} clientes cumplen los filtros" + (" (se muestran 200)" if total > 200 else ""))
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+st.subheader("¿Quién tiene este activo?")
+st.caption("Último run de cada cliente. El nombre no distingue mayúsculas ni espacios.")
+activo = st.text_input("Activo", key="holders_asset")
+if activo.strip():
+    from src.utils.holdings_index import firm_exposure, propagate_price_shock, who_holds
+
+    exp = firm_exposure(activo)
+    h1, h2, h3 = st.columns(3)
+    h1.metric("Clientes", f"{exp['clientes']:,}")
+    h2.metric("Exposición (USD)", f"{exp['valor_usd']:,.0f}")
+    h3.metric("Fracción de la firma", f"{exp['fraccion_firma'] * 100:.2f}%" if exp["fraccion_firma"] is not None else "—")
+    holders = who_holds(activo, limit=500)
+    if holders:
+        st.dataframe(
+            [{**h, "Peso": f"{h['Peso'] * 100:.1f}%" if h["Peso"] is not None else "—"} for h in holders],
+            hide_index=True, use_container_width=True,
+        )
+        shock = st.number_input("Shock de precio (%)", min_value=-100.0, max_value=100.0, value=-20.0, step=5.0)
+        if shock:
+            impact = propagate_price_shock({activo: shock / 100})
+            st.dataframe(
+                [{"client_id": r["client_id"], "P&L": f"{r['PnL'] * 100:.2f}%", "P&L USD": f"{r['PnL USD']:,.0f}"}
+                 for r in impact[:500]],
+                hide_index=True, use_container_width=True,
+            )
+    else:
+        st.caption("Ningún cliente tiene ese activo en su último diagnóstico.")
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Iterable, Sequence, Tuple
+
+from reportlab.graphics import renderPDF
+from reportlab.graphics.charts.barcharts import HorizontalBarChart
+from reportlab.graphics.charts.legends import Legend
+from reportlab.graphics.charts.piecharts import Pie
+from reportlab.graphics.shapes import Drawing, String
+from reportlab.lib import colors
+
+
+# gráficos vectoriales nativos de reportlab (sin matplotlib ni PNG intermedio)
+PALETTE = [
+    colors.HexColor(c) for c in (
+        "#1f4e79", "#2e75b6", "#9dc3e6", "#548235", "#a9d18e",
+        "#bf9000", "#ffd966", "#c55a11", "#f4b183", "#7f6084", "#a5a5a5",
+    )
+]
+
+MAX_BARS = 12
+
+
+def chart_key(items: Iterable[Tuple[str, float]], top: int | None = None) -> Tuple[Tuple[str, ...], Tuple[float, ...]]:
+    """
+    Clave hashable (labels, valores) para el cache de gráficos. Los valores se
+    redondean para que diferencias de punto flotante no generen entradas nuevas.
+    """
+    data = [(str(k), round(float(v), 6)) for k, v in items if v is not None and v > 0]
+    if top is not None and len(data) > top:
+        otros = round(sum(v for _, v in data[top - 1:]), 6)
+        data = data[:top - 1] + [("Otros", otros)]
+    if not data:
+        return (), ()
+    labels, values = zip(*data)
+    return tuple(labels), tuple(values)
+
+
+def _title(d: Drawing, title: str, height: float) -> None:
+    d.add(String(0, height - 12, title, fontName="Helvetica-Bold", fontSize=11))
+
+
+@lru_cache(maxsize=256)
+def pie_chart(labels: Sequence[str], values: Sequence[float], title: str,
+              width: int = 460, height: int = 220) -> Drawing | None:
+    """
+    Torta de pesos con porcentajes en las porciones y leyenda a la derecha.
+    Cacheada por datos: el mismo portafolio no vuelve a armar el gráfico.
+    """
+    if not values:
+        return None
+    total = sum(values)
+    d = Drawing(width, height)
+    _title(d, title, height)
+
+    pie = Pie()
+    size = height - 40
+    pie.x, pie.y = 10, 10
+    pie.width = pie.height = size
+    pie.data = list(values)
+    pie.labels = [f"{v / total * 100:.1f}%" if v / total >= 0.04 else "" for v in values]
+    pie.simpleLabels = 1
+    pie.sideLabels = 0
+    pie.slices.strokeWidth = 0.5
+    pie.slices.strokeColor = colors.white
+    pie.slices.fontSize = 7
+    pie.slices.labelRadius = 0.7
+    pie.slices.fontColor = colors.white
+    for i in range(len(values)):
+        pie.slices[i].fillColor = PALETTE[i % len(PALETTE)]
+    d.add(pie)
+
+    legend = Legend()
+    legend.x = size + 40
+    legend.y = height - 30
+    legend.dx = legend.dy = 7
+    legend.fontSize = 7
+    legend.deltay = 10
+    legend.alignment = "right"
+    legend.columnMaximum = 14
+    legend.colorNamePairs = [
+        (PALETTE[i % len(PALETTE)], f"{label[:38]}  {v / total * 100:.1f}%")
+        for i, (label, v) in enumerate(zip(labels, values))
+    ]
+    d.add(legend)
+    return d
+
+
+@lru_cache(maxsize=256)
+def bar_chart(labels: Sequence[str], values: Sequence[float], title: str, width: int = 460) -> Drawing | None:
+    """
+    Barras horizontales de exposición (valores en fracción, se muestran en %).
+    El alto se ajusta a la cantidad de categorías.
+    """
+    if not values:
+        return None
+    n = len(values)
+    bar_h = 14
+    height = 30 + n * bar_h + 16
+    d = Drawing(width, height)
+    _title(d, title, height)
+
+    chart = HorizontalBarChart()
+    chart.x, chart.y = 110, 12
+    chart.width = width - 160
+    chart.height = n * bar_h
+    # la primera categoría va arriba
+    chart.data = [[v * 100 for v in reversed(values)]]
+    chart.categoryAxis.categoryNames = [label[:22] for label in reversed(labels)]
+    chart.categoryAxis.labels.fontSize = 7
+    chart.categoryAxis.labels.boxAnchor = "e"
+    chart.categoryAxis.labels.dx = -4
+    chart.valueAxis.valueMin = 0
+    chart.valueAxis.valueMax = max(v * 100 for v in values) * 1.15
+    chart.valueAxis.visible = 0
+    chart.bars[0].fillColor = PALETTE[1]
+    chart.bars.strokeWidth = 0
+    chart.barLabelFormat = "%.1f%%"
+    chart.barLabels.fontSize = 7
+    chart.barLabels.boxAnchor = "w"
+    chart.barLabels.dx = 3
+    d.add(chart)
+    return d
+
+
+def draw_chart(c, drawing: Drawing, x: float, y_top: float) -> float:
+    """
+    Dibuja el gráfico en el canvas con su borde superior en y_top.
+    Devuelve el alto ocupado.
+    """
+    renderPDF.draw(drawing, c, x, y_top - drawing.height)
+    return drawing.height
@@ -0,0 +1,502 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import threading
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet opcional: sin pyarrow se ingesta solo CSV
+    pq = None
+
+
+# ---- Historia de precios local ----
+# data/prices/
+#   meta.json   activos (orden de columnas), cantidad de fechas, versión y config
+#   dates.i8    fechas (días desde 1970, int64)
+#   prices.f8   precios float64, fechas x activos en orden de fila (memory-map)
+#   state.npz   estado EWMA + últimas métricas: un append diario no relee la historia
+#
+# Agregar un día es escribir una fila al final de prices.f8. meta.json se reemplaza
+# último y su n_dates es la verdad: bytes de un append interrumpido se ignoran al
+# leer y se recortan en el próximo append.
+
+DEFAULT_PRICE_DIR = os.path.join("data", "prices")
+
+DEFAULT_VOL_CONFIG = {
+    "ewma_lambda": 0.94,  # RiskMetrics diario
+    "window": 63,  # ~3 meses hábiles para la vol móvil
+    "periods_per_year": 252,
+    "min_obs": 20,  # retornos mínimos para publicar una vol
+    "source": "ewma",  # "ewma" o "rolling": cuál reemplaza a VolatilidadFinal
+}
+
+META_FILE = "meta.json"
+DATES_FILE = "dates.i8"
+PRICES_FILE = "prices.f8"
+STATE_FILE = "state.npz"
+
+_DATE_KEYS = {"fecha", "date"}
+_ASSET_KEYS = {"activo", "asset", "ticker"}
+_PRICE_KEYS = {"precio", "price", "close", "cierre"}
+
+
+# ---- lectura de archivos ----
+
+def _parse_date(value: Any) -> np.datetime64:
+    s = str(value).strip()
+    if "/" in s:  # dd/mm/aaaa
+        d, m, y = s.split("/")[:3]
+        s = f"{int(y):04d}-{int(m):02d}-{int(d):02d}"
+    return np.datetime64(s[:10], "D")
+
+
+def _to_price(v: Any) -> float:
+    try:
+        x = float(str(v).strip()) if v is not None else np.nan
+    except ValueError:
+        return np.nan
+    return x if x > 0 else np.nan
+
+
+def _long_to_wide(dates: List[Any], names: List[str], prices: List[float]) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    d = np.array([_parse_date(x) for x in dates], dtype="datetime64[D]")
+    udates, di = np.unique(d, return_inverse=True)
+    assets = list(dict.fromkeys(names))
+    index = {a: i for i, a in enumerate(assets)}
+    values = np.full((len(udates), len(assets)), np.nan)
+    # fechas repetidas para un activo: gana la última fila
+    values[di, [index[n] for n in names]] = prices
+    return udates, assets, values
+
+
+def _sorted_wide(dates: List[Any], assets: List[str], values: np.ndarray) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    d = np.array([_parse_date(x) for x in dates], dtype="datetime64[D]")
+    udates, di = np.unique(d, return_inverse=True)
+    out = np.full((len(udates), len(assets)), np.nan)
+    out[di] = values
+    return udates, assets, out
+
+
+def _from_rows(header: List[str], rows: List[List[Any]], source: str) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    keys = [str(h).strip().lower() for h in header]
+    if len(keys) < 2 or keys[0] not in _DATE_KEYS:
+        raise ValueError(f"La primera columna de {source} debe ser la fecha (Fecha/Date)")
+    if len(keys) == 3 and keys[1] in _ASSET_KEYS and keys[2] in _PRICE_KEYS:
+        # formato largo: Fecha, Activo, Precio
+        return _long_to_wide([r[0] for r in rows], [str(r[1]).strip() for r in rows], [_to_price(r[2]) for r in rows])
+    # formato ancho: Fecha, <activo 1>, <activo 2>, ...
+    assets = [str(h).strip() for h in header[1:]]
+    values = np.array([[_to_price(v) for v in (list(r[1:]) + [None] * len(assets))[:len(assets)]] for r in rows],
+                      dtype=float).reshape(len(rows), len(assets))
+    return _sorted_wide([r[0] for r in rows], assets, values)
+
+
+def read_price_file(path: str) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    Lee precios de un CSV o Parquet, en formato ancho (Fecha + una columna por
+    activo) o largo (Fecha, Activo, Precio). Devuelve (fechas ordenadas, activos,
+    precios fechas x activos); precios vacíos o <= 0 -> NaN.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No existe: {path}")
+    if path.lower().endswith(".parquet"):
+        if pq is None:
+            raise ValueError("Leer Parquet requiere pyarrow (pip install pyarrow)")
+        table = pq.read_table(path)
+        header = table.column_names
+        cols = [table.column(c).to_pylist() for c in header]
+        return _from_rows(header, [list(r) for r in zip(*cols)], path)
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = [r for r in csv.reader(f) if r and any(c.strip() for c in r)]
+    if len(rows) < 2:
+        raise ValueError(f"Archivo de precios vacío: {path}")
+    return _from_rows(rows[0], rows[1:], path)
+
+
+# ---- cálculos vectorizados (fechas x activos) ----
+
+def _ffill(prices: np.ndarray) -> np.ndarray:
+    # último precio válido hasta cada fecha (NaN si todavía no hubo)
+    valid = ~np.isnan(prices)
+    idx = np.where(valid, np.arange(prices.shape[0])[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    out = prices[idx, np.arange(prices.shape[1])]
+    out[~np.maximum.accumulate(valid, axis=0)] = np.nan
+    return out
+
+
+def _last_valid(prices: np.ndarray) -> np.ndarray:
+    # último precio válido de cada activo en todo el bloque (NaN si no hubo ninguno)
+    valid = ~np.isnan(prices)
+    if not len(prices):
+        return np.full(prices.shape[1], np.nan)
+    last = len(prices) - 1 - np.argmax(valid[::-1], axis=0)
+    return np.where(valid.any(axis=0), prices[last, np.arange(prices.shape[1])], np.nan)
+
+
+def log_returns(prices: np.ndarray, prev: np.ndarray | None = None) -> np.ndarray:
+    """
+    Retornos logarítmicos contra el último precio válido anterior: un hueco no
+    genera retorno ese día y el siguiente precio cubre el período completo.
+    `prev` = último precio de cada activo antes del bloque (para appends).
+    """
+    prices = np.asarray(prices, dtype=float)
+    first = np.full((1, prices.shape[1]), np.nan) if prev is None else np.asarray(prev, dtype=float)[None, :]
+    before = _ffill(np.vstack([first, prices[:-1]]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.log(prices / before)
+
+
+def rolling_vol(rets: np.ndarray, window: int, periods_per_year: int = 252, min_obs: int = 2) -> np.ndarray:
+    """
+    Vol móvil anualizada (%) de cada activo en cada fecha, con sumas acumuladas:
+    una pasada para toda la historia y todo el universo. Ignora NaN.
+    """
+    ok = ~np.isnan(rets)
+    x = np.where(ok, rets, 0.0)
+
+    def windowed(a: np.ndarray) -> np.ndarray:
+        c = np.cumsum(np.vstack([np.zeros((1, a.shape[1])), a]), axis=0)
+        return c[1:] - c[np.maximum(np.arange(1, len(a) + 1) - window, 0)]
+
+    n = windowed(ok.astype(float))
+    s = windowed(x)
+    ss = windowed(x * x)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = (ss - s * s / n) / (n - 1)
+    vol = np.sqrt(np.maximum(var, 0.0) * periods_per_year) * 100
+    vol[n < max(min_obs, 2)] = np.nan
+    return vol
+
+
+def ewma_moments(rets: np.ndarray, lam: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Segundos momentos EWMA (media cero, RiskMetrics) al final del bloque, en forma
+    cerrada: sum_t lam^(T-1-t) (1-lam) r_t r_t'. Devuelve (sumas, pesos) por par de
+    activos; covarianza = sumas / pesos. Un producto matricial por bloque.
+    """
+    ok = ~np.isnan(rets)
+    x = np.where(ok, rets, 0.0)
+    m = ok.astype(float)
+    w = (1 - lam) * lam ** np.arange(len(rets) - 1, -1, -1, dtype=float)
+    return (x * w[:, None]).T @ x, (m * w[:, None]).T @ m
+
+
+def _summary(cov_sum: np.ndarray, cov_w: np.ndarray, n_obs: np.ndarray, tail_rets: np.ndarray,
+             config: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    ppy = config["periods_per_year"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = np.where(cov_w > 0, cov_sum / cov_w, np.nan)
+        var = np.diag(cov).copy()
+        corr = cov / np.sqrt(np.outer(var, var))
+    ok = n_obs >= config["min_obs"]
+    vol_ewma = np.where(ok, np.sqrt(var * ppy) * 100, np.nan)
+    corr = np.clip(np.nan_to_num(corr, nan=0.0), -1.0, 1.0)
+    np.fill_diagonal(corr, 1.0)
+    roll = rolling_vol(tail_rets, config["window"], ppy, config["min_obs"])
+    return {
+        "vol_ewma": vol_ewma,
+        "vol_rolling": roll[-1] if len(roll) else np.full(len(var), np.nan),
+        "last_return": tail_rets[-1] if len(tail_rets) else np.full(len(var), np.nan),
+        "corr": corr,
+        "n_obs": n_obs,
+    }
+
+
+# ---- store ----
+
+class PriceStore:
+    """
+    Historia de precios local por activo. ingest() incorpora CSV/Parquet: si solo
+    trae fechas nuevas de activos conocidos se agregan al final (append), si no se
+    reescribe el store. Las métricas (vol EWMA, vol móvil, último retorno,
+    correlación EWMA) se actualizan en cada escritura y quedan en state.npz.
+    """
+
+    def __init__(self, root: str = DEFAULT_PRICE_DIR, config: Dict[str, Any] | None = None):
+        self.root = root
+        self._config = config
+        self._lock = threading.Lock()
+        self._stats: Tuple[int, Dict[str, Any]] | None = None
+        self._risk: Tuple[int, Any] | None = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self._path(META_FILE))
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        if not self.exists:
+            return {"assets": [], "n_dates": 0, "version": 0, "config": {**DEFAULT_VOL_CONFIG, **(self._config or {})}}
+        path = self._path(META_FILE)
+        st = os.stat(path)
+        return _read_meta(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self.meta["config"]
+
+    @property
+    def assets(self) -> List[str]:
+        return self.meta["assets"]
+
+    @property
+    def version(self) -> int:
+        return self.meta["version"]
+
+    def dates(self) -> np.ndarray:
+        n = self.meta["n_dates"]
+        if n == 0:
+            return np.array([], dtype="datetime64[D]")
+        return np.memmap(self._path(DATES_FILE), dtype=np.int64, mode="r", shape=(n,)).view("datetime64[D]")
+
+    def prices(self) -> np.ndarray:
+        """
+        Matriz de precios (fechas x activos) mapeada en memoria, de solo lectura.
+        """
+        meta = self.meta
+        if meta["n_dates"] == 0:
+            return np.empty((0, len(meta["assets"])))
+        return np.memmap(self._path(PRICES_FILE), dtype=np.float64, mode="r",
+                         shape=(meta["n_dates"], len(meta["assets"])))
+
+    def series(self, asset: str) -> Tuple[np.ndarray, np.ndarray]:
+        # (fechas, precios) de un activo; el acceso por columna no copia la matriz entera
+        j = self.assets.index(asset)
+        return self.dates(), np.asarray(self.prices()[:, j])
+
+    def returns(self, names: Sequence[Any], lookback: int | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Retornos logarítmicos diarios de los últimos `lookback` días (fechas x
+        activos de `names`, en su orden) y máscara de activos cubiertos. Solo se
+        leen las filas y columnas pedidas del memory-map; sin cobertura -> NaN.
+        """
+        index = {a: i for i, a in enumerate(self.assets)}
+        idx = np.array([index.get(str(n).strip(), -1) for n in names], dtype=np.int64)
+        covered = idx >= 0
+        prices = self.prices()
+        start = 0 if lookback is None else max(len(prices) - lookback - 1, 0)
+        out = np.full((max(len(prices) - start - 1, 0), len(idx)), np.nan)
+        if covered.any() and len(out):
+            out[:, covered] = log_returns(prices[start:, idx[covered]])[1:]
+        return out, covered
+
+    # ---- escritura ----
+
+    def ingest(self, path: str) -> Dict[str, Any]:
+        """
+        Incorpora un CSV/Parquet de precios. Devuelve {"mode", "dates", "assets"}.
+        """
+        return self.ingest_arrays(*read_price_file(path))
+
+    def ingest_arrays(self, dates: np.ndarray, assets: Sequence[str], values: np.ndarray) -> Dict[str, Any]:
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        values = np.asarray(values, dtype=float)
+        assets = [str(a).strip() for a in assets]
+        with self._lock:
+            meta = self.meta
+            known = {a: i for i, a in enumerate(meta["assets"])}
+            old_dates = self.dates()
+            if meta["n_dates"] and all(a in known for a in assets) and dates.min() > old_dates[-1]:
+                block = np.full((len(dates), len(known)), np.nan)
+                block[:, [known[a] for a in assets]] = values
+                self._append(meta, dates, block)
+                mode = "append"
+            else:
+                self._merge(meta, dates, assets, values)
+                mode = "rebuild"
+        return {"mode": mode, "dates": int(len(dates)), "assets": len(assets)}
+
+    def append(self, date: Any, prices: Dict[str, float]) -> Dict[str, Any]:
+        """
+        Cierre diario: {activo: precio}. Activos nuevos o fechas no posteriores a la
+        última fuerzan una reescritura (raro); el caso normal solo agrega una fila.
+        """
+        assets = list(prices)
+        return self.ingest_arrays(np.array([_parse_date(date)]), assets,
+                                  np.array([[_to_price(prices[a]) for a in assets]]))
+
+    def _write_atomic(self, name: str, write) -> None:
+        path = self._path(name)
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        write(tmp)
+        os.replace(tmp, path)
+
+    def _write_meta(self, meta: Dict[str, Any]) -> None:
+        def write(tmp: str) -> None:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+        self._write_atomic(META_FILE, write)
+        _read_meta.cache_clear()
+
+    def _write_state(self, state: Dict[str, np.ndarray]) -> None:
+        def write(tmp: str) -> None:
+            with open(tmp, "wb") as f:
+                np.savez(f, **state)
+        self._write_atomic(STATE_FILE, write)
+
+    def _merge(self, meta: Dict[str, Any], dates: np.ndarray, assets: List[str], values: np.ndarray) -> None:
+        old_assets = meta["assets"]
+        all_assets = old_assets + [a for a in dict.fromkeys(assets) if a not in set(old_assets)]
+        all_dates = np.union1d(self.dates(), dates)
+        col = {a: i for i, a in enumerate(all_assets)}
+        matrix = np.full((len(all_dates), len(all_assets)), np.nan)
+        if meta["n_dates"]:
+            matrix[np.ix_(np.searchsorted(all_dates, self.dates()), np.arange(len(old_assets)))] = self.prices()
+        # lo nuevo pisa lo existente salvo donde viene vacío
+        rows, cols = np.searchsorted(all_dates, dates), np.array([col[a] for a in assets])
+        current = matrix[np.ix_(rows, cols)]
+        matrix[np.ix_(rows, cols)] = np.where(np.isnan(values), current, values)
+
+        os.makedirs(self.root, exist_ok=True)
+        self._write_atomic(PRICES_FILE, lambda tmp: matrix.tofile(tmp))
+        self._write_atomic(DATES_FILE, lambda tmp: all_dates.astype(np.int64).tofile(tmp))
+
+        config = meta["config"]
+        rets = log_returns(matrix)
+        cov_sum, cov_w = ewma_moments(rets, config["ewma_lambda"])
+        n_obs = (~np.isnan(rets)).sum(axis=0)
+        last = _ffill(matrix)[-1]
+        self._write_state(self._state(cov_sum, cov_w, n_obs, last, rets[-config["window"]:], config))
+        self._write_meta({**meta, "assets": all_assets, "n_dates": int(len(all_dates)), "version": meta["version"] + 1})
+
+    def _append(self, meta: Dict[str, Any], dates: np.ndarray, block: np.ndarray) -> None:
+        n, k = meta["n_dates"], len(meta["assets"])
+        config = meta["config"]
+        state = self._read_state()
+        # retornos del bloque contra el último precio conocido: no se relee la historia
+        rets = log_returns(block, prev=state["last_price"])
+        new_sum, new_w = ewma_moments(rets, config["ewma_lambda"])
+        decay = config["ewma_lambda"] ** len(block)
+        cov_sum = decay * state["cov_sum"] + new_sum
+        cov_w = decay * state["cov_w"] + new_w
+        n_obs = state["n_obs"] + (~np.isnan(rets)).sum(axis=0)
+        last = np.where(np.isnan(_ffill(block)[-1]), state["last_price"], _ffill(block)[-1])
+
+        # vol móvil: solo la cola de la historia (window filas) + el bloque
+        window = config["window"]
+        prices = self.prices()
+        start = max(n - window, 0)
+        tail = np.vstack([np.asarray(prices[start:]), block])
+        # el primer retorno de la cola (o el primero tras un hueco) va contra el último
+        # precio anterior a la cola, igual que al reconstruir la historia completa
+        prev = _last_valid(prices[:start]) if start else None
+        tail_rets = log_returns(tail, prev=prev)[-window:]
+
+        for name, data in ((PRICES_FILE, block.astype(np.float64)), (DATES_FILE, dates.astype(np.int64))):
+            path = self._path(name)
+            with open(path, "r+b") as f:
+                f.truncate(n * (k if name == PRICES_FILE else 1) * 8)  # restos de un append cortado
+                f.seek(0, os.SEEK_END)
+                f.write(data.tobytes())
+        self._write_state(self._state(cov_sum, cov_w, n_obs, last, tail_rets, config))
+        self._write_meta({**meta, "n_dates": n + len(block), "version": meta["version"] + 1})
+
+    def _state(self, cov_sum, cov_w, n_obs, last, tail_rets, config) -> Dict[str, np.ndarray]:
+        return {"cov_sum": cov_sum, "cov_w": cov_w, "n_obs": n_obs, "last_price": last,
+                **_summary(cov_sum, cov_w, n_obs, tail_rets, config)}
+
+    def _read_state(self) -> Dict[str, np.ndarray]:
+        with np.load(self._path(STATE_FILE), allow_pickle=False) as z:
+            return {k: z[k] for k in z.files}
+
+    # ---- lectura de métricas ----
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Últimas métricas por activo (arrays en el orden de `assets`): vol_ewma,
+        vol_rolling (en % anual), last_return, corr (EWMA), n_obs. Se leen de
+        state.npz una vez por versión del store.
+        """
+        version = self.version
+        cached = self._stats
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        state = self._read_state() if self.exists else {}
+        dates = self.dates()
+        stats = {"assets": self.assets, "version": version, "as_of": str(dates[-1]) if len(dates) else None,
+                 **{k: state[k] for k in ("vol_ewma", "vol_rolling", "last_return", "corr", "n_obs") if k in state}}
+        self._stats = (version, stats)
+        return stats
+
+    def volatility(self, names: Sequence[Any], source: str | None = None) -> np.ndarray:
+        """
+        Vol (% anual) de cada activo de `names` según el store; NaN si no está o
+        tiene menos de min_obs retornos.
+        """
+        stats = self.stats()
+        vols = stats.get(f"vol_{source or self.config['source']}")
+        index = {a: i for i, a in enumerate(stats["assets"])}
+        idx = np.array([index.get(str(n).strip(), -1) for n in names], dtype=np.int64)
+        if vols is None:
+            return np.full(len(idx), np.nan)
+        return np.where(idx >= 0, vols[np.maximum(idx, 0)], np.nan) if len(vols) else np.full(len(idx), np.nan)
+
+    def risk_model(self):
+        """
+        Modelo de riesgo (risk_covariance.RiskModel) con la correlación EWMA del store.
+        """
+        if __package__:
+            from .risk_covariance import RiskModel
+        else:
+            from risk_covariance import RiskModel
+
+        stats = self.stats()
+        cached = self._risk
+        if cached is None or cached[0] != stats["version"]:
+            # uno por versión: conserva el cache de submatrices entre diagnósticos
+            cached = (stats["version"], RiskModel(stats["assets"], stats["corr"], kind="corr",
+                                                  source=f"{self.root}@v{stats['version']}"))
+            self._risk = cached
+        return cached[1]
+
+    def enrich_holdings(self, activos: List[dict]) -> int:
+        """
+        Reemplaza VolatilidadFinal por la vol del store en los activos cubiertos
+        (el valor del Excel queda en VolatilidadExcel). Devuelve cuántos se actualizaron.
+        """
+        vols = self.volatility([a.get("Activo") for a in activos])
+        n = 0
+        for a, v in zip(activos, vols.tolist()):
+            if v == v:
+                a["VolatilidadExcel"] = a.get("VolatilidadFinal")
+                a["VolatilidadFinal"] = v
+                a["FuenteVolatilidad"] = "precios"
+                n += 1
+            else:
+                a["FuenteVolatilidad"] = "excel"
+        return n
+
+
+@lru_cache(maxsize=8)
+def _read_meta(path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["config"] = {**DEFAULT_VOL_CONFIG, **meta.get("config", {})}
+    return meta
+
+
+@lru_cache(maxsize=None)
+def _store_for(root: str) -> PriceStore:
+    return PriceStore(root)
+
+
+def default_price_store() -> PriceStore | None:
+    # el store es opcional: sin data/prices se usa la vol del Excel
+    store = _store_for(os.path.abspath(DEFAULT_PRICE_DIR))
+    return store if store.exists else None
+
+
+def price_store_version() -> int:
+    store = default_price_store()
+    return store.version if store is not None else 0
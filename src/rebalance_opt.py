@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+# Rebalanceo de mínima rotación: el vector de pesos más cercano (en L2) al actual
+# que cumple a la vez todos los umbrales. Cada umbral es un conjunto convexo con
+# proyección exacta barata; la proyección sobre la intersección se obtiene con el
+# algoritmo de Dykstra (proyecciones alternadas con corrección), que converge al
+# óptimo y no solo a un punto factible.
+#
+# Todo opera por filas sobre matrices (carteras x activos), así una corrida de
+# todo el libro es un solo loop de numpy. Las carteras más cortas se rellenan con
+# activos de tope 0, que el símplex fija en 0 y no cambian la solución.
+
+DEFAULT_SOLVER_CONFIG = {
+    "max_iter": 1000,
+    "tol": 1e-9,  # cambio máximo de un peso entre chequeos para dar por convergida la fila
+    # los límites se ajustan un poco hacia adentro (relativo): el residuo de Dykstra queda
+    # dentro de ese margen y la propuesta se evalúa contra los umbrales reales sin tolerancia
+    "margin": 1e-6,
+    "check_every": 10,
+    "max_iter_infeasible": 200,  # presupuesto para filas que no pueden cumplir los umbrales
+    "top_k": 3,
+}
+
+CONSTRAINTS = ("top1", "top3", "hhi", "country", "vol")
+
+
+# ---- proyecciones (por fila) ----
+
+def project_capped_simplex(x: np.ndarray, upper: np.ndarray, total: np.ndarray) -> np.ndarray:
+    """
+    Proyección sobre {0 <= w <= upper, sum(w) = total}: w = clip(x - tau, 0, upper).
+    tau sale de recorrer los 2n quiebres ordenados de sum(clip(x - tau)) (water-filling,
+    O(n log n)). Si sum(upper) < total no hay solución y se devuelve upper
+    (build_problem sube el tope para que no pase).
+    """
+    m, n = x.shape
+    bp = np.concatenate([x - upper, x], axis=1)
+    order = np.argsort(bp, axis=1)
+    bp = np.take_along_axis(bp, order, axis=1)
+    # al pasar x-upper el activo deja de estar topeado (pendiente -1); al pasar x llega a 0
+    active = np.cumsum(np.where(order < n, 1, -1), axis=1)
+
+    cap_total = upper.sum(axis=1)
+    # g(bp_j) = suma de clip(x - bp_j): empieza en sum(upper) y baja hasta 0
+    drop = active[:, :-1] * np.diff(bp, axis=1)
+    g = cap_total[:, None] - np.concatenate([np.zeros((m, 1)), np.cumsum(drop, axis=1)], axis=1)
+
+    j = np.argmax(g <= total[:, None], axis=1)  # primer quiebre con g <= total (j >= 1 si total < sum(upper))
+    j = np.maximum(j, 1)
+    rows = np.arange(m)
+    cnt = active[rows, j - 1]
+    g_prev = g[rows, j - 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tau = bp[rows, j - 1] + np.where(cnt > 0, (g_prev - total) / cnt, 0.0)
+    tau = np.where(cap_total <= total, -np.inf, tau)
+    return np.clip(x - tau[:, None], 0.0, upper)
+
+
+def project_topk_sum(x: np.ndarray, k: int, limit: np.ndarray, eps: float = 1e-12) -> np.ndarray:
+    """
+    Proyección sobre {suma de los k mayores <= limit}.
+
+    Con x ordenado desc, la solución resta lambda a los primeros a activos, lleva los
+    activos a..b-1 a un mismo nivel theta (empate en el k-ésimo lugar) y deja el resto.
+    Para cada a < k, (theta, lambda) salen cerrados de las sumas prefijo y se prueban
+    todos los b de una vez: O(n log n + k n) por fila.
+    """
+    m, n = x.shape
+    k = min(k, n)
+    order = np.argsort(-x, axis=1, kind="stable")
+    xs = np.take_along_axis(x, order, axis=1)
+    pref = np.concatenate([np.zeros((m, 1)), np.cumsum(xs, axis=1)], axis=1)
+    viol = pref[:, k] > limit
+    if not viol.any():
+        return x
+
+    rows = np.flatnonzero(viol)
+    xs_v, pref_v, lim = xs[rows], pref[rows], limit[rows]
+    r = rows.size
+    xs_ext = np.concatenate([xs_v, np.full((r, 1), -np.inf)], axis=1)  # xs[n] = -inf
+
+    # caso sin empate: los k mayores bajan lo mismo y siguen por encima del k+1
+    lam = (pref_v[:, k] - lim) / k
+    found = xs_ext[:, k - 1] - lam >= xs_ext[:, k] - eps
+    A = np.full(r, k)
+    B = np.full(r, k)
+    LAM = lam.copy()
+    TH = np.zeros(r)
+
+    # con empate: todos los (a, b) de una vez, a < k <= b - 1
+    b = np.arange(k + 1, n + 1)
+    todo = ~found
+    if b.size and todo.any():
+        a = np.arange(k)[:, None]
+        rest = np.flatnonzero(todo)
+        xs_t, pref_t, lim_t, ext_t = xs_v[rest], pref_v[rest], lim[rest], xs_ext[rest]
+        T = pref_t[:, None, b] - pref_t[:, :k, None]
+        th = ((k - a) * (lim_t[:, None, None] - pref_t[:, :k, None]) + a * T) / (a * (b - a) + (k - a) ** 2)
+        lm = (T - (b - a) * th) / (k - a)
+        above = np.concatenate([np.full((rest.size, 1), np.inf), xs_t[:, :k - 1]], axis=1)[:, :, None]
+        ok = ((lm > 0) & (xs_t[:, :k, None] - lm <= th + eps) & (above - lm >= th - eps)
+              & (th <= xs_t[:, None, b - 1] + eps) & (ext_t[:, None, b] <= th + eps))
+        ok = ok.reshape(rest.size, -1)
+        hit = ok.any(axis=1)
+        pick = np.argmax(ok[hit], axis=1)
+        sel = rest[hit]
+        A[sel] = pick // b.size
+        B[sel] = b[pick % b.size]
+        LAM[sel] = lm.reshape(rest.size, -1)[hit, pick]
+        TH[sel] = th.reshape(rest.size, -1)[hit, pick]
+
+    idx = np.arange(n)
+    new = np.where(idx < A[:, None], xs_v - LAM[:, None], np.where(idx < B[:, None], TH[:, None], xs_v))
+    out = x.copy()
+    sub = np.empty_like(new)
+    np.put_along_axis(sub, order[rows], new, axis=1)
+    out[rows] = sub
+    return out
+
+
+def project_group_caps(x: np.ndarray, codes: np.ndarray, n_groups: int, cap: np.ndarray) -> np.ndarray:
+    """
+    Proyección sobre {suma por grupo <= cap} (un semiespacio por país). Los grupos
+    son disjuntos, así que se proyecta cada uno por separado: se resta el exceso
+    repartido en partes iguales entre sus activos. Código -1 = sin grupo.
+    """
+    m, n = x.shape
+    if n_groups == 0:
+        return x
+    member = codes >= 0
+    flat = (np.arange(m)[:, None] * n_groups + np.where(member, codes, 0)).ravel()
+    mask = member.ravel()
+    sums = np.bincount(flat[mask], weights=x.ravel()[mask], minlength=m * n_groups)
+    sizes = np.bincount(flat[mask], minlength=m * n_groups)
+    excess = np.maximum(sums - np.repeat(cap, n_groups), 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.where(sizes > 0, excess / sizes, 0.0)
+    return x - np.where(member, shift[flat].reshape(m, n), 0.0)
+
+
+def project_l2_ball(x: np.ndarray, radius: np.ndarray) -> np.ndarray:
+    # HHI = sum(w^2) <= hhi_max es una bola de radio sqrt(hhi_max)
+    norm = np.sqrt(np.einsum("ij,ij->i", x, x))
+    scale = np.where(norm > radius, radius / np.where(norm > 0, norm, 1.0), 1.0)
+    return x * scale[:, None]
+
+
+def project_halfspace(x: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # {a.w <= b}; b = inf deja la fila igual (perfil sin límite de vol)
+    aa = np.einsum("ij,ij->i", a, a)
+    excess = np.einsum("ij,ij->i", a, x) - b
+    step = np.where((excess > 0) & (aa > 0), excess / np.where(aa > 0, aa, 1.0), 0.0)
+    return x - step[:, None] * a
+
+
+# ---- problema y solver ----
+
+def build_problem(portfolios: Sequence[Any], thresholds: dict, perfiles: Sequence[str | None] | None = None,
+                  top_k: int = 3, margin: float = 0.0) -> Dict[str, Any]:
+    """
+    Arma las matrices del problema para un lote de Portfolio (engine_v1).
+    Los activos con peso NaN quedan fuera (tope 0) y el total a repartir es la
+    suma de los pesos válidos de cada cartera.
+    """
+    m = len(portfolios)
+    perfiles = list(perfiles) if perfiles is not None else [None] * m
+    if len(perfiles) != m:
+        raise ValueError("perfiles debe tener un elemento por cartera")
+    n = max((len(p) for p in portfolios), default=0)
+    n_groups = max((len(p.groups["Pais"][1]) for p in portfolios), default=0)
+
+    w0 = np.zeros((m, n))
+    valid = np.zeros((m, n), dtype=bool)
+    vol = np.zeros((m, n))
+    codes = np.full((m, n), -1, dtype=np.int64)
+    vol_limit = np.full(m, np.inf)
+    limits = thresholds.get("vol_profile_limits", {})
+    for r, p in enumerate(portfolios):
+        k = len(p)
+        ok = ~np.isnan(p.peso)
+        valid[r, :k] = ok
+        w0[r, :k] = np.where(ok, p.peso, 0.0)
+        vol[r, :k] = np.where(ok, np.nan_to_num(p.vol, nan=0.0), 0.0)
+        codes[r, :k] = np.where(ok, p.groups["Pais"][0], -1)
+        if perfiles[r] in limits:
+            vol_limit[r] = float(limits[perfiles[r]]) * (1 - margin)
+
+    def _limit(key: str) -> np.ndarray:
+        return np.full(m, float(thresholds[key]) * (1 - margin))
+
+    total = w0.sum(axis=1)
+    # si el tope no alcanza para repartir el total (pocos activos) se sube lo justo:
+    # la propuesta sigue sumando el total y la fila queda marcada no factible
+    upper = np.maximum(_limit("top1_max"), total / np.maximum(valid.sum(axis=1), 1))
+    return {
+        "w0": w0,
+        "valid": valid,
+        "total": total,
+        "margin": margin,
+        "top1_max": _limit("top1_max"),
+        "upper": np.where(valid, upper[:, None], 0.0),
+        "top_k": top_k,
+        "topk_limit": _limit("top3_max"),
+        "hhi_radius": np.sqrt(_limit("hhi_max")),
+        "codes": codes,
+        "n_groups": n_groups,
+        "country_cap": _limit("country_max"),
+        "vol": vol,
+        "vol_limit": vol_limit,
+    }
+
+
+def _sets(pb: Dict[str, Any]) -> List[Tuple[Any, tuple]]:
+    """
+    (proyección, argumentos por fila) de cada restricción. El símplex va último:
+    la salida siempre suma el total y respeta el tope por activo.
+
+    La vol se proyecta con su normal centrada (v - media): sobre {sum(w) = total}
+    es la misma restricción, pero el semiespacio queda casi perpendicular al
+    símplex y Dykstra converge en decenas de iteraciones en vez de miles.
+    """
+    valid = pb["valid"]
+    n_valid = np.maximum(valid.sum(axis=1), 1)
+    mean_vol = (pb["vol"] * valid).sum(axis=1) / n_valid
+    vol_c = np.where(valid, pb["vol"] - mean_vol[:, None], 0.0)
+    return [
+        (project_topk_sum, (pb["top_k"], pb["topk_limit"])),
+        (project_group_caps, (pb["codes"], pb["n_groups"], pb["country_cap"])),
+        (project_l2_ball, (pb["hhi_radius"],)),
+        (project_halfspace, (vol_c, pb["vol_limit"] - mean_vol * pb["total"])),
+        (project_capped_simplex, (pb["upper"], pb["total"])),
+    ]
+
+
+def _take_rows(args: tuple, keep: np.ndarray) -> tuple:
+    return tuple(a[keep] if isinstance(a, np.ndarray) else a for a in args)
+
+
+def violations(pb: Dict[str, Any], w: np.ndarray, with_margin: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Exceso de cada restricción por fila (<= 0 si se cumple). Con with_margin=False
+    se mide contra los umbrales tal cual, sin el ajuste interno del solver.
+    """
+    m = w.shape[0]
+    scale = 1.0 if with_margin else 1.0 / (1 - pb["margin"])
+    k = min(pb["top_k"], w.shape[1])
+    top = -np.sort(-w, axis=1)[:, :k]
+    if pb["n_groups"]:
+        flat = (np.arange(m)[:, None] * pb["n_groups"] + np.maximum(pb["codes"], 0)).ravel()
+        mask = (pb["codes"] >= 0).ravel()
+        sums = np.bincount(flat[mask], weights=w.ravel()[mask], minlength=m * pb["n_groups"])
+        country = sums.reshape(m, pb["n_groups"]).max(axis=1) - pb["country_cap"] * scale
+    else:
+        country = np.full(m, -np.inf)
+    return {
+        "top1": (top[:, 0] if k else np.zeros(m)) - pb["top1_max"] * scale,
+        "top3": top.sum(axis=1) - pb["topk_limit"] * scale,
+        "hhi": np.einsum("ij,ij->i", w, w) - pb["hhi_radius"] ** 2 * scale,
+        "country": country,
+        "vol": np.einsum("ij,ij->i", pb["vol"], w) - pb["vol_limit"] * scale,
+    }
+
+
+def infeasible_rows(pb: Dict[str, Any]) -> np.ndarray:
+    """
+    Chequeo barato de condiciones necesarias, restricción por restricción
+    (ej. 3 activos con tope 25% no suman 100%). Una fila marcada no tiene
+    solución; una fila no marcada igual puede ser incompatible por combinación.
+    """
+    valid = pb["valid"]
+    total = pb["total"]
+    n_valid = valid.sum(axis=1)
+    cap = pb["top1_max"]
+    slack = 1e-12
+    out = cap * n_valid < total - slack
+    with np.errstate(divide="ignore", invalid="ignore"):
+        uniform = np.where(n_valid > 0, total / n_valid, 0.0)
+    # el reparto uniforme minimiza Top-k y HHI
+    out |= np.minimum(pb["top_k"], n_valid) * uniform > pb["topk_limit"] + slack
+    out |= total * uniform > pb["hhi_radius"] ** 2 + slack
+    # países: cada grupo aporta a lo sumo min(tope país, tope activo * tamaño)
+    if pb["n_groups"]:
+        m = valid.shape[0]
+        flat = (np.arange(m)[:, None] * pb["n_groups"] + np.maximum(pb["codes"], 0)).ravel()
+        mask = (pb["codes"] >= 0).ravel()
+        sizes = np.bincount(flat[mask], minlength=m * pb["n_groups"]).reshape(m, pb["n_groups"])
+        room = np.minimum(pb["country_cap"][:, None], cap[:, None] * sizes).sum(axis=1)
+        room += cap * (valid & (pb["codes"] < 0)).sum(axis=1)
+        out |= room < total - slack
+    # vol mínima: llenar hasta el tope los activos de menor vol
+    v = np.where(valid, pb["vol"], np.inf)
+    v_sorted = np.sort(v, axis=1)
+    fill = np.clip(total[:, None] - cap[:, None] * np.arange(v.shape[1]), 0.0, cap[:, None])
+    min_vol = (np.where(fill > 0, v_sorted, 0.0) * fill).sum(axis=1)
+    out |= min_vol > pb["vol_limit"] + slack
+    return out
+
+
+def solve(pb: Dict[str, Any], config: dict | None = None) -> Dict[str, Any]:
+    """
+    Dykstra por lotes. Las filas que convergen salen del loop. La salida siempre
+    suma el total y respeta el tope por activo; "feasible" dice si además cumple
+    el resto de los umbrales.
+    """
+    cfg = {**DEFAULT_SOLVER_CONFIG, **(config or {})}
+    w0 = pb["w0"]
+    m = w0.shape[0]
+    out = w0.copy()
+    iterations = np.zeros(m, dtype=int)
+    converged = np.ones(m, dtype=bool)
+    if m == 0 or w0.shape[1] == 0:
+        return {"weights": out, "feasible": np.ones(m, dtype=bool), "converged": converged,
+                "iterations": iterations, "violations": violations(pb, out, with_margin=False)}
+
+    sets = _sets(pb)
+    hopeless = infeasible_rows(pb)
+    budget = np.where(hopeless, cfg["max_iter_infeasible"], cfg["max_iter"])
+    rows = np.arange(m)
+    x = w0.copy()
+    incr = [np.zeros_like(x) for _ in sets]
+    last = x.copy()
+    it = 0
+    while rows.size and it < cfg["max_iter"]:
+        it += 1
+        for j, (proj, args) in enumerate(sets):
+            y = x + incr[j]
+            x = proj(y, *args)
+            incr[j] = y - x
+        if it % cfg["check_every"] and it < cfg["max_iter"]:
+            continue
+        still = np.abs(x - last).max(axis=1) > cfg["tol"]
+        done = ~still | (budget[rows] <= it)
+        out[rows] = x
+        iterations[rows] = it
+        converged[rows] = ~still
+        if done.any():
+            keep = ~done
+            rows = rows[keep]
+            x = x[keep]
+            incr = [d[keep] for d in incr]
+            sets = [(proj, _take_rows(args, keep)) for proj, args in sets]
+        last = x.copy()
+
+    # factible = cumple los umbrales tal cual: las alertas usan ">", así que 0 de exceso alcanza
+    viol = violations(pb, out, with_margin=False)
+    feasible = ~hopeless
+    for name, v in viol.items():
+        feasible &= v <= 0
+    return {"weights": out, "feasible": feasible, "converged": converged, "iterations": iterations, "violations": viol}
+
+
+def _result(pb: Dict[str, Any], sol: Dict[str, Any], binding: np.ndarray, r: int, n: int) -> Dict[str, Any]:
+    w0 = pb["w0"][r, :n]
+    w = sol["weights"][r, :n]
+    valid = pb["valid"][r, :n]
+    return {
+        "weights": np.where(valid, w, np.nan),
+        "feasible": bool(sol["feasible"][r]),
+        "converged": bool(sol["converged"][r]),
+        "iterations": int(sol["iterations"][r]),
+        "turnover": float(np.abs(w - w0)[valid].sum() / 2),
+        "binding": [name for j, name in enumerate(CONSTRAINTS) if binding[r, j]],
+        "violations": {name: float(v[r]) for name, v in sol["violations"].items()},
+    }
+
+
+def solve_rebalancing_batch(portfolios: Sequence[Any], thresholds: dict,
+                            perfiles: Sequence[str | None] | None = None,
+                            config: dict | None = None) -> List[Dict[str, Any]]:
+    """
+    Rebalanceo de mínima rotación para un lote de carteras (ej. todo el libro).
+    Devuelve, por cartera:
+    - "weights": pesos propuestos (NaN donde el peso original era NaN)
+    - "feasible": la propuesta cumple todos los umbrales (False si son incompatibles
+      entre sí, o si no se llegó en max_iter: ver "converged")
+    - "turnover": rotación (suma de |cambios| / 2)
+    - "binding": restricciones que la cartera actual no cumple
+    - "violations": exceso de cada restricción en la propuesta (<= 0 si se cumple)
+    """
+    cfg = {**DEFAULT_SOLVER_CONFIG, **(config or {})}
+    pb = build_problem(portfolios, thresholds, perfiles, top_k=cfg["top_k"], margin=cfg["margin"])
+    # restricciones que la cartera actual no cumple (contra los umbrales reales)
+    before = violations(pb, pb["w0"], with_margin=False)
+    binding = np.stack([before[name] > 0 for name in CONSTRAINTS], axis=1)
+    sol = solve(pb, cfg)
+    return [_result(pb, sol, binding, r, len(p)) for r, p in enumerate(portfolios)]
+
+
+def solve_rebalancing(portfolio: Any, thresholds: dict, perfil_declarado: str | None = None,
+                      config: dict | None = None) -> Dict[str, Any]:
+    return solve_rebalancing_batch([portfolio], thresholds, [perfil_declarado], config)[0]
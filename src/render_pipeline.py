@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+if __package__:
+    from .narrative_v1 import build_client_messages
+    from .report_html import render_html_report
+    from .save_messages import write_messages
+else:
+    from narrative_v1 import build_client_messages
+    from report_html import render_html_report
+    from save_messages import write_messages
+
+
+ALL_FORMATS = ("json", "messages", "html", "pdf")
+
+
+def _pct(x: float) -> str:
+    return f"{x*100:.0f}%"
+
+
+def _fmt_vol(x: float) -> str:
+    return f"{x:.1f}%"
+
+
+def _to_float(x) -> float | None:
+    try:
+        v = float(x)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(v) else v
+
+
+def _sorted_exposure(d: Dict[str, float]) -> List[tuple]:
+    # (categoría, peso, peso formateado), de mayor a menor; empates en orden original
+    items = [(k, float(v)) for k, v in (d or {}).items()]
+    items.sort(key=lambda kv: -kv[1])
+    return [(k, v, _pct(v)) for k, v in items]
+
+
+def _risk_view(metrics: dict) -> Dict[str, Any] | None:
+    # solo si el análisis se corrió con modelo de riesgo (risk_covariance)
+    if "VolCovarianzaCartera" not in metrics:
+        return None
+    return {
+        "vol": _fmt_vol(metrics["VolCovarianzaCartera"]),
+        "vol_promedio": _fmt_vol(metrics.get("VolPromedioCartera", 0.0)),
+        "diversificacion": f"{metrics.get('RatioDiversificacion', 1.0):.2f}",
+        "cobertura": _pct(metrics.get("CoberturaModeloRiesgo", 0.0)),
+        "activos": [
+            {**r, "peso_fmt": _pct(r["Peso"]), "marginal_fmt": _fmt_vol(r["VolMarginal"]),
+             "contribucion_fmt": _pct(r["ContribucionPct"])}
+            for r in metrics.get("ContribucionRiesgoPorActivo", [])
+        ],
+        "Pais": _sorted_exposure(metrics.get("ContribucionRiesgoPorPais", {})),
+        "Tipo": _sorted_exposure(metrics.get("ContribucionRiesgoPorTipo", {})),
+    }
+
+
+def build_view(payload: dict, perfil_declarado: str | None = None) -> Dict[str, Any]:
+    """
+    Vista calculada una sola vez por diagnóstico y compartida por todos los
+    renderers (HTML, PDF, mensajes): métricas formateadas, exposiciones ordenadas
+    y activos normalizados ordenados por peso.
+    """
+    analysis = payload.get("analysis", {}) or {}
+    metrics = analysis.get("metrics", {}) or {}
+    perfil = perfil_declarado or analysis.get("perfil_declarado") or payload.get("perfil_declarado")
+
+    holdings = []
+    for a in payload.get("activos", []) or []:
+        holdings.append({
+            "nombre": str(a.get("Activo") or "Activo"),
+            "peso": _to_float(a.get("Peso")),
+            "valor": _to_float(a.get("Valor en USD")),
+            "moneda": str(a.get("Moneda") or ""),
+            "tipo": a.get("Tipo"),
+            "pais": a.get("Pais"),
+            "vol": _to_float(a.get("VolatilidadFinal")),
+        })
+    # por peso desc; los activos sin peso van al final
+    holdings.sort(key=lambda h: (h["peso"] is not None, h["peso"] or 0), reverse=True)
+
+    return {
+        "analysis": analysis,
+        "metrics": metrics,
+        "alerts": analysis.get("alerts", []) or [],
+        "recommendations": analysis.get("recommendations", []) or [],
+        "top_holdings": analysis.get("top_holdings", []) or [],
+        "scenarios": analysis.get("scenarios", []) or [],
+        "stress": analysis.get("stress_mc") or {},
+        "perfil": perfil,
+        "kpis": {
+            "vol": _fmt_vol(metrics.get("VolPromedioCartera", 0.0)),
+            "score": f"{metrics.get('ScorePromedioCartera', 0.0):.1f}",
+            "top3": _pct(metrics.get("ConcentracionTop3", 0.0)),
+            "top1": _pct(metrics.get("ConcentracionTop1", 0.0)),
+            "hhi": f"{metrics.get('IndiceHerfindahl', 0.0):.2f}",
+        },
+        "exposures": {
+            "Pais": _sorted_exposure(metrics.get("ExposicionPorPais", {})),
+            "Tipo": _sorted_exposure(metrics.get("ExposicionPorTipo", {})),
+            "Moneda": _sorted_exposure(metrics.get("ExposicionPorMoneda", {})),
+        },
+        "holdings": holdings,
+        "risk": _risk_view(metrics),
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
+    }
+
+
+def render_pdf(payload: dict, view: Dict[str, Any]) -> bytes:
+    # import diferido: reportlab solo se carga si se pide el PDF
+    if __package__:
+        from .report_pdf import build_portfolio_pdf_bytes
+    else:
+        from report_pdf import build_portfolio_pdf_bytes
+    return build_portfolio_pdf_bytes(payload, view["analysis"], view["perfil"], view["alerts"], view=view)
+
+
+def render_all(payload: dict, perfil_declarado: str | None = None,
+               formats: Iterable[str] = ALL_FORMATS, view: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """
+    Render en memoria de todos los artefactos de un diagnóstico, en una sola pasada
+    sobre el payload (sin escribir y releer analysis.json):
+    - "json": bytes de analysis.json
+    - "messages": dict de narrative_v1.build_client_messages
+    - "html": texto de report.html
+    - "pdf": bytes del PDF
+    """
+    formats = set(formats)
+    unknown = formats - set(ALL_FORMATS)
+    if unknown:
+        raise ValueError(f"Formatos desconocidos: {sorted(unknown)}")
+
+    view = view or build_view(payload, perfil_declarado)
+    out: Dict[str, Any] = {"view": view}
+    if "json" in formats:
+        out["json"] = json.dumps(payload, indent=2, ensure_ascii=False).encode("utf-8")
+    if "messages" in formats:
+        out["messages"] = build_client_messages(payload)
+    if "html" in formats:
+        out["html"] = render_html_report(payload, view)
+    if "pdf" in formats:
+        out["pdf"] = render_pdf(payload, view)
+    return out
+
+
+def output_dir_for_today(output_base: str = "output") -> str:
+    return os.path.join(output_base, datetime.now().strftime("%Y-%m-%d"))
+
+
+def write_outputs(rendered: Dict[str, Any], out_dir: str | None = None, output_base: str = "output") -> Dict[str, str]:
+    """
+    Sink a disco (opcional): escribe lo que haya en `rendered` en output/YYYY-MM-DD/
+    con los mismos nombres de siempre. Devuelve las rutas escritas.
+    """
+    out_dir = out_dir or output_dir_for_today(output_base)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {"out_dir": out_dir}
+
+    if "json" in rendered:
+        paths["json"] = os.path.join(out_dir, "analysis.json")
+        with open(paths["json"], "wb") as f:
+            f.write(rendered["json"])
+    if "messages" in rendered:
+        paths.update(write_messages(rendered["messages"], out_dir))
+    if "html" in rendered:
+        paths["html"] = os.path.join(out_dir, "report.html")
+        with open(paths["html"], "w", encoding="utf-8") as f:
+            f.write(rendered["html"])
+    if "pdf" in rendered:
+        paths["pdf"] = os.path.join(out_dir, "reporte.pdf")
+        with open(paths["pdf"], "wb") as f:
+            f.write(rendered["pdf"])
+    return paths
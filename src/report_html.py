@@ -1,6 +1,10 @@
 import os
 import json
-from datetime import datetime
+
+if __package__:
+    from .templating import Rows, Template, asset, load_template
+else:
+    from templating import Rows, Template, asset, load_template
 
 
 def _pct(x: float) -> str:
@@ -23,130 +27,140 @@ def generate_html_report(analysis_json_path: str) -> str:
     with open(analysis_json_path, "r", encoding="utf-8") as f:
         payload = json.load(f)
 
-    analysis = payload.get("analysis", {})
-    metrics = analysis.get("metrics", {})
-    alerts = analysis.get("alerts", [])
-    recs = analysis.get("recommendations", [])
-    top_holdings = analysis.get("top_holdings", [])
-    scenarios = analysis.get("scenarios", [])
-    perfil = analysis.get("perfil_declarado", "Moderada")
-
-    vol = metrics.get("VolPromedioCartera", 0.0)
-    score = metrics.get("ScorePromedioCartera", 0.0)
-    top1 = metrics.get("ConcentracionTop1", 0.0)
-    top3 = metrics.get("ConcentracionTop3", 0.0)
-    hhi = metrics.get("IndiceHerfindahl", 0.0)
-
-    exp_pais = metrics.get("ExposicionPorPais", {})
-    exp_tipo = metrics.get("ExposicionPorTipo", {})
-
-    def render_table_kv(title, d):
-        rows = "".join([f"<tr><td>{k}</td><td>{_pct(v)}</td></tr>" for k, v in list(d.items())[:10]])
-        return f"""
-        <div class="card">
-          <h3>{title}</h3>
-          <table>
-            <thead><tr><th>Categoria</th><th>Peso</th></tr></thead>
-            <tbody>{rows}</tbody>
-          </table>
-        </div>
-        """
-
-    alerts_html = "".join([f"<li>{a.get('msg')}</li>" for a in alerts]) or "<li>Sin alertas críticas.</li>"
-    recs_html = "".join([f"<li><b>{r.get('title')}</b>: {r.get('detail')}</li>" for r in recs]) or "<li>Sin recomendaciones automáticas.</li>"
-
-    top_html_rows = "".join([
-        f"<tr><td>{a.get('Activo')}</td><td>{a.get('Tipo')}</td><td>{a.get('Pais')}</td><td>{_pct(float(a.get('Peso',0)))}</td><td>{_fmt_vol(float(a.get('VolatilidadFinal',0)))}</td></tr>"
-        for a in top_holdings
-    ])
-
-    scenarios_rows = "".join([
-        f"<tr><td>{s.get('label')}</td><td>{_fmt_vol(s.get('metrics_after',{}).get('VolPromedioCartera',0))}</td>"
-        f"<td>{s.get('metrics_after',{}).get('ConcentracionTop3',0):.2f}</td><td>{s.get('metrics_after',{}).get('IndiceHerfindahl',0):.2f}</td></tr>"
-        for s in scenarios
-    ]) or "<tr><td colspan='4'>Sin escenarios.</td></tr>"
-
-    now = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-    html = f"""
-    <!doctype html>
-    <html>
-    <head>
-      <meta charset="utf-8" />
-      <title>Reporte de Cartera</title>
-      <style>
-        body {{ font-family: -apple-system, BlinkMacSystemFont, Segoe UI, Roboto, Arial; margin: 24px; color: #111; }}
-        .header {{ display:flex; justify-content:space-between; align-items:flex-end; border-bottom:1px solid #ddd; padding-bottom:12px; }}
-        .grid {{ display:grid; grid-template-columns: repeat(3, 1fr); gap: 12px; margin-top: 16px; }}
-        .card {{ border:1px solid #e5e5e5; border-radius:12px; padding:14px; }}
-        .kpi {{ font-size: 26px; font-weight: 700; }}
-        .label {{ color:#666; font-size: 12px; }}
-        h2 {{ margin-top: 26px; }}
-        table {{ width:100%; border-collapse: collapse; }}
-        th, td {{ border-bottom: 1px solid #eee; padding: 8px; text-align:left; font-size: 13px; }}
-        ul {{ margin: 8px 0 0 18px; }}
-      </style>
-    </head>
-    <body>
-      <div class="header">
-        <div>
-          <div class="label">Reporte de Cartera</div>
-          <h1 style="margin:6px 0 0 0;">Diagnóstico + Recomendaciones</h1>
-          <div class="label">Perfil considerado: <b>{perfil}</b></div>
-        </div>
-        <div class="label">Generado: {now}</div>
-      </div>
-
-      <div class="grid">
-        <div class="card"><div class="label">Volatilidad promedio</div><div class="kpi">{_fmt_vol(vol)}</div></div>
-        <div class="card"><div class="label">Score promedio</div><div class="kpi">{score:.1f}</div></div>
-        <div class="card"><div class="label">Concentración Top 3</div><div class="kpi">{_pct(top3)}</div></div>
-        <div class="card"><div class="label">Concentración Top 1</div><div class="kpi">{_pct(top1)}</div></div>
-        <div class="card"><div class="label">Índice Herfindahl</div><div class="kpi">{hhi:.2f}</div></div>
-      </div>
-
-      <h2>Alertas</h2>
-      <div class="card"><ul>{alerts_html}</ul></div>
-
-      <h2>Recomendaciones</h2>
-      <div class="card"><ul>{recs_html}</ul></div>
-
-      <h2>Exposición</h2>
-      <div class="grid">
-        {render_table_kv("Exposición por País", exp_pais)}
-        {render_table_kv("Exposición por Tipo", exp_tipo)}
-      </div>
-
-      <h2>Top holdings</h2>
-      <div class="card">
-        <table>
-          <thead><tr><th>Activo</th><th>Tipo</th><th>País</th><th>Peso</th><th>Vol</th></tr></thead>
-          <tbody>
-            {top_html_rows}
-          </tbody>
-        </table>
-      </div>
-
-      <h2>Escenarios (sensibilidad)</h2>
-      <div class="card">
-        <table>
-          <thead><tr><th>Escenario</th><th>Vol after</th><th>Top3 after</th><th>HHI after</th></tr></thead>
-          <tbody>
-            {scenarios_rows}
-          </tbody>
-        </table>
-      </div>
-
-      <div class="label" style="margin-top:22px;">
-        Nota: Diagnóstico automático basado en reglas. No constituye recomendación de inversión.
-      </div>
-    </body>
-    </html>
+    out_path = write_html_report(payload, os.path.join(out_dir, "report.html"))
+
+    print("✅ Reporte HTML generado:", out_path)
+    return out_path
+
+
+# plantillas compiladas una vez al importar el módulo
+_REPORT = load_template("report.html")
+_KV_TABLE = load_template("report_kv_table.html")
+_STRESS = load_template("report_stress.html")
+_RISK = load_template("report_risk.html")
+_KV_ROW = Template("<tr><td>{{ k }}</td><td>{{ v }}</td></tr>")
+_ALERT_ROW = Template("<li>{{ msg }}</li>")
+_REC_ROW = Template("<li><b>{{ title }}</b>: {{ detail }}</li>")
+_TOP_ROW = Template("<tr><td>{{ activo }}</td><td>{{ tipo }}</td><td>{{ pais }}</td><td>{{ peso }}</td><td>{{ vol }}</td></tr>")
+_SCENARIO_ROW = Template("<tr><td>{{ label }}</td><td>{{ vol }}</td><td>{{ top3 }}</td><td>{{ hhi }}</td></tr>")
+_RISK_ROW = Template("<tr><td>{{ Activo }}</td><td>{{ peso_fmt }}</td><td>{{ marginal_fmt }}</td><td>{{ contribucion_fmt }}</td></tr>")
+_STRESS_ROW = Template("<tr><td>{{ label }}</td>{{ percentiles }}<td>{{ tail }}</td><td>{{ breach }}</td></tr>")
+_TH = Template("<th>{{ v }}</th>")
+_TD = Template("<td>{{ v }}</td>")
+
+_STRESS_LABELS = {
+    "VolPromedioCartera": ("Volatilidad", _fmt_vol),
+    "ScorePromedioCartera": ("Score", lambda x: f"{x:.1f}"),
+    "ConcentracionTop3": ("Top 3", _pct),
+    "IndiceHerfindahl": ("HHI", lambda x: f"{x:.2f}"),
+}
+
+
+def _report_context(view: dict) -> dict:
+    kpis = view["kpis"]
+
+    def kv_table(title, items):
+        rows = Rows(_KV_ROW, items[:10], lambda it: {"k": it[0], "v": it[2]})
+        return _KV_TABLE.render(title=title, rows=rows)
+
+    def scenario_row(s):
+        after = s.get("metrics_after", {})
+        return {
+            "label": s.get("label"),
+            "vol": _fmt_vol(after.get("VolPromedioCartera", 0)),
+            "top3": f"{after.get('ConcentracionTop3', 0):.2f}",
+            "hhi": f"{after.get('IndiceHerfindahl', 0):.2f}",
+        }
+
+    stress = view["stress"]
+    breach = stress.get("breach_prob", {})
+    stress_metrics = stress.get("metrics", {})
+
+    stress_keys = [k for k in _STRESS_LABELS if k in stress_metrics]
+    # columnas = percentiles configurados en la corrida (claves "p5", "p50", ...)
+    pct_keys = list(stress_metrics[stress_keys[0]]["percentiles"]) if stress_keys else []
+
+    def stress_row(k):
+        label, fmt = _STRESS_LABELS[k]
+        m = stress_metrics[k]
+        return {
+            "label": label,
+            "percentiles": Rows(_TD, pct_keys, lambda q: {"v": fmt(m["percentiles"][q])}),
+            "tail": fmt(m["tail_mean_high"]),
+            "breach": _pct(breach[k]) if k in breach else "-",
+        }
+
+    stress_html = _STRESS.render(
+        n_draws=f"{stress.get('n_draws', 0):,}",
+        percentile_headers=Rows(_TH, pct_keys, lambda q: {"v": q.upper()}),
+        tail=_pct(stress.get("tail", 0.05)),
+        rows=Rows(_STRESS_ROW, stress_keys, stress_row),
+    ) if stress_keys else ""
+
+    risk = view.get("risk")
+    risk_html = _RISK.render(
+        vol=risk["vol"],
+        vol_promedio=risk["vol_promedio"],
+        diversificacion=risk["diversificacion"],
+        cobertura=risk["cobertura"],
+        rows=Rows(_RISK_ROW, risk["activos"][:10]),
+        contrib_pais=kv_table("Contribución al riesgo por País", risk["Pais"]),
+        contrib_tipo=kv_table("Contribución al riesgo por Tipo", risk["Tipo"]),
+    ) if risk else ""
+
+    return {
+        "css": asset("report.css"),
+        "perfil": view["perfil"] or "Moderada",
+        "now": view["generated_at"],
+        "vol": kpis["vol"],
+        "score": kpis["score"],
+        "top3": kpis["top3"],
+        "top1": kpis["top1"],
+        "hhi": kpis["hhi"],
+        "alerts": Rows(_ALERT_ROW, view["alerts"], lambda a: {"msg": a.get("msg")},
+                       empty="<li>Sin alertas críticas.</li>"),
+        "recs": Rows(_REC_ROW, view["recommendations"], lambda r: {"title": r.get("title"), "detail": r.get("detail")},
+                     empty="<li>Sin recomendaciones automáticas.</li>"),
+        "exp_pais": kv_table("Exposición por País", view["exposures"]["Pais"]),
+        "exp_tipo": kv_table("Exposición por Tipo", view["exposures"]["Tipo"]),
+        "risk": risk_html,
+        "top_rows": Rows(_TOP_ROW, view["top_holdings"], lambda a: {
+            "activo": a.get("Activo"),
+            "tipo": a.get("Tipo"),
+            "pais": a.get("Pais"),
+            "peso": _pct(float(a.get("Peso", 0))),
+            "vol": _fmt_vol(float(a.get("VolatilidadFinal", 0))),
+        }),
+        "scenario_rows": Rows(_SCENARIO_ROW, view["scenarios"], scenario_row,
+                              empty="<tr><td colspan='4'>Sin escenarios.</td></tr>"),
+        "stress": stress_html,
+    }
+
+
+def render_html_report(payload: dict, view: dict | None = None) -> str:
     """
+    HTML del reporte a partir del payload en memoria. `view` es la vista
+    compartida de render_pipeline.build_view (se arma si no se pasa).
+    """
+    if view is None:
+        if __package__:
+            from .render_pipeline import build_view
+        else:
+            from render_pipeline import build_view
+        view = build_view(payload)
+    return str(_REPORT.render(**_report_context(view)))
 
-    out_path = os.path.join(out_dir, "report.html")
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write(html)
 
-    print("✅ Reporte HTML generado:", out_path)
+def write_html_report(payload: dict, out_path: str, view: dict | None = None) -> str:
+    """
+    Igual que render_html_report pero escribe directo al archivo, de a bloques.
+    """
+    if view is None:
+        if __package__:
+            from .render_pipeline import build_view
+        else:
+            from render_pipeline import build_view
+        view = build_view(payload)
+    with open(out_path, "w", encoding="utf-8") as f:
+        _REPORT.stream(f, **_report_context(view))
     return out_path
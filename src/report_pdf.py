@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+import io
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Tuple
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+if __package__:
+    from .pdf_charts import MAX_BARS, bar_chart, chart_key, draw_chart, pie_chart
+else:
+    from pdf_charts import MAX_BARS, bar_chart, chart_key, draw_chart, pie_chart
+
+
+PAGE_W, PAGE_H = A4
+MARGIN = 50
+CONTENT_TOP = PAGE_H - 75  # debajo del encabezado
+CONTENT_BOTTOM = 60  # arriba del pie de página
+CONTENT_W = PAGE_W - 2 * MARGIN
+
+ROW_H = 13
+TABLE_FONT_SIZE = 8
+# (título, ancho, alineación)
+HOLDINGS_COLUMNS = [
+    ("#", 30, "r"),
+    ("Activo", 160, "l"),
+    ("Tipo", 65, "l"),
+    ("País", 55, "l"),
+    ("Moneda", 45, "l"),
+    ("Peso", 55, "r"),
+    ("Valor USD", 85, "r"),
+]
+
+# Un ítem del flujo es (tipo, alto, datos). La paginación solo mira los altos,
+# así que se puede recorrer dos veces: primero para numerar páginas (índice y
+# "Página i de N") y después para dibujar, sin guardar páginas en memoria.
+Item = Tuple[str, float, Any]
+
+
+def _pct(v) -> str:
+    if v is None:
+        return "-"
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return "-"
+    return f"{v*100:.1f}%" if v <= 1 else f"{v:.1f}%"
+
+
+def _num(v) -> str:
+    if v is None:
+        return "-"
+    try:
+        return f"{float(v):.2f}"
+    except (TypeError, ValueError):
+        return "-"
+
+
+@lru_cache(maxsize=4096)
+def _fit(text: str, width: float, font: str = "Helvetica", size: float = TABLE_FONT_SIZE) -> str:
+    # recorta el texto al ancho de la columna (búsqueda binaria sobre el largo)
+    if stringWidth(text, font, size) <= width:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if stringWidth(text[:mid] + "…", font, size) <= width:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + "…"
+
+
+def _wrapped(text: str, size: float = 10, indent: float = 10) -> Iterator[Item]:
+    for line in simpleSplit(text, "Helvetica", size, CONTENT_W - indent) or [""]:
+        yield ("text", 14, (line, size, False, indent))
+
+
+def _holding_cells(i: int, h: Dict[str, Any]) -> List[str]:
+    return [
+        str(i),
+        h["nombre"],
+        str(h["tipo"] or "-"),
+        str(h["pais"] or "-"),
+        h["moneda"] or "-",
+        _pct(h["peso"]) if h["peso"] is not None else "-",
+        f"{h['valor']:,.2f}" if h["valor"] is not None else "-",
+    ]
+
+
+class PortfolioPdfWriter:
+    """
+    Reporte PDF paginado: encabezado y pie en cada página, índice con números
+    de página, gráficos y la tabla completa de activos (el encabezado de la
+    tabla se repite en cada página).
+
+    Se hace una pasada de layout (solo altos, sin dibujar) para conocer la página
+    de cada sección y el total, y una sola pasada de dibujo sobre el destino.
+    """
+
+    def __init__(self, payload: dict, view: Dict[str, Any]):
+        self.payload = payload
+        self.view = view
+        self.analysis = view["analysis"]
+        self.perfil = view["perfil"]
+        self._text = None
+
+    # ---- contenido ----
+
+    def _sections(self) -> List[Tuple[str, Any]]:
+        sections = [("Resumen cuantitativo", self._summary), ("Alertas detectadas", self._alerts)]
+        if self.view.get("risk"):
+            sections.append(("Riesgo con correlaciones", self._risk))
+        stress = self.view["stress"]
+        if stress and stress.get("metrics"):
+            sections.append((f"Stress test Monte Carlo ({stress.get('n_draws', 0):,} simulaciones)", self._stress))
+        sections.append(("Gráficos", self._charts))
+        sections.append((f"Activos en cartera ({len(self.view['holdings']):,})", self._holdings))
+        return sections
+
+    def _summary(self) -> Iterator[Item]:
+        metrics = self.view["metrics"]
+        yield ("text", 16, (f"Volatilidad: {_pct(metrics.get('VolPromedioCartera'))}", 11, False, 0))
+        yield ("text", 16, (f"Score: {_num(metrics.get('ScorePromedioCartera'))}", 11, False, 0))
+        yield ("text", 16, (f"Top 3: {_pct(metrics.get('ConcentracionTop3'))}", 11, False, 0))
+        yield ("text", 16, (f"Top 1: {_pct(metrics.get('ConcentracionTop1'))}", 11, False, 0))
+        yield ("text", 16, (f"HHI: {_num(metrics.get('IndiceHerfindahl'))}", 11, False, 0))
+
+    def _alerts(self) -> Iterator[Item]:
+        alerts = self.view["alerts"]
+        if not alerts:
+            yield from _wrapped("No se detectaron alertas críticas.")
+        for a in alerts:
+            msg = (a.get("msg") or str(a)) if isinstance(a, dict) else str(a)
+            yield from _wrapped(f"- {msg}")
+
+    def _risk(self) -> Iterator[Item]:
+        risk = self.view["risk"]
+        yield from _wrapped(f"Volatilidad con correlaciones: {risk['vol']} (promedio ponderado: {risk['vol_promedio']})")
+        yield from _wrapped(f"Ratio de diversificación: {risk['diversificacion']} — peso cubierto por el modelo: {risk['cobertura']}")
+        yield from _wrapped("Mayores contribuciones al riesgo:")
+        for r in risk["activos"][:5]:
+            yield from _wrapped(f"- {r['Activo']}: {r['contribucion_fmt']} del riesgo (peso {r['peso_fmt']}, vol marginal {r['marginal_fmt']})", indent=20)
+        labels, values = chart_key(((k, v) for k, v, _ in risk["Pais"]), top=MAX_BARS)
+        drawing = bar_chart(labels, values, "Contribución al riesgo por país")
+        if drawing is not None:
+            yield ("chart", drawing.height + 16, drawing)
+
+    def _stress(self) -> Iterator[Item]:
+        if __package__:
+            from .stress_mc import DEFAULT_MC_CONFIG, headline_percentiles, percentile_key
+        else:
+            from stress_mc import DEFAULT_MC_CONFIG, headline_percentiles, percentile_key
+
+        stress = self.view["stress"]
+        vol_mc = stress["metrics"]["VolPromedioCartera"]
+        top3_mc = stress["metrics"]["ConcentracionTop3"]
+        q_mid, q_high = headline_percentiles(stress)
+        mid, high = percentile_key(q_mid), percentile_key(q_high)
+        yield from _wrapped(f"Volatilidad P{q_mid:g} / P{q_high:g}: {vol_mc['percentiles'].get(mid, 0):.1f}% / {vol_mc['percentiles'].get(high, 0):.1f}%")
+        yield from _wrapped(f"Volatilidad promedio en la peor cola ({stress.get('tail', DEFAULT_MC_CONFIG['tail']):.0%}): {vol_mc['tail_mean_high']:.1f}%")
+        if "VolPromedioCartera" in stress.get("breach_prob", {}):
+            yield from _wrapped(f"Prob. de superar el límite del perfil ({stress['vol_limit']:.1f}%): {_pct(stress['breach_prob']['VolPromedioCartera'])}")
+        yield from _wrapped(f"Top 3 P{q_high:g}: {_pct(top3_mc['percentiles'].get(high))}")
+
+    def _charts(self) -> Iterator[Item]:
+        # Top 10 por peso (el resto agrupado en "Otros")
+        labels, values = chart_key(((h["nombre"], h["peso"]) for h in self.view["holdings"]), top=11)
+        charts = [("Distribución por peso (Top 10)", pie_chart(labels, values, "Pesos de la cartera"))]
+        for key, title in (("Pais", "Exposición por país"), ("Tipo", "Exposición por tipo de activo")):
+            labels, values = chart_key(((k, v) for k, v, _ in self.view["exposures"][key]), top=MAX_BARS)
+            charts.append((title, bar_chart(labels, values, title)))
+        for title, drawing in charts:
+            if drawing is None:
+                yield from _wrapped(f"{title}: sin datos suficientes.")
+            else:
+                yield ("chart", drawing.height + 16, drawing)
+
+    def _holdings(self) -> Iterator[Item]:
+        holdings = self.view["holdings"]
+        if not holdings:
+            yield from _wrapped("No se encontraron activos en el payload.")
+            return
+        yield ("table_header", ROW_H + 4, HOLDINGS_COLUMNS)
+        # filas en el orden de la vista (peso desc); se generan de a una
+        for i, h in enumerate(holdings, start=1):
+            yield ("row", ROW_H, (i, h))
+        yield ("table_end", 0, None)
+
+    def _items(self, toc: List[Tuple[str, int]]) -> Iterator[Item]:
+        yield ("title", 30, "AQ Capitals — Diagnóstico de Cartera")
+        yield ("text", 22, (f"Perfil declarado: {self.perfil or '-'}", 12, False, 0))
+        yield ("h2", 24, ("Índice", None))
+        for title, page in toc:
+            yield ("toc", 16, (title, page))
+        yield ("spacer", 10, None)
+        for n, (title, body) in enumerate(self._sections()):
+            yield ("h2", 24, (title, n))
+            yield from body()
+            yield ("spacer", 10, None)
+
+    # ---- paginación ----
+
+    def _layout(self, toc: List[Tuple[str, int]]) -> Iterator[Tuple[int, float, Item]]:
+        """
+        Ubica cada ítem: (página, y superior, ítem). Un título de sección no queda
+        solo al pie de la página y el encabezado de la tabla se repite tras cada salto.
+        """
+        page, y = 1, CONTENT_TOP
+        table_header = None
+        pending_h2 = None
+        for item in self._items(toc):
+            kind, h, data = item
+            if kind == "h2":
+                pending_h2 = item  # se ubica junto con el ítem que le sigue
+                continue
+            if kind == "spacer":
+                y = max(y - h, CONTENT_BOTTOM)  # un espacio nunca abre página
+                continue
+            if kind == "table_header":
+                table_header = item
+            block = ([pending_h2] if pending_h2 else []) + [item]
+            need = sum(b[1] for b in block)
+            if kind == "table_header":
+                need += ROW_H  # encabezado + al menos una fila
+            if y - need < CONTENT_BOTTOM and y < CONTENT_TOP:
+                page, y = page + 1, CONTENT_TOP
+                if kind == "row" and table_header is not None:
+                    yield page, y, table_header
+                    y -= table_header[1]
+            for b in block:
+                yield page, y, b
+                y -= b[1]
+            pending_h2 = None
+            if kind == "table_end":
+                table_header = None
+
+    # ---- dibujo ----
+
+    def _page_frame(self, c: canvas.Canvas, page: int, total: int) -> None:
+        c.setFont("Helvetica-Bold", 9)
+        c.drawString(MARGIN, PAGE_H - 40, "AQ Capitals — Diagnóstico de Cartera")
+        c.setFont("Helvetica", 9)
+        c.drawRightString(PAGE_W - MARGIN, PAGE_H - 40, f"Perfil: {self.perfil or '-'}")
+        c.setLineWidth(0.5)
+        c.line(MARGIN, PAGE_H - 48, PAGE_W - MARGIN, PAGE_H - 48)
+        c.line(MARGIN, 45, PAGE_W - MARGIN, 45)
+        c.setFont("Helvetica", 8)
+        c.drawString(MARGIN, 32, f"Generado: {self.view['generated_at']}")
+        c.drawRightString(PAGE_W - MARGIN, 32, f"Página {page} de {total}")
+
+    def _draw_row(self, c: canvas.Canvas, y: float, cells: List[str], bold: bool = False) -> None:
+        # las filas de una página van en un solo objeto de texto (se vuelca al cambiar de página)
+        font = "Helvetica-Bold" if bold else "Helvetica"
+        if self._text is None:
+            self._text = c.beginText()
+        t = self._text
+        t.setFont(font, TABLE_FONT_SIZE)
+        x = MARGIN
+        base = y - ROW_H + 3
+        for (_, w, align), text in zip(HOLDINGS_COLUMNS, cells):
+            text = _fit(text, w - 6, font)
+            if align == "r":
+                t.setTextOrigin(x + w - 3 - stringWidth(text, font, TABLE_FONT_SIZE), base)
+            else:
+                t.setTextOrigin(x + 3, base)
+            t.textOut(text)
+            x += w
+
+    def _flush_text(self, c: canvas.Canvas) -> None:
+        if self._text is not None:
+            c.drawText(self._text)
+            self._text = None
+
+    def _draw(self, c: canvas.Canvas, y: float, item: Item) -> None:
+        kind, h, data = item
+        if kind == "title":
+            c.setFont("Helvetica-Bold", 18)
+            c.drawString(MARGIN, y - 18, data)
+        elif kind == "text":
+            text, size, bold, indent = data
+            c.setFont("Helvetica-Bold" if bold else "Helvetica", size)
+            c.drawString(MARGIN + indent, y - size, text)
+        elif kind == "h2":
+            title, n = data
+            if n is not None:
+                c.bookmarkPage(f"sec{n}", fit="XYZ", top=y + 4)
+                c.addOutlineEntry(title, f"sec{n}", level=0)
+            c.setFont("Helvetica-Bold", 14)
+            c.drawString(MARGIN, y - 16, title)
+        elif kind == "toc":
+            title, page = data
+            c.setFont("Helvetica", 10)
+            c.drawString(MARGIN + 10, y - 11, title)
+            c.drawRightString(PAGE_W - MARGIN, y - 11, str(page))
+            left = MARGIN + 16 + stringWidth(title, "Helvetica", 10)
+            right = PAGE_W - MARGIN - 6 - stringWidth(str(page), "Helvetica", 10)
+            if right > left:
+                c.setDash(1, 2)
+                c.line(left, y - 11, right, y - 11)
+                c.setDash()
+        elif kind == "chart":
+            draw_chart(c, data, MARGIN, y)
+        elif kind == "table_header":
+            c.setFillGray(0.92)
+            c.rect(MARGIN, y - ROW_H - 1, CONTENT_W, ROW_H + 1, stroke=0, fill=1)
+            c.setFillGray(0)
+            self._draw_row(c, y, [col[0] for col in data], bold=True)
+        elif kind == "row":
+            i, holding = data
+            self._draw_row(c, y, _holding_cells(i, holding))
+
+    def write(self, out) -> None:
+        """
+        Escribe el PDF en `out` (ruta o archivo binario). Las páginas se comprimen
+        a medida que se cierran; reportlab arma el documento al final (save),
+        así que el costo en memoria es el del PDF comprimido, no el del layout.
+        """
+        # 1) layout: página de cada sección y total (sin dibujar)
+        section_pages: Dict[int, int] = {}
+        titles = [title for title, _ in self._sections()]
+        placeholder = [(t, 0) for t in titles]
+        total = 1
+        for page, _, (kind, _, data) in self._layout(placeholder):
+            total = page
+            if kind == "h2" and data[1] is not None:
+                section_pages[data[1]] = page
+        toc = [(t, section_pages.get(n, 1)) for n, t in enumerate(titles)]
+
+        # 2) dibujo: una sola pasada, página por página
+        c = canvas.Canvas(out, pagesize=A4, pageCompression=1)
+        c.setTitle("AQ Capitals — Diagnóstico de Cartera")
+        current = 1
+        self._page_frame(c, current, total)
+        for page, y, item in self._layout(toc):
+            if page != current:
+                self._flush_text(c)
+                c.showPage()
+                current = page
+                self._page_frame(c, current, total)
+            self._draw(c, y, item)
+        self._flush_text(c)
+        c.showPage()
+        c.save()
+
+
+def write_portfolio_pdf(out, payload, analysis, perfil_declarado, alerts, view=None) -> None:
+    """
+    Escribe el PDF del diagnóstico en `out` (ruta o archivo binario).
+    """
+    if view is None:
+        if __package__:
+            from .render_pipeline import build_view
+        else:
+            from render_pipeline import build_view
+        view = build_view({**payload, "analysis": analysis}, perfil_declarado)
+    PortfolioPdfWriter(payload, view).write(out)
+
+
+def build_portfolio_pdf_bytes(payload, analysis, perfil_declarado, alerts, view=None):
+    """
+    PDF del diagnóstico (AQ Capitals). `view` es la vista de render_pipeline.build_view;
+    si no se pasa, se arma acá.
+    """
+    buffer = io.BytesIO()
+    write_portfolio_pdf(buffer, payload, analysis, perfil_declarado, alerts, view=view)
+    return buffer.getvalue()
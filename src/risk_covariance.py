@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import csv
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+# Volatilidad de cartera con correlaciones: sigma_p = sqrt(w' S w), en la misma
+# unidad que VolatilidadFinal (% anual). El modelo de riesgo es una matriz de
+# correlación (la vol de cada activo sigue saliendo del Excel) o de covarianza
+# (vol y correlación salen de la matriz), sobre un universo de activos por nombre.
+
+DEFAULT_RISK_MODEL_PATH = os.path.join("data", "risk", "modelo_riesgo.csv")
+PERIODS_PER_YEAR = 252
+
+
+class RiskModel:
+    """
+    Matriz de correlación ("corr") o covarianza ("cov", en %² anual) sobre un
+    universo de activos. Las submatrices por cartera se cachean por tupla de
+    activos: la misma cartera (o el mismo universo) no vuelve a indexar la matriz.
+    Activos fuera del modelo se tratan como no correlacionados con el resto.
+    """
+
+    def __init__(self, assets: Sequence[Any], matrix: np.ndarray, kind: str = "corr",
+                 source: str = "", max_cached: int = 256):
+        matrix = np.asarray(matrix, dtype=float)
+        if kind not in ("corr", "cov"):
+            raise ValueError(f"Tipo de matriz desconocido: {kind} (usar 'corr' o 'cov')")
+        if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1] or matrix.shape[0] != len(assets):
+            raise ValueError(f"La matriz debe ser cuadrada de {len(assets)}x{len(assets)}; es {matrix.shape}")
+        if not np.all(np.isfinite(matrix)):
+            raise ValueError("La matriz de riesgo tiene valores vacíos o no numéricos")
+        if not np.allclose(matrix, matrix.T, atol=1e-8):
+            raise ValueError("La matriz de riesgo no es simétrica")
+        self.assets = [str(a).strip() for a in assets]
+        self.matrix = matrix
+        self.kind = kind
+        self.source = source
+        self.max_cached = max_cached
+        self._index = {a: i for i, a in enumerate(self.assets)}
+        self._sub: "OrderedDict[Tuple[str, ...], Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        h = hashlib.sha256(kind.encode())
+        h.update("\x1f".join(self.assets).encode("utf-8"))
+        h.update(np.ascontiguousarray(matrix).tobytes())
+        self.fingerprint = h.hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.assets)
+
+    @classmethod
+    def from_prices(cls, prices: np.ndarray, assets: Sequence[Any], periods_per_year: int = PERIODS_PER_YEAR,
+                    source: str = "") -> "RiskModel":
+        """
+        Covarianza anualizada (en %²) de los retornos logarítmicos de una matriz de
+        precios (fechas x activos). Los huecos (NaN) se toleran: cada par usa las
+        fechas en que ambos tienen retorno, y el resultado se lleva a la matriz
+        semidefinida positiva más cercana.
+        """
+        prices = np.asarray(prices, dtype=float)
+        if prices.ndim != 2 or prices.shape[1] != len(assets):
+            raise ValueError(f"Se esperaban precios de (fechas x {len(assets)} activos); llegó {prices.shape}")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rets = np.diff(np.log(np.where(prices > 0, prices, np.nan)), axis=0)
+        return cls(assets, returns_covariance(rets, periods_per_year) * 1e4, kind="cov", source=source)
+
+    def universe(self, names: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (índices en el modelo, submatriz) para los activos `names`, en su orden.
+        Índice -1 = activo fuera del modelo (fila/columna de identidad en "corr",
+        ceros en "cov"). Cacheado por tupla de nombres (LRU).
+        """
+        key = tuple(str(n).strip() for n in names)
+        with self._lock:
+            hit = self._sub.get(key)
+            if hit is not None:
+                self._sub.move_to_end(key)
+                return hit
+        idx = np.fromiter((self._index.get(n, -1) for n in key), dtype=np.int64, count=len(key))
+        known = idx >= 0
+        sub = np.zeros((len(key), len(key)))
+        sub[np.ix_(known, known)] = self.matrix[np.ix_(idx[known], idx[known])]
+        if self.kind == "corr":
+            sub[~known, ~known] = 1.0
+        sub.flags.writeable = False
+        with self._lock:
+            self._sub[key] = (idx, sub)
+            while len(self._sub) > self.max_cached:
+                self._sub.popitem(last=False)
+        return idx, sub
+
+    def covariance_for(self, names: Sequence[Any], vol: np.ndarray) -> np.ndarray:
+        """
+        Covarianza (%²) de los activos `names`. `vol` (VolatilidadFinal, en %) da
+        la vol de cada activo con una matriz de correlación, y la de los activos
+        fuera del modelo con una de covarianza. NaN -> 0.
+        """
+        vol = np.nan_to_num(np.asarray(vol, dtype=float), nan=0.0)
+        idx, sub = self.universe(names)
+        if self.kind == "corr":
+            return sub * np.outer(vol, vol)
+        cov = sub.copy()
+        missing = np.flatnonzero(idx < 0)
+        cov[missing, missing] = vol[missing] ** 2
+        return cov
+
+
+def returns_covariance(rets: np.ndarray, periods_per_year: int = PERIODS_PER_YEAR) -> np.ndarray:
+    """
+    Covarianza anualizada de una matriz de retornos (fechas x activos) con NaN:
+    por pares sobre las fechas comunes, en dos productos matriciales.
+    """
+    ok = ~np.isnan(rets)
+    x = np.where(ok, rets, 0.0)
+    m = ok.astype(float)
+    n_pair = m.T @ m
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # medias de cada activo sobre las fechas que comparte con el otro
+        mean_i = (x.T @ m) / n_pair
+        cov = (x.T @ x - mean_i * mean_i.T * n_pair) / (n_pair - 1)
+    cov = np.where(n_pair > 1, cov, 0.0)
+    return nearest_psd(cov) * periods_per_year
+
+
+def nearest_psd(cov: np.ndarray) -> np.ndarray:
+    # la covarianza por pares puede no ser PSD: se recortan autovalores negativos
+    cov = (cov + cov.T) / 2
+    vals, vecs = np.linalg.eigh(cov)
+    if vals.size == 0 or vals.min() >= 0:
+        return cov
+    out = (vecs * np.maximum(vals, 0.0)) @ vecs.T
+    return (out + out.T) / 2
+
+
+# ---- carga desde archivo ----
+
+def _parse_csv(text: str, source: str) -> RiskModel:
+    rows = [r for r in csv.reader(io.StringIO(text)) if r and any(c.strip() for c in r)]
+    if len(rows) < 2:
+        raise ValueError(f"Archivo de riesgo vacío: {source}")
+    header = [c.strip() for c in rows[0][1:]]
+    first_col = [r[0].strip() for r in rows[1:]]
+    values = np.array([[float(c) if c.strip() else np.nan for c in r[1:]] for r in rows[1:]], dtype=float)
+
+    if first_col == header:
+        # matriz cuadrada: diagonal de unos -> correlación; si no, covarianza en %²
+        kind = "corr" if np.allclose(np.diag(values), 1.0) else "cov"
+        return RiskModel(header, values, kind=kind, source=source)
+    # si no, historia de precios: primera columna = fecha, una columna por activo
+    return RiskModel.from_prices(values, header, source=source)
+
+
+def _parse_npz(data: bytes, source: str) -> RiskModel:
+    with np.load(io.BytesIO(data), allow_pickle=False) as z:
+        if "assets" not in z:
+            raise ValueError(f"El .npz debe tener 'assets' y 'corr' o 'cov': {source}")
+        assets = [str(a) for a in z["assets"]]
+        for kind in ("corr", "cov"):
+            if kind in z:
+                return RiskModel(assets, z[kind], kind=kind, source=source)
+        if "prices" in z:
+            return RiskModel.from_prices(z["prices"], assets, source=source)
+    raise ValueError(f"El .npz debe tener 'assets' y 'corr', 'cov' o 'prices': {source}")
+
+
+def risk_model_from_bytes(data: bytes, name: str = "modelo_riesgo.csv") -> RiskModel:
+    """
+    Modelo de riesgo desde un archivo en memoria (.csv o .npz):
+    - CSV cuadrado con nombres de activos en la primera fila y columna: correlación
+      (diagonal de unos) o covarianza en %².
+    - CSV con fecha en la primera columna y precios por activo: se estima la covarianza.
+    - NPZ con "assets" y "corr", "cov" o "prices".
+    """
+    if name.lower().endswith(".npz"):
+        return _parse_npz(data, name)
+    return _parse_csv(data.decode("utf-8-sig"), name)
+
+
+@lru_cache(maxsize=8)
+def _load_cached(path: str, mtime_ns: int) -> RiskModel:
+    with open(path, "rb") as f:
+        return risk_model_from_bytes(f.read(), os.path.basename(path))
+
+
+def load_risk_model(path: str = DEFAULT_RISK_MODEL_PATH) -> RiskModel:
+    """
+    Modelo de riesgo desde un archivo local, cacheado por ruta + fecha de modificación.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No existe: {path}")
+    path = os.path.abspath(path)
+    return _load_cached(path, os.stat(path).st_mtime_ns)
+
+
+def default_risk_model() -> RiskModel | None:
+    """
+    Modelo de riesgo por defecto: el archivo data/risk/modelo_riesgo.csv o, si no
+    está, la correlación EWMA de la historia de precios (price_store). Es opcional:
+    sin ninguno, el análisis usa la vol promedio de siempre.
+    """
+    if os.path.exists(DEFAULT_RISK_MODEL_PATH):
+        return load_risk_model(DEFAULT_RISK_MODEL_PATH)
+    if __package__:
+        from .price_store import default_price_store
+    else:
+        from price_store import default_price_store
+
+    store = default_price_store()
+    return store.risk_model() if store is not None else None
+
+
+# ---- métricas ----
+
+def _by_group(codes: np.ndarray, labels: List[str], values: np.ndarray) -> Dict[str, float]:
+    # suma por grupo (código -1 = sin grupo), de mayor a menor
+    mask = codes >= 0
+    if not mask.any():
+        return {}
+    sums = np.bincount(codes[mask], weights=values[mask], minlength=len(labels))
+    present = np.unique(codes[mask])
+    order = present[np.argsort(-sums[present], kind="stable")]
+    return {labels[g]: float(sums[g]) for g in order}
+
+
+def portfolio_risk(portfolio: Any, model: RiskModel, cov: np.ndarray | None = None) -> Dict[str, Any]:
+    """
+    Métricas de riesgo con correlaciones para un Portfolio (engine_v1):
+    - VolCovarianzaCartera: sqrt(w' S w), en %
+    - RatioDiversificacion: suma(w * vol) / VolCovarianzaCartera (>= 1)
+    - ContribucionRiesgoPorActivo: vol marginal (S w / sigma) y contribución
+      (w * marginal, suman sigma) por activo, de mayor a menor contribución
+    - ContribucionRiesgoPorPais / PorTipo: fracción de sigma por grupo
+    - CoberturaModeloRiesgo: fracción del peso con activos dentro del modelo
+    """
+    p = portfolio
+    valid = ~np.isnan(p.peso)
+    w = np.where(valid, p.peso, 0.0)
+    if cov is None:
+        cov = model.covariance_for(p.activo, p.vol)
+    sw = cov @ w
+    var = float(w @ sw)
+    sigma = float(np.sqrt(max(var, 0.0)))
+    standalone = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        marginal = sw / sigma if sigma > 0 else np.zeros_like(w)
+    component = w * marginal
+    share = component / sigma if sigma > 0 else np.zeros_like(w)
+
+    idx, _ = model.universe(p.activo)
+    total_w = float(w.sum())
+    order = np.flatnonzero(valid)
+    order = order[np.argsort(-component[order], kind="stable")]
+    return {
+        "VolCovarianzaCartera": sigma,
+        "RatioDiversificacion": float(w @ standalone) / sigma if sigma > 0 else 1.0,
+        "CoberturaModeloRiesgo": float(w[idx >= 0].sum() / total_w) if total_w else 0.0,
+        "ContribucionRiesgoPorActivo": [
+            {
+                "Activo": p.activo[i],
+                "Peso": float(w[i]),
+                "VolMarginal": float(marginal[i]),
+                "ContribucionVol": float(component[i]),
+                "ContribucionPct": float(share[i]),
+            }
+            for i in order
+        ],
+        "ContribucionRiesgoPorPais": _by_group(p.groups["Pais"][0], p.groups["Pais"][1], np.where(valid, share, 0.0)),
+        "ContribucionRiesgoPorTipo": _by_group(p.groups["Tipo"][0], p.groups["Tipo"][1], np.where(valid, share, 0.0)),
+    }
+
+
+def scenario_vols(portfolio: Any, cov: np.ndarray, mult: np.ndarray) -> np.ndarray:
+    """
+    Vol con correlaciones para cada escenario de una matriz de multiplicadores
+    (activos x escenarios): el escenario escala la vol de cada activo y la
+    correlación no cambia, así que S_j = D_j S D_j. Un solo producto matricial.
+    """
+    w = np.nan_to_num(portfolio.peso, nan=0.0)
+    W = w[:, None] * mult
+    return np.sqrt(np.maximum(np.einsum("ij,ij->j", W, cov @ W), 0.0))
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import math
+from statistics import NormalDist
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+# Pérdidas en fracción del valor de la cartera (0.05 = 5%), siempre positivas.
+# - Paramétrico: normal de media cero con la vol de la cartera (con correlaciones
+#   si hay modelo de riesgo; si no, la vol promedio ponderada, que es cota superior).
+# - Histórico: P&L de la cartera sobre retornos diarios (historia de precios o
+#   cualquier matriz de escenarios x activos), escalado por sqrt(horizonte).
+
+DEFAULT_VAR_CONFIG = {
+    "levels": (0.95, 0.99),
+    "alert_level": 0.95,  # nivel que se compara contra cvar_profile_limits
+    "horizon_days": 21,  # 1 mes hábil
+    "periods_per_year": 252,
+    "lookback_days": 500,  # ~2 años de historia
+    "min_days": 60,  # menos días -> solo paramétrico
+    "min_coverage": 0.80,  # peso mínimo con historia para usar el histórico en la alerta
+}
+
+# límite de celdas (días x carteras) por bloque del cálculo batch
+_CELL_BUDGET = 4_000_000
+
+_NORMAL = NormalDist()
+
+
+def _level_key(level: float) -> str:
+    return f"{level * 100:g}"
+
+
+def parametric_var(sigma: np.ndarray, levels: Sequence[float], horizon_days: int,
+                   periods_per_year: int = 252) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    VaR y CVaR normales para un vector de vols anuales (en %), una o muchas carteras.
+    """
+    s = np.asarray(sigma, dtype=float) / 100.0 * math.sqrt(horizon_days / periods_per_year)
+    out = {}
+    for level in levels:
+        z = _NORMAL.inv_cdf(level)
+        out[_level_key(level)] = {"VaR": z * s, "CVaR": _NORMAL.pdf(z) / (1 - level) * s}
+    return out
+
+
+def historical_var(returns: np.ndarray, weights: np.ndarray, levels: Sequence[float],
+                   horizon_days: int = 1) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    VaR y CVaR por simulación histórica para muchas carteras a la vez.
+
+    returns: (días x activos) retornos logarítmicos; NaN = sin movimiento.
+    weights: (activos x carteras) o (activos,).
+    Las pérdidas salen de un producto matricial por bloque de carteras; el VaR y
+    la cola se toman con un solo np.partition para todos los niveles (sin ordenar
+    la historia completa).
+    """
+    r = np.expm1(np.nan_to_num(np.asarray(returns, dtype=float), nan=0.0))
+    w = np.asarray(weights, dtype=float)
+    single = w.ndim == 1
+    w = np.nan_to_num(w[:, None] if single else w, nan=0.0)
+    n_days, n_ports = r.shape[0], w.shape[1]
+    if n_days == 0:
+        raise ValueError("No hay retornos para la simulación histórica")
+
+    # días en la cola de cada nivel (la tolerancia evita que 0.05 * 500 dé 26)
+    tails = {level: max(1, int(math.ceil((1 - level) * n_days - 1e-9))) for level in levels}
+    kth = sorted({n_days - k for k in tails.values()})
+    scale = math.sqrt(horizon_days)
+    out = {_level_key(level): {"VaR": np.empty(n_ports), "CVaR": np.empty(n_ports)} for level in levels}
+
+    step = max(1, _CELL_BUDGET // n_days)
+    for j in range(0, n_ports, step):
+        losses = -(r @ w[:, j:j + step])  # días x carteras del bloque
+        part = np.partition(losses, kth, axis=0)
+        for level, k in tails.items():
+            res = out[_level_key(level)]
+            res["VaR"][j:j + step] = part[n_days - k] * scale
+            res["CVaR"][j:j + step] = part[n_days - k:].mean(axis=0) * scale
+
+    if single:
+        return {key: {m: v[0] for m, v in res.items()} for key, res in out.items()}
+    return out
+
+
+def _bucket_weights(portfolio: Any, key: str) -> Tuple[List[str], np.ndarray]:
+    # (etiquetas, activos x grupos): el peso de cada activo en la columna de su grupo
+    codes, labels = portfolio.groups[key]
+    w = np.nan_to_num(portfolio.peso, nan=0.0)
+    present = np.unique(codes[codes >= 0])
+    B = np.zeros((len(w), len(present)))
+    col = np.searchsorted(present, codes)
+    rows = np.flatnonzero(codes >= 0)
+    B[rows, col[rows]] = w[rows]
+    return [labels[g] for g in present], B
+
+
+def _bucket_table(labels: List[str], hist: Dict[str, Dict[str, np.ndarray]], level: str) -> Dict[str, Dict[str, float]]:
+    # por grupo, de mayor a menor CVaR al nivel de la alerta
+    order = np.argsort(-hist[level]["CVaR"], kind="stable")
+    return {
+        labels[g]: {f"{m}{key}": float(d[m][g]) for key, d in hist.items() for m in ("VaR", "CVaR")}
+        for g in order
+    }
+
+
+def loss_metrics(portfolio: Any, metrics: dict, returns: np.ndarray | None = None,
+                 covered: np.ndarray | None = None, config: dict | None = None) -> dict:
+    """
+    Métricas de pérdida de una cartera (Portfolio de engine_v1):
+    - RiesgoPerdida: VaR/CVaR paramétrico e histórico por nivel, horizonte y fuente
+    - RiesgoPerdidaPorPais / PorTipo: VaR/CVaR histórico de cada grupo por separado
+    - CVaRCartera: CVaR al nivel de la alerta (en %), histórico si hay historia
+      suficiente y cubre min_coverage del peso; si no, paramétrico
+    - RiesgoPerdida.fuente_alerta: "historico" (price_store), "escenarios"
+      (returns del llamador) o "parametrico"
+
+    `returns` (días x activos de la cartera, retornos logarítmicos) puede venir de
+    la historia de precios o de una matriz de escenarios; sin él se usa la
+    historia local (price_store) si existe.
+    """
+    cfg = {**DEFAULT_VAR_CONFIG, **(config or {})}
+    levels = tuple(cfg["levels"])
+    if cfg["alert_level"] not in levels:
+        levels = levels + (cfg["alert_level"],)
+    alert_key = _level_key(cfg["alert_level"])
+    horizon = int(cfg["horizon_days"])
+
+    sigma = metrics.get("VolCovarianzaCartera", metrics["VolPromedioCartera"])
+    param = {key: {m: float(v[0]) for m, v in d.items()}
+             for key, d in parametric_var(np.array([sigma]), levels, horizon, cfg["periods_per_year"]).items()}
+
+    fuente_hist = "escenarios" if returns is not None else "historico"
+    if returns is None:
+        if __package__:
+            from .price_store import default_price_store
+        else:
+            from price_store import default_price_store
+
+        store = default_price_store()
+        if store is not None:
+            returns, covered = store.returns(portfolio.activo, cfg["lookback_days"])
+
+    out = {
+        "RiesgoPerdida": {
+            "horizonte_dias": horizon,
+            "base_parametrica": "correlaciones" if "VolCovarianzaCartera" in metrics else "vol promedio",
+            "parametrico": param,
+        },
+    }
+    cvar = param[alert_key]["CVaR"]
+    fuente = "parametrico"
+
+    w = np.nan_to_num(portfolio.peso, nan=0.0)
+    if returns is not None and len(returns) >= cfg["min_days"]:
+        if covered is None:
+            covered = ~np.all(np.isnan(returns), axis=0)
+        total = float(w.sum())
+        coverage = float(w[covered].sum() / total) if total else 0.0
+        # cartera y grupos en un solo batch: columnas = [cartera, países..., tipos...]
+        paises, bp = _bucket_weights(portfolio, "Pais")
+        tipos, bt = _bucket_weights(portfolio, "Tipo")
+        hist = historical_var(returns, np.hstack([w[:, None], bp, bt]), levels, horizon)
+        split = np.cumsum([1, len(paises)])
+        part = [{key: {m: v[a:b] for m, v in d.items()} for key, d in hist.items()}
+                for a, b in zip([0, *split], [*split, None])]
+        out["RiesgoPerdida"].update({
+            "historico": {key: {m: float(v[0]) for m, v in d.items()} for key, d in part[0].items()},
+            "dias": int(len(returns)),
+            "cobertura": coverage,
+        })
+        out["RiesgoPerdidaPorPais"] = _bucket_table(paises, part[1], alert_key)
+        out["RiesgoPerdidaPorTipo"] = _bucket_table(tipos, part[2], alert_key)
+        if coverage >= cfg["min_coverage"]:
+            cvar = out["RiesgoPerdida"]["historico"][alert_key]["CVaR"]
+            fuente = fuente_hist
+
+    out["RiesgoPerdida"]["fuente_alerta"] = fuente
+    out["RiesgoPerdida"]["nivel_alerta"] = cfg["alert_level"]
+    out["CVaRCartera"] = cvar * 100  # en %, como los límites del perfil
+    return out
+
+
+def loss_metrics_batch(weights: np.ndarray, returns: np.ndarray, sigma: np.ndarray | None = None,
+                       config: dict | None = None) -> Dict[str, Any]:
+    """
+    VaR/CVaR para un libro de carteras sobre un mismo universo de activos.
+    weights: (activos x carteras); returns: (días x activos); sigma: vol anual (%)
+    de cada cartera para el paramétrico (opcional). Devuelve arrays por cartera.
+    """
+    cfg = {**DEFAULT_VAR_CONFIG, **(config or {})}
+    levels = tuple(cfg["levels"])
+    horizon = int(cfg["horizon_days"])
+    out: Dict[str, Any] = {"historico": historical_var(returns, weights, levels, horizon)}
+    if sigma is not None:
+        out["parametrico"] = parametric_var(sigma, levels, horizon, cfg["periods_per_year"])
+    return out
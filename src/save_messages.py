@@ -1,6 +1,9 @@
 import os
 import json
-from narrative_v1 import build_client_messages
+if __package__:
+    from .narrative_v1 import build_client_messages
+else:
+    from narrative_v1 import build_client_messages
 
 
 def save_messages_from_analysis_json(analysis_json_path: str) -> None:
@@ -21,6 +24,15 @@ def save_messages_from_analysis_json(analysis_json_path: str) -> None:
         payload = json.load(f)
 
     messages = build_client_messages(payload)
+    write_messages(messages, out_dir)
+
+
+def write_messages(messages: dict, out_dir: str) -> dict:
+    """
+    Escribe los mensajes ya generados (build_client_messages) en out_dir:
+    whatsapp.txt, email.txt y simple.txt. Devuelve las rutas.
+    """
+    os.makedirs(out_dir, exist_ok=True)
 
     # 1) WhatsApp
     whatsapp_path = os.path.join(out_dir, "whatsapp.txt")
@@ -42,3 +54,4 @@ def save_messages_from_analysis_json(analysis_json_path: str) -> None:
     print(" -", whatsapp_path)
     print(" -", email_path)
     print(" -", simple_path)
+    return {"whatsapp": whatsapp_path, "email": email_path, "simple": simple_path}
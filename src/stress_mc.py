@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+
+if __package__:
+    from .engine_v1 import DEFAULT_THRESHOLDS, Portfolio
+else:
+    from engine_v1 import DEFAULT_THRESHOLDS, Portfolio
+
+
+DEFAULT_MC_CONFIG = {
+    "n_draws": 100_000,
+    "seed": 20240601,
+    "block_size": 10_000,  # draws por bloque (cada bloque tiene su propio stream RNG)
+    "workers": None,  # None -> os.cpu_count(); 1 -> sin pool
+    "vol_shock_sigma": 0.25,  # dispersión log-normal del shock de vol (país + tipo)
+    "horizon_years": 1 / 12,  # horizonte del shock de precio
+    "tail": 0.05,  # cola para los promedios de cola
+    "percentiles": [5, 25, 50, 75, 95, 99],
+}
+
+# límite de celdas (draws x activos) por sub-bloque, para acotar memoria
+_CELL_BUDGET = 2_000_000
+
+# pools por cantidad de workers, compartidos por todas las sesiones del proceso
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+MC_METRICS = ("VolPromedioCartera", "ScorePromedioCartera", "ConcentracionTop1", "ConcentracionTop3", "IndiceHerfindahl")
+
+
+def _portfolio_arrays(p: Portfolio) -> Dict[str, Any]:
+    """
+    Arrays mínimos para simular (sin activos con peso NaN).
+    """
+    valid = ~np.isnan(p.peso)
+    country_codes, country_labels = p.groups["Pais"]
+    type_codes, type_labels = p.groups["Tipo"]
+    return {
+        "w": p.peso[valid],
+        "vol": np.nan_to_num(p.vol[valid], nan=0.0),
+        "score": np.nan_to_num(p.score[valid], nan=0.0),
+        # código -1 (sin país/tipo) -> último factor
+        "country": np.where(country_codes[valid] < 0, len(country_labels), country_codes[valid]),
+        "tipo": np.where(type_codes[valid] < 0, len(type_labels), type_codes[valid]),
+        "n_country": len(country_labels) + 1,
+        "n_tipo": len(type_labels) + 1,
+    }
+
+
+def _evaluate(arr: Dict[str, Any], x: np.ndarray, cfg: dict) -> Dict[str, np.ndarray]:
+    """
+    Métricas por draw para una matriz de factores x (draws x activos).
+
+    Un factor x > 0 es un shock adverso: sube la vol del activo (log-normal,
+    media 1) y baja su precio proporcionalmente a su propia volatilidad.
+    Los pesos se re-normalizan al total original.
+    """
+    sigma = cfg["vol_shock_sigma"]
+    vol_mult = np.exp(sigma * x - 0.5 * sigma * sigma)
+
+    ret = -(arr["vol"] / 100.0) * math.sqrt(cfg["horizon_years"]) * x
+    w = arr["w"] * np.maximum(1.0 + ret, 0.0)
+    total = w.sum(axis=1, keepdims=True)
+    w = np.divide(w, total, out=np.zeros_like(w), where=total > 0) * arr["w"].sum()
+
+    k = min(3, w.shape[1])
+    top = np.partition(w, w.shape[1] - k, axis=1)[:, w.shape[1] - k:] if k else np.zeros((w.shape[0], 1))
+
+    return {
+        "VolPromedioCartera": (w * arr["vol"] * vol_mult).sum(axis=1),
+        "ScorePromedioCartera": w @ arr["score"],
+        "ConcentracionTop1": top.max(axis=1),
+        "ConcentracionTop3": top.sum(axis=1),
+        "IndiceHerfindahl": (w * w).sum(axis=1),
+    }
+
+
+def _simulate_block(task: Tuple[np.random.SeedSequence, int, Dict[str, Any], dict]) -> Dict[str, np.ndarray]:
+    seed_seq, n_draws, arr, cfg = task
+    rng = np.random.default_rng(seed_seq)
+
+    # un shock por país y uno por tipo en cada draw
+    z_country = rng.standard_normal((n_draws, arr["n_country"]))
+    z_tipo = rng.standard_normal((n_draws, arr["n_tipo"]))
+
+    n_assets = max(1, arr["w"].size)
+    rows = max(1, _CELL_BUDGET // n_assets)
+    parts: List[Dict[str, np.ndarray]] = []
+    for start in range(0, n_draws, rows):
+        stop = min(n_draws, start + rows)
+        x = (z_country[start:stop][:, arr["country"]] + z_tipo[start:stop][:, arr["tipo"]]) / math.sqrt(2.0)
+        parts.append(_evaluate(arr, x, cfg))
+
+    return {m: np.concatenate([p[m] for p in parts]) for m in MC_METRICS}
+
+
+def percentile_key(q: float) -> str:
+    # clave de un percentil en "percentiles" (5 -> "p5", 99.5 -> "p99.5")
+    return f"p{q:g}"
+
+
+def headline_percentiles(stress: dict) -> Tuple[float, float]:
+    """
+    (central, alto) de los percentiles configurados: los más cercanos a 50 y 95.
+    Para los resúmenes que muestran solo dos.
+    """
+    qs = stress.get("percentiles") or DEFAULT_MC_CONFIG["percentiles"]
+    return min(qs, key=lambda q: abs(q - 50)), min(qs, key=lambda q: abs(q - 95))
+
+
+def _summarize(values: np.ndarray, cfg: dict) -> dict:
+    tail_n = max(1, int(round(values.size * cfg["tail"])))
+    ordered = np.sort(values)
+    return {
+        "mean": float(values.mean()),
+        "percentiles": {percentile_key(q): float(v) for q, v in zip(cfg["percentiles"], np.percentile(values, cfg["percentiles"]))},
+        "tail_mean_high": float(ordered[-tail_n:].mean()),
+        "tail_mean_low": float(ordered[:tail_n].mean()),
+    }
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Pool compartido. Los workers arrancan con spawn/forkserver, no con fork: el
+    servidor tiene hilos (writer de artefactos) y conexiones SQLite abiertas que
+    un fork copiaría a medio usar.
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+        return pool
+
+
+def _discard_pool(workers: int, pool: ProcessPoolExecutor) -> None:
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_stress_mc(activos: List[dict] | Portfolio, perfil_declarado: str | None = None,
+                  thresholds: dict | None = None, config: dict | None = None) -> dict:
+    """
+    Stress test Monte Carlo: N draws de shocks aleatorios por país y tipo de activo.
+
+    Los draws se parten en bloques de tamaño fijo, cada uno con su propio stream
+    (SeedSequence.spawn), así que el resultado es reproducible para una semilla dada
+    sin importar la cantidad de workers. Los bloques se evalúan vectorizados
+    y se reparten en un pool de procesos compartido (ver _pool).
+    """
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    cfg = {**DEFAULT_MC_CONFIG, **(config or {})}
+    p = activos if isinstance(activos, Portfolio) else Portfolio.from_records(activos)
+
+    arr = _portfolio_arrays(p)
+    n_draws = int(cfg["n_draws"])
+    block = int(cfg["block_size"])
+    sizes = [min(block, n_draws - s) for s in range(0, n_draws, block)]
+    seeds = np.random.SeedSequence(cfg["seed"]).spawn(len(sizes))
+    tasks = [(seed, size, arr, cfg) for seed, size in zip(seeds, sizes)]
+
+    workers = cfg["workers"] or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        results = [_simulate_block(t) for t in tasks]
+    else:
+        pool = _pool(workers)
+        try:
+            results = list(pool.map(_simulate_block, tasks))
+        except BrokenProcessPool:
+            # un worker murió: el pool no se reusa y este pedido se resuelve acá
+            _discard_pool(workers, pool)
+            results = [_simulate_block(t) for t in tasks]
+
+    values = {m: np.concatenate([r[m] for r in results]) if results else np.zeros(0) for m in MC_METRICS}
+
+    out = {
+        "n_draws": n_draws,
+        "seed": cfg["seed"],
+        "tail": cfg["tail"],
+        "percentiles": list(cfg["percentiles"]),
+        "perfil_declarado": perfil_declarado,
+        "metrics": {m: _summarize(v, cfg) for m, v in values.items()} if n_draws else {},
+        "breach_prob": {},
+    }
+    if not n_draws:
+        return out
+
+    out["breach_prob"] = {
+        "ConcentracionTop1": float((values["ConcentracionTop1"] > thresholds["top1_max"]).mean()),
+        "ConcentracionTop3": float((values["ConcentracionTop3"] > thresholds["top3_max"]).mean()),
+        "IndiceHerfindahl": float((values["IndiceHerfindahl"] > thresholds["hhi_max"]).mean()),
+    }
+    limits = thresholds["vol_profile_limits"]
+    if perfil_declarado in limits:
+        out["vol_limit"] = limits[perfil_declarado]
+        out["breach_prob"]["VolPromedioCartera"] = float((values["VolPromedioCartera"] > limits[perfil_declarado]).mean())
+
+    return out
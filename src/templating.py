@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import os
+import re
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+# {{ nombre }} se escapa; {{ nombre|safe }} se inserta tal cual
+_FIELD = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*(\|\s*safe\s*)?\}\}")
+
+
+class Markup(str):
+    """
+    Texto HTML ya escapado (o confiable): no se vuelve a escapar al insertarlo.
+    """
+
+
+_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"})
+
+
+def escape(value: Any) -> str:
+    # mismo resultado que html.escape(quote=True), con una sola pasada
+    if isinstance(value, Markup):
+        return value
+    return ("" if value is None else str(value)).translate(_ESCAPES)
+
+
+class Rows:
+    """
+    Cuerpo de tabla/lista renderizado de a bloques: cada elemento de `items` se
+    convierte en el contexto de la fila con `to_context` y se renderiza con `template`.
+    Al escribir a un archivo se vuelca bloque por bloque, sin armar el string entero.
+    """
+
+    def __init__(self, template: "Template", items: Iterable[Any], to_context: Callable[[Any], dict] | None = None,
+                 empty: str = "", chunk_size: int = 256):
+        self.template = template
+        self.items = items
+        self.to_context = to_context or (lambda x: x)
+        self.empty = Markup(empty)
+        self.chunk_size = chunk_size
+
+    def __iter__(self) -> Iterator[str]:
+        render = self.template.render
+        to_context = self.to_context
+        chunk: List[str] = []
+        any_row = False
+        for item in self.items:
+            chunk.append(render(**to_context(item)))
+            any_row = True
+            if len(chunk) >= self.chunk_size:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+        if not any_row and self.empty:
+            yield self.empty
+
+
+class Template:
+    """
+    Plantilla compilada una sola vez: el texto se parte en literales y campos,
+    y render() solo concatena. Los valores se escapan salvo Markup, Rows o |safe.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts: List[Tuple[str, str | None, bool]] = []
+        pos = 0
+        for m in _FIELD.finditer(source):
+            self._parts.append((source[pos:m.start()], m.group(1), bool(m.group(2))))
+            pos = m.end()
+        self._parts.append((source[pos:], None, False))
+        self._fields = [(name, safe) for _, name, safe in self._parts if name]
+        self.fields = {name for name, _ in self._fields}
+        # forma compilada para render(): un solo str.format posicional
+        self._fmt = "".join(
+            literal.replace("{", "{{").replace("}", "}}") + (f"{{{i}}}" if name else "")
+            for i, (literal, name, _) in enumerate(self._parts)
+        )
+
+    def _value(self, ctx: dict, name: str, safe: bool):
+        if name not in ctx:
+            raise KeyError(f"Falta el valor '{name}' para la plantilla")
+        value = ctx[name]
+        if isinstance(value, Rows):
+            return value
+        if safe:
+            return "" if value is None else str(value)
+        return escape(value)
+
+    def _chunks(self, ctx: dict) -> Iterator[str]:
+        for literal, name, safe in self._parts:
+            if literal:
+                yield literal
+            if name is None:
+                continue
+            value = self._value(ctx, name, safe)
+            if isinstance(value, Rows):
+                yield from value
+            else:
+                yield value
+
+    def render(self, **ctx) -> Markup:
+        values = []
+        for name, safe in self._fields:
+            value = self._value(ctx, name, safe)
+            values.append("".join(value) if isinstance(value, Rows) else value)
+        return Markup(self._fmt.format(*values))
+
+    def stream(self, out, **ctx) -> None:
+        """
+        Escribe la plantilla en un archivo de texto abierto, bloque por bloque.
+        """
+        for chunk in self._chunks(ctx):
+            out.write(chunk)
+
+
+@lru_cache(maxsize=None)
+def asset(name: str) -> Markup:
+    """
+    Archivo estático de src/templates (CSS), leído una vez por proceso.
+    """
+    with open(os.path.join(TEMPLATES_DIR, name), "r", encoding="utf-8") as f:
+        return Markup(f.read())
+
+
+@lru_cache(maxsize=None)
+def load_template(name: str) -> Template:
+    """
+    Plantilla de src/templates, compilada una vez por proceso.
+    """
+    with open(os.path.join(TEMPLATES_DIR, name), "r", encoding="utf-8") as f:
+        return Template(f.read())
@@ -1,6 +1,8 @@
 from pathlib import Path
 import streamlit as st
 
+from src.utils.resources import file_text
+
 def load_css() -> None:
     base_dir = Path(__file__).resolve().parent
     css_path = base_dir / "styles.css"
@@ -9,8 +11,8 @@ def load_css() -> None:
         st.error(f"CSS NOT FOUND: {css_path}")
         return
 
-    css = css_path.read_text(encoding="utf-8")
+    # leído una vez por proceso (se relee solo si el archivo cambia)
+    css = file_text(str(css_path))
 
     # Inyecta el CSS del archivo
     st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
-
@@ -0,0 +1,310 @@
+import json
+import math
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, las escrituras se serializan solo dentro del proceso
+    fcntl = None
+
+import numpy as np
+
+from src.utils.client_store import _atomic_write_json, _base_dir, _client_dir, _run_order
+from src.utils.resources import get_versioned_resource, load_json
+
+# ---- Libro consolidado (todos los clientes, último run de cada uno) ----
+# data/clients/_book.json guarda una fila compacta por cliente (su último run) y
+# los totales de la firma. Cada run guardado actualiza solo a su cliente: se resta
+# la fila anterior y se suma la nueva, sin recorrer las carpetas de los demás.
+# rebuild_book() arma todo desde cero (primera vez o reparación).
+
+BOOK_FILE = "_book.json"
+BOOK_DIMENSIONS = ("Pais", "Tipo", "Moneda")
+DIST_METRICS = ("vol", "score", "hhi", "top1", "top3")
+
+_thread_lock = threading.Lock()
+
+
+def _book_path() -> str:
+    return os.path.join(_base_dir(), BOOK_FILE)
+
+
+@contextmanager
+def _book_lock():
+    # un escritor a la vez (entre procesos con flock sobre _book.lock)
+    os.makedirs(_base_dir(), exist_ok=True)
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(_base_dir(), "_book.lock"), "a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _num(x) -> float | None:
+    try:
+        v = float(x)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(v) else v
+
+
+def build_run_summary(client_id: str, run_id: str, analysis: dict, activos: List[Dict] | None = None,
+                      perfil: str | None = None) -> Dict[str, Any]:
+    """
+    summary.json de un run: métricas principales, exposiciones, tipos de alerta y
+    valor total de la cartera (para ponderar el libro consolidado).
+    """
+    analysis = analysis if isinstance(analysis, dict) else {}
+    metrics = analysis.get("metrics", {}) or {}
+    alerts = analysis.get("alerts", []) or []
+    valor = sum(v for v in (_num(a.get("Valor en USD")) for a in activos or []) if v is not None)
+    return {
+        "client_id": client_id,
+        "run_id": run_id,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "perfil": perfil or analysis.get("perfil_declarado"),
+        "score": metrics.get("ScorePromedioCartera"),
+        "vol": metrics.get("VolPromedioCartera"),
+        "top1": metrics.get("ConcentracionTop1"),
+        "top3": metrics.get("ConcentracionTop3"),
+        "hhi": metrics.get("IndiceHerfindahl"),
+        "valor_total": valor or None,
+        "alerts_count": len(alerts),
+        "alert_types": sorted({a.get("type") for a in alerts if isinstance(a, dict) and a.get("type")}),
+        "exposures": {
+            "Pais": metrics.get("ExposicionPorPais", {}),
+            "Tipo": metrics.get("ExposicionPorTipo", {}),
+            "Moneda": metrics.get("ExposicionPorMoneda", {}),
+        },
+    }
+
+
+def _entry(summary: Dict[str, Any], runs_mtime: int = 0) -> Dict[str, Any]:
+    # fila compacta del cliente; sin valor total, la cartera pesa 1 (promedio simple)
+    exposures = summary.get("exposures") or {}
+    return {
+        "run_id": str(summary.get("run_id") or ""),
+        # orden entre runs: created_at (el run_id solo tiene resolución de segundos)
+        "created_at": str(summary.get("created_at") or ""),
+        "perfil": summary.get("perfil"),
+        "valor": _num(summary.get("valor_total")) or 1.0,
+        **{m: _num(summary.get(m)) for m in DIST_METRICS},
+        "alerts": list(summary.get("alert_types") or []),
+        "exposures": {d: {str(k): float(v) for k, v in (exposures.get(d) or {}).items()} for d in BOOK_DIMENSIONS},
+        "runs_mtime": runs_mtime,
+    }
+
+
+def _empty_book() -> Dict[str, Any]:
+    return {
+        "clients": {},
+        "totals": {"valor": 0.0, **{d: {} for d in BOOK_DIMENSIONS}},
+        "alert_counts": {},
+        "updated_at": None,
+    }
+
+
+def _apply(book: Dict[str, Any], entry: Dict[str, Any], sign: int) -> None:
+    # suma (sign=1) o resta (sign=-1) la contribución de un cliente a los totales
+    totals = book["totals"]
+    totals["valor"] += sign * entry["valor"]
+    for d in BOOK_DIMENSIONS:
+        agg = totals[d]
+        for k, w in entry["exposures"][d].items():
+            v = agg.get(k, 0.0) + sign * entry["valor"] * w
+            if abs(v) < 1e-9:
+                agg.pop(k, None)
+            else:
+                agg[k] = v
+    counts = book["alert_counts"]
+    for t in entry["alerts"]:
+        n = counts.get(t, 0) + sign
+        if n:
+            counts[t] = n
+        else:
+            counts.pop(t, None)
+
+
+def _read_book() -> Dict[str, Any]:
+    path = _book_path()
+    if not os.path.exists(path):
+        return _empty_book()
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_book(book: Dict[str, Any]) -> None:
+    book["updated_at"] = datetime.utcnow().isoformat() + "Z"
+    _atomic_write_json(_book_path(), book)
+
+
+def _upsert(book: Dict[str, Any], client_id: str, entry: Dict[str, Any]) -> bool:
+    old = book["clients"].get(client_id)
+    if old is not None:
+        if _run_order(old.get("created_at"), old["run_id"]) > _run_order(entry["created_at"], entry["run_id"]):
+            return False  # llegó tarde un run más viejo: el libro ya tiene uno más nuevo
+        _apply(book, old, -1)
+    _apply(book, entry, +1)
+    book["clients"][client_id] = entry
+    return True
+
+
+def _runs_mtime(client_id: str) -> int:
+    runs = os.path.join(_client_dir(client_id), "runs")
+    return os.stat(runs).st_mtime_ns if os.path.isdir(runs) else 0
+
+
+def update_book(client_id: str, summary: Dict[str, Any]) -> bool:
+    """
+    Incorpora el run recién guardado de un cliente (lo llama save_run_artifacts).
+    Devuelve False si el libro ya tenía un run más nuevo de ese cliente.
+    """
+    with _book_lock():
+        book = _read_book()
+        changed = _upsert(book, client_id, _entry(summary, _runs_mtime(client_id)))
+        if changed:
+            _write_book(book)
+    return changed
+
+
+def _latest_summary(client_id: str) -> Dict[str, Any] | None:
+    # último run completo (con summary.json). Los run_id ordenan por segundo; dentro
+    # del mismo segundo desempata created_at
+    runs = os.path.join(_client_dir(client_id), "runs")
+    if not os.path.isdir(runs):
+        return None
+    best = None
+    for run_id in sorted(os.listdir(runs), reverse=True):
+        if best is not None and run_id[:17] != best["run_id"][:17]:
+            break
+        path = os.path.join(runs, run_id, "summary.json")
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                summary = {"run_id": run_id, **json.load(f)}
+        except (OSError, ValueError):
+            continue
+        if best is None or (_run_order(summary.get("created_at"), run_id)
+                            > _run_order(best.get("created_at"), best["run_id"])):
+            best = summary
+    return best
+
+
+def _client_ids() -> Iterable[str]:
+    base = _base_dir()
+    if not os.path.exists(base):
+        return []
+    return [c for c in sorted(os.listdir(base))
+            if not c.startswith((".", "_")) and os.path.isdir(_client_dir(c))]
+
+
+def sync_book() -> int:
+    """
+    Pone al día el libro con runs guardados por fuera de save_run_artifacts: solo
+    relee a los clientes cuya carpeta runs/ cambió (un stat por cliente).
+    Devuelve cuántos clientes se actualizaron.
+    """
+    with _book_lock():
+        book = _read_book()
+        n = 0
+        for cid in _client_ids():
+            mtime = _runs_mtime(cid)
+            old = book["clients"].get(cid)
+            if not mtime or (old is not None and old["runs_mtime"] == mtime):
+                continue
+            summary = _latest_summary(cid)
+            if summary is not None and _upsert(book, cid, _entry(summary, mtime)):
+                n += 1
+            elif old is not None:
+                old["runs_mtime"] = mtime
+        if n or book["updated_at"] is None:
+            _write_book(book)
+    return n
+
+
+def rebuild_book() -> int:
+    """
+    Arma el libro desde cero leyendo el último summary.json de cada cliente.
+    """
+    with _book_lock():
+        book = _empty_book()
+        for cid in _client_ids():
+            summary = _latest_summary(cid)
+            if summary is not None:
+                _upsert(book, cid, _entry(summary, _runs_mtime(cid)))
+        _write_book(book)
+    return len(book["clients"])
+
+
+def load_book() -> Dict[str, Any]:
+    """
+    Libro tal como está guardado (lectura cacheada por versión del archivo).
+    """
+    path = _book_path()
+    return load_json(path) if os.path.exists(path) else _empty_book()
+
+
+def _distribution(values: np.ndarray, bins: int) -> Dict[str, Any]:
+    values = values[~np.isnan(values)]
+    if not values.size:
+        return {"n": 0}
+    counts, edges = np.histogram(values, bins=bins)
+    p = np.percentile(values, [10, 25, 50, 75, 90])
+    return {
+        "n": int(values.size),
+        "mean": float(values.mean()),
+        "percentiles": {f"p{q}": float(v) for q, v in zip((10, 25, 50, 75, 90), p)},
+        "histogram": {"counts": counts.tolist(), "edges": edges.tolist()},
+    }
+
+
+def book_view(book: Dict[str, Any] | None = None, bins: int = 10) -> Dict[str, Any]:
+    """
+    Resumen del libro para el dashboard: exposición de la firma (fracción del
+    valor total, de mayor a menor), distribución de métricas entre clientes,
+    clientes con cada alerta y por perfil.
+    """
+    book = book or load_book()
+    clients = book["clients"]
+    total = book["totals"]["valor"] or 1.0
+    exposures = {
+        d: dict(sorted(((k, v / total) for k, v in book["totals"][d].items()), key=lambda kv: -kv[1]))
+        for d in BOOK_DIMENSIONS
+    }
+    entries = list(clients.values())
+    columns = {m: np.array([np.nan if e[m] is None else e[m] for e in entries], dtype=float) for m in DIST_METRICS}
+    perfiles: Dict[str, int] = {}
+    for e in entries:
+        key = e.get("perfil") or "Sin perfil"
+        perfiles[key] = perfiles.get(key, 0) + 1
+    return {
+        "n_clients": len(clients),
+        "valor_total": book["totals"]["valor"],
+        "updated_at": book["updated_at"],
+        "exposures": exposures,
+        "distributions": {m: _distribution(v, bins) for m, v in columns.items()},
+        "alert_counts": dict(sorted(book["alert_counts"].items(), key=lambda kv: -kv[1])),
+        "clients_with_alerts": sum(1 for e in entries if e["alerts"]),
+        "perfiles": perfiles,
+    }
+
+
+def cached_book_view(bins: int = 10) -> Dict[str, Any]:
+    """
+    book_view() calculado una vez por versión de _book.json y compartido por
+    todas las sesiones: el dashboard no relee ni recalcula en cada rerun, y
+    cada run guardado reemplaza la vista anterior en vez de acumularla.
+    """
+    path = _book_path()
+    stamp = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+    return get_versioned_resource(("book_view", os.path.abspath(path), bins), stamp, lambda: book_view(bins=bins))
@@ -1,13 +1,82 @@
 import os
 import json
-from datetime import datetime
+import logging
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from typing import Dict, List
 
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, los appends se serializan solo dentro del proceso
+    fcntl = None
+
+import numpy as np
+
+from src.utils.resources import clear_resources, get_resource
+
 BASE_DIR = "data/clients"
 
+_log = logging.getLogger(__name__)
+
+def _base_dir() -> str:
+    # se lee en cada llamada: libro e índices siguen a un cambio de BASE_DIR en runtime
+    return BASE_DIR
+
+def _index_path() -> str:
+    return os.path.abspath(os.path.join(BASE_DIR, INDEX_FILE))
+
 def _client_dir(client_id: str) -> str:
     return os.path.join(BASE_DIR, client_id)
 
+# ---- Escrituras seguras entre sesiones ----
+# Varias sesiones de Streamlit comparten data/clients: los archivos se escriben
+# a un temporal y se publican con os.replace (atómico), así un lector nunca ve
+# un archivo a medio escribir y nunca espera a un escritor.
+
+def _atomic_write_bytes(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _atomic_write_json(path: str, obj) -> None:
+    _atomic_write_bytes(path, json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8"))
+
+_thread_locks: Dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+@contextmanager
+def _client_lock(client_id: str):
+    """
+    Lock exclusivo por cliente para appends al historial (flock sobre <cliente>/.lock).
+    Solo lo toman los escritores; las lecturas no lo usan.
+    """
+    base = _client_dir(client_id)
+    os.makedirs(base, exist_ok=True)
+    if fcntl is None:
+        with _thread_locks_guard:
+            lock = _thread_locks.setdefault(base, threading.Lock())
+        with lock:
+            yield
+        return
+    with open(os.path.join(base, ".lock"), "a+b") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
 def ensure_client_dirs(client_id: str) -> Dict[str, str]:
     base = _client_dir(client_id)
     paths = {
@@ -16,26 +85,136 @@ def ensure_client_dirs(client_id: str) -> Dict[str, str]:
         "portfolios": os.path.join(base, "portfolios"),
         "reports": os.path.join(base, "reports"),
     }
+    is_new = not os.path.exists(base)
     for p in paths.values():
         os.makedirs(p, exist_ok=True)
+    if is_new:
+        # carpeta creada fuera de save_client_meta: queda en el índice con su id como nombre
+        conn = _index_conn()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO clients (client_id, name, id_key, name_key) VALUES (?, ?, ?, ?)",
+                (client_id, client_id, client_id.casefold(), client_id.casefold()),
+            )
     return paths
 
-def list_clients() -> List[Dict]:
-    if not os.path.exists(BASE_DIR):
-        return []
+# ---- Índice de clientes (SQLite) ----
+# data/clients/_index.sqlite evita abrir cada client.json en cada rerun.
+INDEX_FILE = "_index.sqlite"
+_local = threading.local()
+
+def _create_index_schema(conn: sqlite3.Connection) -> None:
+    conn.execute("PRAGMA journal_mode=WAL")  # lectores no bloquean al escritor
+    with conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS clients ("
+            " client_id TEXT PRIMARY KEY, name TEXT, email TEXT, notes TEXT, updated_at TEXT,"
+            " id_key TEXT, name_key TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS clients_id_key ON clients(id_key)")
+        conn.execute("CREATE INDEX IF NOT EXISTS clients_name_key ON clients(name_key)")
+        conn.execute("CREATE TABLE IF NOT EXISTS index_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+def _open_index() -> sqlite3.Connection:
+    # una conexión por hilo (sesión de Streamlit) y por ruta del índice
+    path = os.path.join(BASE_DIR, INDEX_FILE)
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        if not os.path.exists(path):
+            # índice borrado (o BASE_DIR nuevo): se vuelve a crear y armar
+            clear_resources(("client_index_schema", os.path.abspath(path)))
+            clear_resources(("client_index", os.path.abspath(path)))
+        os.makedirs(BASE_DIR, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        # el esquema se crea una vez por proceso, no en cada hilo de rerun
+        get_resource(("client_index_schema", os.path.abspath(path)), lambda: _create_index_schema(conn) or path)
+        conns[path] = conn
+    return conn
+
+def _index_conn() -> sqlite3.Connection:
+    conn = _open_index()
+    key = ("client_index", _index_path())
+
+    def _ensure_built():
+        if conn.execute("SELECT 1 FROM index_meta WHERE key = 'built'").fetchone() is None:
+            reindex_clients()
+        return True
+
+    # el chequeo/armado inicial del índice también es una vez por proceso
+    get_resource(key, _ensure_built)
+    return conn
+
+def _upsert_client(conn: sqlite3.Connection, meta: Dict) -> None:
+    cid = str(meta.get("client_id", ""))
+    name = str(meta.get("name") or cid)
+    conn.execute(
+        "INSERT INTO clients (client_id, name, email, notes, updated_at, id_key, name_key)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)"
+        " ON CONFLICT(client_id) DO UPDATE SET name = excluded.name, email = excluded.email,"
+        " notes = excluded.notes, updated_at = excluded.updated_at,"
+        " id_key = excluded.id_key, name_key = excluded.name_key",
+        (cid, name, meta.get("email"), meta.get("notes"), meta.get("updated_at"), cid.casefold(), name.casefold()),
+    )
+
+def reindex_clients() -> int:
+    """
+    Reconstruye el índice leyendo cada client.json (solo la primera vez o a pedido).
+    """
+    conn = _open_index()
+    metas = []
+    if os.path.exists(BASE_DIR):
+        for cid in sorted(os.listdir(BASE_DIR)):
+            if cid.startswith((".", "_")) or not os.path.isdir(_client_dir(cid)):
+                continue
+            meta_path = os.path.join(_client_dir(cid), "client.json")
+            meta = {"client_id": cid, "name": cid}
+            if os.path.exists(meta_path):
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                except:
+                    pass
+            metas.append(meta)
+    with conn:
+        conn.execute("DELETE FROM clients")
+        for meta in metas:
+            _upsert_client(conn, meta)
+        conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('built', ?)", (datetime.utcnow().isoformat() + "Z",))
+    return len(metas)
+
+def _prefix_filter(prefix: str | None):
+    if not prefix:
+        return "", ()
+    lo = prefix.strip().casefold()
+    hi = lo + "\U0010ffff"
+    # rangos sobre columnas indexadas (un LIKE no usaría el índice)
+    return " WHERE (id_key >= ? AND id_key < ?) OR (name_key >= ? AND name_key < ?)", (lo, hi, lo, hi)
+
+def list_clients(prefix: str | None = None, limit: int | None = None, offset: int = 0) -> List[Dict]:
+    """
+    Clientes ordenados por client_id, desde el índice. prefix filtra por inicio
+    de nombre o id (sin distinguir mayúsculas); limit/offset para paginar.
+    """
+    conn = _index_conn()
+    where, params = _prefix_filter(prefix)
+    sql = "SELECT client_id, name, email, notes, updated_at FROM clients" + where + " ORDER BY client_id"
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params = params + (int(limit), int(offset))
     out = []
-    for cid in sorted(os.listdir(BASE_DIR)):
-        meta_path = os.path.join(_client_dir(cid), "client.json")
-        if os.path.exists(meta_path):
-            try:
-                with open(meta_path, "r", encoding="utf-8") as f:
-                    out.append(json.load(f))
-            except:
-                out.append({"client_id": cid, "name": cid})
-        else:
-            out.append({"client_id": cid, "name": cid})
+    for row in conn.execute(sql, params):
+        meta = {k: row[k] for k in row.keys() if row[k] is not None}
+        out.append(meta)
     return out
 
+def count_clients(prefix: str | None = None) -> int:
+    where, params = _prefix_filter(prefix)
+    return _index_conn().execute("SELECT COUNT(*) FROM clients" + where, params).fetchone()[0]
+
 def save_client_meta(client_id: str, name: str, email: str = "", notes: str = "") -> Dict:
     ensure_client_dirs(client_id)
     meta = {
@@ -46,62 +225,368 @@ def save_client_meta(client_id: str, name: str, email: str = "", notes: str = ""
         "updated_at": datetime.utcnow().isoformat() + "Z",
     }
     meta_path = os.path.join(_client_dir(client_id), "client.json")
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
+    _atomic_write_json(meta_path, meta)
+    conn = _index_conn()
+    with conn:
+        _upsert_client(conn, meta)
     return meta
 
+# ---- Historial: segmentos jsonl + índice de offsets ----
+# history.jsonl es el segmento activo; al pasar HISTORY_SEGMENT_BYTES se sella como
+# history.NNNNNN.jsonl. Cada segmento tiene un .idx con un registro fijo por línea
+# (offset, largo, timestamp, evento) para leer la cola o filtrar sin parsear todo.
+HISTORY_FILE = "history.jsonl"
+HISTORY_SEGMENT_BYTES = 4 * 1024 * 1024
+HISTORY_MAX_SEGMENTS = 8
+_IDX_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("ts", "<i8"), ("event", "S24")])
+
+def _ts_micros(ts) -> int:
+    try:
+        dt = datetime.fromisoformat(str(ts).rstrip("Z"))
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        return int((dt - datetime(1970, 1, 1)).total_seconds() * 1_000_000)
+    except Exception:
+        return 0
+
+def _run_order(created_at, run_id) -> tuple:
+    """
+    Clave para ordenar runs de un cliente. created_at se compara como instante
+    (isoformat omite los microsegundos cuando son 0, así que el texto no ordena).
+    El run_id (resolución de segundos) solo decide entre runs sin created_at, y
+    un run con created_at va después de uno sin él.
+    """
+    ts = _ts_micros(created_at) if created_at else 0
+    return (ts > 0, ts, str(run_id or ""))
+
+def _idx_record(offset: int, line: bytes) -> np.ndarray:
+    rec = np.zeros(1, dtype=_IDX_DTYPE)
+    rec["offset"] = offset
+    rec["length"] = len(line)
+    try:
+        row = json.loads(line)
+        rec["ts"] = _ts_micros(row.get("ts"))
+        rec["event"] = str(row.get("event", "")).encode("utf-8")[:24]
+    except Exception:
+        rec["ts"] = -1  # línea corrupta: queda indexada pero no se devuelve
+    return rec
+
+def _idx_path(seg_path: str) -> str:
+    return seg_path[:-len(".jsonl")] + ".idx"
+
+def _history_segments(client_id: str) -> List[str]:
+    """
+    Segmentos del historial, del más viejo al activo.
+    """
+    base = _client_dir(client_id)
+    if not os.path.isdir(base):
+        return []
+    sealed = sorted(f for f in os.listdir(base) if f.startswith("history.0") and f.endswith(".jsonl"))
+    segs = [os.path.join(base, f) for f in sealed]
+    active = os.path.join(base, HISTORY_FILE)
+    if os.path.exists(active):
+        segs.append(active)
+    return segs
+
+def _index_gap(seg_path: str):
+    """
+    Estado del .idx frente al jsonl: (registros completos, si hay un registro a
+    medio escribir, registros que faltan indexar). No escribe nada, así que lo
+    pueden usar los lectores sin lock. Una línea final sin "\\n" (append en curso)
+    se ignora.
+    """
+    idx_path = _idx_path(seg_path)
+    rec_size = _IDX_DTYPE.itemsize
+    idx_size = os.path.getsize(idx_path) if os.path.exists(idx_path) else 0
+    count, partial = divmod(idx_size, rec_size)
+
+    end = 0
+    if count:
+        with open(idx_path, "rb") as f:
+            f.seek((count - 1) * rec_size)
+            last = np.frombuffer(f.read(rec_size), dtype=_IDX_DTYPE)[0]
+        end = int(last["offset"]) + int(last["length"]) + 1
+
+    recs = []
+    if end < os.path.getsize(seg_path):
+        with open(seg_path, "rb") as f:
+            f.seek(end)
+            offset = end
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                body = line.rstrip(b"\n")
+                if body.strip():
+                    recs.append(_idx_record(offset, body))
+                offset += len(line)
+    return count, bool(partial), recs
+
+def _sync_index(seg_path: str) -> None:
+    """
+    Pone al día el .idx del segmento (archivos viejos, corte a mitad de un
+    append). Solo se llama con el lock del cliente tomado.
+    """
+    count, partial, recs = _index_gap(seg_path)
+    if not recs and not partial:
+        return
+    idx_path = _idx_path(seg_path)
+    with open(idx_path, "r+b" if os.path.exists(idx_path) else "wb") as f:
+        f.truncate(count * _IDX_DTYPE.itemsize)
+        f.seek(count * _IDX_DTYPE.itemsize)
+        for rec in recs:
+            f.write(rec.tobytes())
+
+def _load_index(seg_path: str, tail: int | None = None) -> np.ndarray:
+    """
+    Registros del índice del segmento (todos, o solo los últimos `tail`),
+    incluyendo en memoria las líneas que todavía no llegaron al .idx.
+    """
+    count, _, recs = _index_gap(seg_path)
+    extra = np.concatenate(recs) if recs else np.zeros(0, dtype=_IDX_DTYPE)
+    if tail is not None and extra.size >= tail:
+        return extra[extra.size - tail:]
+    start = max(0, count - (tail - extra.size)) if tail is not None else 0
+    raw = b""
+    if count:
+        with open(_idx_path(seg_path), "rb") as f:
+            f.seek(start * _IDX_DTYPE.itemsize)
+            raw = f.read((count - start) * _IDX_DTYPE.itemsize)
+    return np.concatenate([np.frombuffer(raw, dtype=_IDX_DTYPE), extra])
+
+def _read_rows(seg_path: str, recs: np.ndarray) -> List[Dict]:
+    rows = []
+    if not recs.size:
+        return rows
+    with open(seg_path, "rb") as f:
+        # registros contiguos (caso cola): una sola lectura del rango
+        start = int(recs["offset"][0])
+        stop = int(recs["offset"][-1] + recs["length"][-1])
+        contiguous = stop - start <= int(recs["length"].sum()) + recs.size
+        blob = None
+        if contiguous:
+            f.seek(start)
+            blob = f.read(stop - start)
+        for r in recs:
+            if blob is not None:
+                off = int(r["offset"]) - start
+                line = blob[off: off + int(r["length"])]
+            else:
+                f.seek(int(r["offset"]))
+                line = f.read(int(r["length"]))
+            try:
+                rows.append(json.loads(line))
+            except:
+                pass
+    return rows
+
+def _rotate_history(client_id: str) -> None:
+    base = _client_dir(client_id)
+    active = os.path.join(base, HISTORY_FILE)
+    _sync_index(active)
+    segs = _history_segments(client_id)[:-1]
+    n = int(os.path.basename(segs[-1]).split(".")[1]) + 1 if segs else 1
+    sealed = os.path.join(base, f"history.{n:06d}.jsonl")
+    os.replace(_idx_path(active), _idx_path(sealed))
+    os.replace(active, sealed)
+    if len(segs) + 1 > HISTORY_MAX_SEGMENTS:
+        _compact_sealed(client_id)
+
+def compact_history(client_id: str) -> None:
+    """
+    Une todos los segmentos sellados en uno solo, descartando líneas corruptas.
+    El segmento activo no se toca.
+    """
+    with _client_lock(client_id):
+        _compact_sealed(client_id)
+
+def _compact_sealed(client_id: str) -> None:
+    segs = _history_segments(client_id)
+    sealed = [p for p in segs if os.path.basename(p) != HISTORY_FILE]
+    if len(sealed) <= 1:
+        return
+    dst = sealed[0]
+    tmp = os.path.join(os.path.dirname(dst), "history.compact.jsonl")
+    recs = []
+    offset = 0
+    with open(tmp, "wb") as out:
+        for seg in sealed:
+            idx = _load_index(seg)
+            with open(seg, "rb") as f:
+                for r in idx[idx["ts"] >= 0]:
+                    f.seek(int(r["offset"]))
+                    line = f.read(int(r["length"]))
+                    out.write(line + b"\n")
+                    rec = r.copy()
+                    rec["offset"] = offset
+                    recs.append(rec)
+                    offset += len(line) + 1
+    with open(_idx_path(tmp), "wb") as f:
+        f.write(np.array(recs, dtype=_IDX_DTYPE).tobytes())
+    os.replace(_idx_path(tmp), _idx_path(dst))
+    os.replace(tmp, dst)
+    for seg in sealed[1:]:
+        os.remove(seg)
+        if os.path.exists(_idx_path(seg)):
+            os.remove(_idx_path(seg))
+
 def append_history(client_id: str, event: Dict) -> None:
     ensure_client_dirs(client_id)
     row = {"ts": datetime.utcnow().isoformat() + "Z", **event}
-    hist_path = os.path.join(_client_dir(client_id), "history.jsonl")
-    with open(hist_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    hist_path = os.path.join(_client_dir(client_id), HISTORY_FILE)
+    line = json.dumps(row, ensure_ascii=False).encode("utf-8")
+    with _client_lock(client_id):
+        if os.path.exists(hist_path):
+            _sync_index(hist_path)  # asegura que el índice esté al día antes de sumar
+        # línea completa en un solo write: un lector ve la línea entera o nada
+        with open(hist_path, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(line + b"\n")
+        with open(_idx_path(hist_path), "ab") as f:
+            f.write(_idx_record(offset, line).tobytes())
+        if offset + len(line) + 1 >= HISTORY_SEGMENT_BYTES:
+            _rotate_history(client_id)
+    # eventos de un run con métricas (ej. diagnóstico guardado) también van al índice de runs
+    if event.get("run_id") and any(k in event for k in ("score", "vol", "top3")):
+        _index_run_or_mark(client_id, {"created_at": row["ts"], **event})
+
+def _index_run_or_mark(client_id: str, summary: Dict) -> None:
+    # el run ya quedó guardado: si el índice falla (ej. SQLite bloqueado por otra
+    # sesión) se marca para reconstruirse desde los summary.json en el próximo uso
+    from src.utils.run_index import index_run, mark_runs_dirty
+    try:
+        index_run(client_id, summary)
+    except Exception:
+        _log.exception("No se pudo indexar el run %s de %s", summary.get("run_id"), client_id)
+        mark_runs_dirty()
+
+def _retry_on_rotation(read):
+    # sin lock: si una rotación/compactación mueve un segmento mientras se lee, se relee
+    for _ in range(5):
+        try:
+            return read()
+        except FileNotFoundError:
+            continue
+    return read()
 
 def read_history(client_id: str, limit: int = 50) -> List[Dict]:
-    hist_path = os.path.join(_client_dir(client_id), "history.jsonl")
-    if not os.path.exists(hist_path):
+    """
+    Últimos `limit` eventos (del más viejo al más nuevo). Lee la cola del índice
+    y solo esas líneas: el costo es O(limit), no O(tamaño del archivo).
+    """
+    return _retry_on_rotation(lambda: _read_history(client_id, limit))
+
+def _read_history(client_id: str, limit: int) -> List[Dict]:
+    out: List[Dict] = []
+    for seg in reversed(_history_segments(client_id)):
+        need = limit - len(out)
+        if need <= 0:
+            break
+        # se leen los últimos `need` registros; si hay corruptos, se amplía la ventana
+        tail = need
+        while True:
+            idx = _load_index(seg, tail)
+            valid = idx[idx["ts"] >= 0]
+            if valid.size >= need or idx.size < tail:
+                break
+            tail *= 2
+        out = _read_rows(seg, valid[-need:]) + out
+    return out[-limit:] if limit > 0 else []
+
+def query_history(client_id: str, since: datetime | None = None, until: datetime | None = None,
+                  event: str | None = None, limit: int | None = None) -> List[Dict]:
+    """
+    Eventos filtrados por rango de tiempo [since, until) y/o tipo de evento,
+    resueltos sobre el índice. Con limit devuelve los más recientes.
+    """
+    return _retry_on_rotation(lambda: _query_history(client_id, since, until, event, limit))
+
+def _query_history(client_id: str, since: datetime | None, until: datetime | None,
+                   event: str | None, limit: int | None) -> List[Dict]:
+    lo = _ts_micros(since.isoformat()) if since else None
+    hi = _ts_micros(until.isoformat()) if until else None
+    key = event.encode("utf-8")[:24] if event is not None else None
+    if limit is not None and limit <= 0:
         return []
-    rows = []
-    with open(hist_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    rows.append(json.loads(line))
-                except:
-                    pass
-    return rows[-limit:]
+
+    out: List[Dict] = []
+    for seg in reversed(_history_segments(client_id)):
+        idx = _load_index(seg)
+        valid = idx["ts"] >= 0  # -1: línea corrupta, no cuenta para el rango
+        mask = valid.copy()
+        if lo is not None:
+            mask &= idx["ts"] >= lo
+        if hi is not None:
+            mask &= idx["ts"] < hi
+        if key is not None:
+            mask &= idx["event"] == key
+        recs = idx[mask]
+        if limit is not None:
+            recs = recs[-(limit - len(out)):]
+        rows = _read_rows(seg, recs)
+        if event is not None:
+            rows = [r for r in rows if r.get("event") == event]  # el índice trunca a 24 bytes
+        out = rows + out
+        if limit is not None and len(out) >= limit:
+            break
+        if lo is not None and valid.any() and idx["ts"][valid].min() < lo:
+            break  # los segmentos anteriores son todos más viejos
+    return out[-limit:] if limit is not None else out
 
 def save_uploaded_bytes(dst_path: str, b: bytes) -> None:
-    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-    with open(dst_path, "wb") as f:
-        f.write(b)
+    _atomic_write_bytes(dst_path, b)
 import os
 import json
 from datetime import datetime
 
 def new_run_dir(client_id: str) -> dict:
     paths = ensure_client_dirs(client_id)
-    run_id = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-    run_base = os.path.join(paths["base"], "runs", run_id)
-    os.makedirs(run_base, exist_ok=True)
-    return {"run_id": run_id, "run_base": run_base}
+    runs_dir = os.path.join(paths["base"], "runs")
+    os.makedirs(runs_dir, exist_ok=True)
+    # timestamp + sufijo aleatorio: dos sesiones en el mismo segundo no comparten run.
+    # makedirs sin exist_ok garantiza que el directorio es nuestro.
+    while True:
+        run_id = f"{datetime.now().strftime('%Y-%m-%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        run_base = os.path.join(runs_dir, run_id)
+        try:
+            os.makedirs(run_base)
+        except FileExistsError:
+            continue
+        return {"run_id": run_id, "run_base": run_base}
 
-def save_run_artifacts(run_base: str, excel_bytes: bytes = None, perfil_data: dict = None, pdf_bytes: bytes = None, summary: dict = None) -> None:
+def save_run_artifacts(run_base: str, excel_bytes: bytes = None, perfil_data: dict = None, pdf_bytes: bytes = None, summary: dict = None, holdings: List[Dict] = None) -> None:
     os.makedirs(run_base, exist_ok=True)
 
+    # snapshot columnar de los activos ya parseados: reabrir el run no necesita openpyxl
+    if holdings is not None:
+        # import diferido: pyarrow solo se carga al guardar un run, no al listar clientes
+        from src.utils.snapshot_store import write_holdings_snapshot
+        write_holdings_snapshot(run_base, holdings)
+
     if excel_bytes is not None:
-        with open(os.path.join(run_base, "portfolio.xlsx"), "wb") as f:
-            f.write(excel_bytes)
+        _atomic_write_bytes(os.path.join(run_base, "portfolio.xlsx"), excel_bytes)
 
     if perfil_data is not None:
-        with open(os.path.join(run_base, "perfil.json"), "w", encoding="utf-8") as f:
-            json.dump(perfil_data, f, ensure_ascii=False, indent=2)
+        _atomic_write_json(os.path.join(run_base, "perfil.json"), perfil_data)
 
     if pdf_bytes is not None:
-        with open(os.path.join(run_base, "reporte.pdf"), "wb") as f:
-            f.write(pdf_bytes)
+        _atomic_write_bytes(os.path.join(run_base, "reporte.pdf"), pdf_bytes)
 
+    # summary.json al final: su presencia marca el run como completo
     if summary is not None:
-        with open(os.path.join(run_base, "summary.json"), "w", encoding="utf-8") as f:
-            json.dump(summary, f, ensure_ascii=False, indent=2)
+        _atomic_write_json(os.path.join(run_base, "summary.json"), summary)
+        client_id = summary.get("client_id") or os.path.basename(os.path.dirname(os.path.dirname(run_base)))
+        from src.utils.book_analytics import update_book
+        summary = {"run_id": os.path.basename(run_base), **summary}
+        try:
+            update_book(client_id, summary)
+        except Exception:
+            pass  # el run ya quedó guardado; el libro se pone al día con sync_book()
+        _index_run_or_mark(client_id, summary)
+        if holdings is not None:
+            from src.utils.holdings_index import index_holdings, mark_holdings_dirty
+            try:
+                index_holdings(client_id, summary["run_id"], holdings, summary.get("created_at"))
+            except Exception:
+                # idem: se reconstruye desde los snapshots en el próximo uso
+                _log.exception("No se pudieron indexar las posiciones del run %s de %s", summary["run_id"], client_id)
+                mark_holdings_dirty()
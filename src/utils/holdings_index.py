@@ -0,0 +1,456 @@
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from src.utils.client_store import _client_dir, _index_conn, _index_path, _run_order
+from src.utils.resources import clear_resources, get_resource
+
+# ---- Índice inverso activo -> clientes (mismo _index.sqlite) ----
+# client_holdings: una fila por posición del último run de cada cliente, con el
+# Activo normalizado (asset_key) indexado: "¿quién tiene X?" es una búsqueda por
+# índice, sin abrir portfolio.xlsx. holdings_runs guarda qué run indexó cada
+# cliente (para que un run viejo no pise a uno nuevo) y en qué versión del índice
+# (seq). Lo mantiene al día save_run_artifacts; cada cambio sube holdings_version
+# y la matriz cliente x activo en memoria relee solo los clientes con seq mayor.
+
+HOLDING_CATEGORIES = ("Pais", "Tipo", "Moneda")
+
+_log = logging.getLogger(__name__)
+
+_matrices: Dict[str, "HoldingsMatrix"] = {}  # ruta del índice -> última matriz armada
+_matrix_lock = threading.Lock()
+
+
+def asset_key(activo: Any) -> str:
+    # misma clave para "YPF  ", "ypf" e "YPF": sin espacios sobrantes ni mayúsculas
+    return " ".join(str(activo).split()).casefold() if activo is not None else ""
+
+
+def _create_holdings_schema(conn: sqlite3.Connection) -> None:
+    with conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS holdings_runs ("
+            " client_id TEXT PRIMARY KEY, run_id TEXT NOT NULL, created_at TEXT, valor REAL, seq INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS client_holdings ("
+            " client_id TEXT NOT NULL, pos INTEGER NOT NULL, asset_key TEXT NOT NULL, activo TEXT,"
+            " peso REAL, valor REAL, vol REAL, pais TEXT, tipo TEXT, moneda TEXT,"
+            " PRIMARY KEY (client_id, pos)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS client_holdings_asset ON client_holdings(asset_key, client_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS holdings_runs_seq ON holdings_runs(seq)")
+
+
+def _holdings_conn() -> sqlite3.Connection:
+    conn = _index_conn()
+    path = _index_path()
+    get_resource(("holdings_index_schema", path), lambda: _create_holdings_schema(conn) or path)
+
+    def _ensure_built():
+        if conn.execute("SELECT 1 FROM index_meta WHERE key = 'holdings_built'").fetchone() is None:
+            reindex_holdings()
+        return True
+
+    # la primera vez se cargan los snapshots de los runs existentes (una vez por proceso)
+    get_resource(("holdings_index", path), _ensure_built)
+    return conn
+
+
+def _num(x) -> float | None:
+    try:
+        v = float(x)
+    except (TypeError, ValueError):
+        return None
+    return None if v != v else v
+
+
+def _label(x) -> str | None:
+    if x is None or (isinstance(x, float) and x != x):
+        return None
+    return str(x)
+
+
+def _meta_int(conn: sqlite3.Connection, key: str) -> int:
+    row = conn.execute("SELECT value FROM index_meta WHERE key = ?", (key,)).fetchone()
+    return int(row[0]) if row is not None else 0
+
+
+def _bump_version(conn: sqlite3.Connection) -> int:
+    conn.execute(
+        "INSERT INTO index_meta (key, value) VALUES ('holdings_version', '1')"
+        " ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+    )
+    return _meta_int(conn, "holdings_version")
+
+
+def _replace_holdings(conn: sqlite3.Connection, client_id: str, run_id: str, created_at: str | None,
+                      holdings: List[Dict], seq: int) -> None:
+    valores = [v for v in (_num(a.get("Valor en USD")) for a in holdings) if v is not None]
+    conn.execute("DELETE FROM client_holdings WHERE client_id = ?", (client_id,))
+    conn.executemany(
+        "INSERT INTO client_holdings (client_id, pos, asset_key, activo, peso, valor, vol, pais, tipo, moneda)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (client_id, i, asset_key(a.get("Activo")), _label(a.get("Activo")), _num(a.get("Peso")),
+             _num(a.get("Valor en USD")), _num(a.get("VolatilidadFinal")),
+             _label(a.get("Pais")), _label(a.get("Tipo")), _label(a.get("Moneda")))
+            for i, a in enumerate(holdings)
+            if asset_key(a.get("Activo"))
+        ],
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO holdings_runs (client_id, run_id, created_at, valor, seq) VALUES (?, ?, ?, ?, ?)",
+        (client_id, run_id, created_at, sum(valores) if valores else None, seq),
+    )
+
+
+def index_holdings(client_id: str, run_id: str, holdings: List[Dict], created_at: str | None = None) -> bool:
+    """
+    Reemplaza las posiciones indexadas del cliente por las de este run.
+    Devuelve False si el índice ya tenía un run más nuevo de ese cliente.
+    """
+    created_at = str(created_at) if created_at else None
+    conn = _holdings_conn()
+    with conn:
+        old = conn.execute("SELECT run_id, created_at FROM holdings_runs WHERE client_id = ?", (client_id,)).fetchone()
+        if old is not None and _run_order(old["created_at"], old["run_id"]) > _run_order(created_at, run_id):
+            return False  # llegó tarde un run más viejo: el índice ya tiene uno más nuevo
+        _replace_holdings(conn, client_id, str(run_id), created_at, holdings, _bump_version(conn))
+    return True
+
+
+def reindex_holdings() -> int:
+    """
+    Reconstruye el índice desde el último run de cada cliente (snapshot Arrow; los
+    runs viejos sin snapshot leen portfolio.xlsx una vez y lo dejan escrito).
+    """
+    from src.utils.book_analytics import _client_ids, _latest_summary
+    from src.utils.snapshot_store import load_run_holdings, snapshot_path
+
+    conn = _index_conn()
+    _create_holdings_schema(conn)
+    rows: List[Tuple[str, Dict[str, Any], List[Dict]]] = []
+    for cid in _client_ids():
+        summary = _latest_summary(cid)
+        if summary is None:
+            continue
+        run_base = os.path.join(_client_dir(cid), "runs", summary["run_id"])
+        if not (os.path.exists(snapshot_path(run_base)) or os.path.exists(os.path.join(run_base, "portfolio.xlsx"))):
+            continue
+        try:
+            rows.append((cid, summary, load_run_holdings(run_base)))
+        except Exception:
+            continue  # run ilegible: el cliente queda fuera hasta su próximo run
+    with conn:
+        conn.execute("DELETE FROM client_holdings")
+        conn.execute("DELETE FROM holdings_runs")
+        seq = _bump_version(conn)
+        for cid, summary, holdings in rows:
+            run_id = summary["run_id"]
+            _replace_holdings(conn, cid, run_id, summary.get("created_at"), holdings, seq)
+        # las matrices en memoria anteriores a esta versión se arman de cero
+        conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('holdings_reset', ?)", (str(seq),))
+        conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('holdings_built', ?)",
+                     (datetime.utcnow().isoformat() + "Z",))
+    return len(rows)
+
+
+def mark_holdings_dirty() -> None:
+    """
+    Pide reconstruir el índice de posiciones (ej. falló index_holdings): borra
+    holdings_built, así el próximo _holdings_conn() llama a reindex_holdings().
+    """
+    clear_resources(("holdings_index", _index_path()))
+    try:
+        conn = _index_conn()
+        with conn:
+            conn.execute("DELETE FROM index_meta WHERE key = 'holdings_built'")
+    except Exception:
+        _log.exception("No se pudo marcar el índice de posiciones para reconstruir")
+
+
+# ---- consultas puntuales (SQL sobre el índice por asset_key) ----
+
+def who_holds(activo: str, limit: int | None = None) -> List[Dict[str, Any]]:
+    """
+    Clientes que tienen el activo en su último run, de mayor a menor peso.
+    Si el activo aparece en varias filas de una cartera, se suman.
+    """
+    sql = (
+        "SELECT h.client_id, r.run_id, MIN(TRIM(h.activo)) AS activo, SUM(h.peso) AS peso, SUM(h.valor) AS valor"
+        " FROM client_holdings h JOIN holdings_runs r ON r.client_id = h.client_id"
+        " WHERE h.asset_key = ? GROUP BY h.client_id ORDER BY peso DESC, h.client_id"
+    )
+    params: list = [asset_key(activo)]
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    return [
+        {"client_id": row["client_id"], "run_id": row["run_id"], "Activo": row["activo"],
+         "Peso": row["peso"], "Valor en USD": row["valor"]}
+        for row in _holdings_conn().execute(sql, params)
+    ]
+
+
+def firm_exposure(activo: str) -> Dict[str, Any]:
+    """
+    Exposición total de la firma al activo: valor en USD, clientes que lo tienen,
+    peso promedio y máximo entre ellos y fracción del valor total de la firma.
+    """
+    holders = who_holds(activo)
+    weights = np.array([h["Peso"] for h in holders if h["Peso"] is not None], dtype=float)
+    valor = sum(h["Valor en USD"] for h in holders if h["Valor en USD"] is not None)
+    # valor total de la firma: una fila por cliente en holdings_runs
+    total = _holdings_conn().execute("SELECT SUM(valor) FROM holdings_runs").fetchone()[0]
+    return {
+        "Activo": activo,
+        "clientes": len(holders),
+        "valor_usd": valor,
+        "peso_promedio": float(weights.mean()) if weights.size else None,
+        "peso_max": float(weights.max()) if weights.size else None,
+        "fraccion_firma": valor / total if total else None,
+    }
+
+
+# ---- matriz cliente x activo (memoria, se actualiza por cliente) ----
+
+class HoldingsMatrix:
+    """
+    Matriz dispersa cliente x activo en coordenadas: por cada posición, su fila
+    (cliente), columna (activo) y peso, más las columnas que usan los escenarios.
+    Las sumas por cliente son np.bincount sobre la fila, así que un run nuevo solo
+    descarta las posiciones viejas de su cliente y agrega las nuevas.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.clients: List[str] = []
+        self._client_row: Dict[str, int] = {}
+        self.asset_keys: List[str] = []
+        self.asset_labels: List[str] = []
+        self._asset_col: Dict[str, int] = {}
+        # etiquetas crudas de Pais/Tipo/Moneda, como Portfolio.categories
+        self._labels: Dict[str, List[Any]] = {key: [] for key in HOLDING_CATEGORIES}
+        self._label_code: Dict[str, Dict[Any, int]] = {key: {} for key in HOLDING_CATEGORIES}
+        self.row = np.zeros(0, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.peso = np.zeros(0)
+        self.valor = np.zeros(0)
+        self.vol = np.zeros(0)
+        self.codes = {key: np.zeros(0, dtype=np.int32) for key in HOLDING_CATEGORIES}
+        self._portfolio = None
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection) -> "HoldingsMatrix":
+        m = cls()
+        m._merge(conn, since=None)
+        return m
+
+    def updated(self, conn: sqlite3.Connection) -> "HoldingsMatrix":
+        """
+        Copia con los clientes indexados después de esta versión. Las sesiones que
+        tienen la matriz anterior la siguen usando sin cambios.
+        """
+        m = HoldingsMatrix()
+        m.clients, m._client_row = list(self.clients), dict(self._client_row)
+        m.asset_keys, m.asset_labels, m._asset_col = list(self.asset_keys), list(self.asset_labels), dict(self._asset_col)
+        m._labels = {k: list(v) for k, v in self._labels.items()}
+        m._label_code = {k: dict(v) for k, v in self._label_code.items()}
+        m.row, m.indices, m.peso, m.valor, m.vol, m.codes = self.row, self.indices, self.peso, self.valor, self.vol, self.codes
+        m._merge(conn, since=self.version)
+        return m
+
+    def _merge(self, conn: sqlite3.Connection, since: int | None) -> None:
+        cur = conn.cursor()
+        cur.row_factory = None  # tuplas: sin un sqlite3.Row por posición
+        cur.execute("BEGIN")  # versión, clientes y posiciones de la misma foto (WAL)
+        try:
+            version = _meta_int(conn, "holdings_version")
+            cols = "h.client_id, h.asset_key, TRIM(h.activo), h.peso, h.valor, h.vol, h.pais, h.tipo, h.moneda"
+            if since is None:
+                changed: List[str] = []
+                rows = cur.execute(f"SELECT {cols} FROM client_holdings h ORDER BY h.client_id, h.pos").fetchall()
+            else:
+                changed = [r[0] for r in cur.execute("SELECT client_id FROM holdings_runs WHERE seq > ?", (since,))]
+                rows = cur.execute(
+                    f"SELECT {cols} FROM client_holdings h WHERE h.client_id IN"
+                    " (SELECT client_id FROM holdings_runs WHERE seq > ?) ORDER BY h.client_id, h.pos", (since,)
+                ).fetchall()
+        finally:
+            cur.execute("COMMIT")
+
+        def code(index: Dict[Any, int], labels: List[Any], value: Any) -> int:
+            c = index.get(value)
+            if c is None:
+                c = index[value] = len(labels)
+                labels.append(value)
+            return c
+
+        for cid in changed:
+            code(self._client_row, self.clients, cid)
+        stale = np.isin(self.row, [self._client_row[c] for c in changed]) if changed else None
+
+        n = len(rows)
+        row = np.fromiter((code(self._client_row, self.clients, r[0]) for r in rows), dtype=np.int64, count=n)
+        cols_new = []
+        for r in rows:
+            j = self._asset_col.get(r[1])
+            if j is None:
+                j = self._asset_col[r[1]] = len(self.asset_keys)
+                self.asset_keys.append(r[1])
+                self.asset_labels.append(r[2])
+            cols_new.append(j)
+        nums = np.array([r[3:6] for r in rows], dtype=float).reshape(n, 3)  # None -> NaN
+        codes = {
+            key: np.fromiter((code(self._label_code[key], self._labels[key], r[6 + i]) for r in rows),
+                             dtype=np.int32, count=n)
+            for i, key in enumerate(HOLDING_CATEGORIES)
+        }
+
+        keep = slice(None) if stale is None else ~stale
+        self.row = np.concatenate([self.row[keep], row])
+        self.indices = np.concatenate([self.indices[keep], np.array(cols_new, dtype=np.int64)])
+        self.peso = np.concatenate([self.peso[keep], nums[:, 0]])
+        self.valor = np.concatenate([self.valor[keep], nums[:, 1]])
+        self.vol = np.concatenate([self.vol[keep], nums[:, 2]])
+        self.codes = {key: np.concatenate([self.codes[key][keep], codes[key]]) for key in HOLDING_CATEGORIES}
+        self.version = version
+        self._portfolio = None
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.clients), len(self.asset_keys)
+
+    @property
+    def portfolio(self):
+        """
+        Todas las posiciones como una sola "cartera": compile_scenarios agrupa por
+        Pais/Tipo/Moneda igual que para cada cliente por separado.
+        """
+        if self._portfolio is None:
+            from engine_v1 import Portfolio, _group_labels
+
+            n = len(self.row)
+            categories = {key: (self.codes[key], self._labels[key]) for key in HOLDING_CATEGORIES}
+            self._portfolio = Portfolio(
+                np.array(self.asset_labels, dtype=object)[self.indices].tolist(),
+                self.peso,
+                self.vol,
+                np.full(n, np.nan),
+                np.full(n, np.nan),
+                np.ones(n, dtype=bool),
+                categories,
+                {key: _group_labels(*categories[key]) for key in HOLDING_CATEGORIES},
+            )
+        return self._portfolio
+
+    def _row_sums(self, values: np.ndarray) -> np.ndarray:
+        # suma por cliente; values: (posiciones,) o (posiciones x k)
+        n = len(self.clients)
+        if values.ndim == 1:
+            return np.bincount(self.row, weights=values, minlength=n)
+        return np.stack([np.bincount(self.row, weights=values[:, j], minlength=n)
+                         for j in range(values.shape[1])], axis=1).reshape(n, values.shape[1])
+
+    def client_weights(self, activo: str) -> Dict[str, float]:
+        """
+        Columna de la matriz: {client_id: peso} de los clientes que tienen el activo.
+        """
+        j = self._asset_col.get(asset_key(activo))
+        if j is None:
+            return {}
+        hit = np.flatnonzero(self.indices == j)
+        w = np.bincount(self.row[hit], weights=np.nan_to_num(self.peso[hit], nan=0.0), minlength=len(self.clients))
+        return {self.clients[i]: float(w[i]) for i in np.unique(self.row[hit])}
+
+    def propagate_scenarios(self, scenarios: Dict[str, dict]) -> Dict[str, Any]:
+        """
+        Aplica cada escenario a todos los clientes a la vez, con la semántica de
+        apply_scenario/evaluate_scenarios: solo cambia VolatilidadFinal y la vol de
+        cada cartera es sum(peso * vol) (0 si falta peso o vol).
+        Devuelve la vol antes/después de los clientes afectados y el promedio de
+        la firma ponderado por valor en USD.
+        """
+        from engine_v1 import compile_scenarios
+
+        mult = compile_scenarios(self.portfolio, scenarios)  # posiciones x escenarios
+        wv = self.peso * self.vol
+        wv = np.where(np.isnan(wv), 0.0, wv)
+        before = self._row_sums(wv)
+        after = self._row_sums(wv[:, None] * mult)
+
+        valor = self._row_sums(np.nan_to_num(self.valor, nan=0.0))
+        total = float(valor.sum())
+        # sin valores cargados, cada cliente pesa igual
+        firm_w = valor / total if total else np.full(len(self.clients), 1.0 / max(len(self.clients), 1))
+
+        results = []
+        for j, (key, sc) in enumerate(scenarios.items()):
+            delta = after[:, j] - before
+            affected = np.flatnonzero(np.abs(delta) > 1e-12)
+            results.append({
+                "id": key,
+                "label": sc.get("label", key),
+                "clientes_afectados": int(affected.size),
+                "VolFirmaAntes": float(firm_w @ before),
+                "VolFirmaDespues": float(firm_w @ after[:, j]),
+                "por_cliente": [
+                    {"client_id": self.clients[i], "VolPromedioCartera": float(before[i]),
+                     "VolDespues": float(after[i, j]), "delta": float(delta[i])}
+                    for i in affected[np.argsort(-delta[affected], kind="stable")]
+                ],
+            })
+        return {"clientes": len(self.clients), "escenarios": results}
+
+    def price_shock(self, shocks: Dict[str, float]) -> List[Dict[str, Any]]:
+        """
+        Impacto de un shock de precio por activo ({Activo: retorno, ej. -0.2}) en
+        cada cliente: P&L como fracción de su cartera y en USD, de peor a mejor.
+        Solo aparecen los clientes que tienen algún activo afectado.
+        """
+        r = np.zeros(len(self.asset_keys))
+        for activo, ret in shocks.items():
+            j = self._asset_col.get(asset_key(activo))
+            if j is not None:
+                r[j] = float(ret)
+        per_pos = r[self.indices]
+        pnl = self._row_sums(np.nan_to_num(self.peso, nan=0.0) * per_pos)
+        pnl_usd = self._row_sums(np.nan_to_num(self.valor, nan=0.0) * per_pos)
+        hit = np.unique(self.row[per_pos != 0])
+        return [
+            {"client_id": self.clients[i], "PnL": float(pnl[i]), "PnL USD": float(pnl_usd[i])}
+            for i in hit[np.argsort(pnl[hit], kind="stable")]
+        ]
+
+
+def holdings_matrix() -> HoldingsMatrix:
+    """
+    Matriz cliente x activo de la firma, compartida por todas las sesiones. Se
+    arma completa una vez por proceso (o tras reindex_holdings) y después solo
+    incorpora los clientes con runs nuevos.
+    """
+    conn = _holdings_conn()
+    path = _index_path()
+    with _matrix_lock:
+        m = _matrices.get(path)
+        version = _meta_int(conn, "holdings_version")
+        if m is None or m.version > version or m.version < _meta_int(conn, "holdings_reset"):
+            m = HoldingsMatrix.load(conn)
+        elif m.version < version:
+            m = m.updated(conn)
+        _matrices[path] = m
+    return m
+
+
+def propagate_scenarios(scenarios: Dict[str, dict]) -> Dict[str, Any]:
+    return holdings_matrix().propagate_scenarios(scenarios)
+
+
+def propagate_price_shock(shocks: Dict[str, float]) -> List[Dict[str, Any]]:
+    return holdings_matrix().price_shock(shocks)
@@ -0,0 +1,103 @@
+import importlib
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable
+
+# ---- Recursos de larga vida del proceso ----
+# Streamlit vuelve a ejecutar cada página en cada interacción. Lo que no cambia entre
+# reruns (config, CSS, índice de clientes, módulos pesados) se arma una sola vez por
+# proceso y lo comparten todas las sesiones. (Las fuentes estándar del PDF ya las
+# cachea reportlab al importarse: alcanza con importarlo una vez, ver warm_up.)
+
+_resources: Dict[Hashable, Any] = {}
+_guard = threading.Lock()
+_key_locks: Dict[Hashable, threading.Lock] = {}
+
+
+def get_resource(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """
+    Devuelve el recurso `key`, creándolo con factory() la primera vez.
+    Si varias sesiones lo piden a la vez, factory corre una sola vez.
+    """
+    try:
+        return _resources[key]
+    except KeyError:
+        pass
+    with _guard:
+        lock = _key_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _resources:
+            _resources[key] = factory()
+        return _resources[key]
+
+
+def get_versioned_resource(key: Hashable, version: Hashable, factory: Callable[[], Any]) -> Any:
+    """
+    Como get_resource, pero con un solo lugar por `key`: cuando cambia `version`
+    (ej. el mtime de un archivo) la entrada vieja se reemplaza en vez de quedar
+    junto a la nueva mientras viva el proceso.
+    """
+    entry = _resources.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    with _guard:
+        lock = _key_locks.setdefault(key, threading.Lock())
+    with lock:
+        entry = _resources.get(key)
+        if entry is None or entry[0] != version:
+            entry = _resources[key] = (version, factory())
+        return entry[1]
+
+
+def clear_resources(key: Hashable | None = None) -> None:
+    """
+    Descarta un recurso (o todos): se vuelve a crear en el próximo uso.
+    """
+    with _guard:
+        if key is None:
+            _resources.clear()
+        else:
+            _resources.pop(key, None)
+
+
+def file_text(path: str) -> str:
+    """
+    Texto de un archivo, leído una vez por versión (ruta + mtime): si el archivo
+    se edita, el próximo uso lo relee y descarta la versión anterior.
+    """
+    path = os.path.abspath(path)
+    stamp = os.stat(path).st_mtime_ns
+
+    def _read() -> str:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    return get_versioned_resource(("file", path), stamp, _read)
+
+
+def load_json(path: str) -> Any:
+    # se parsea en cada llamada: el llamador puede modificar el dict sin tocar el cache
+    return json.loads(file_text(path))
+
+
+def _import_all(modules: Iterable[str]) -> None:
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass  # el error real aparece cuando la página use el módulo
+
+
+def warm_up(modules: Iterable[str], name: str = "default") -> threading.Thread:
+    """
+    Importa módulos pesados (engine, openpyxl, reportlab, ...) en un hilo de fondo,
+    una vez por proceso: la página se dibuja sin esperarlos y el primer diagnóstico
+    los encuentra cargados.
+    """
+    def _start() -> threading.Thread:
+        t = threading.Thread(target=_import_all, args=(tuple(modules),), name=f"warm-up-{name}", daemon=True)
+        t.start()
+        return t
+
+    return get_resource(("warm_up", name), _start)
@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from src.utils.client_store import _base_dir, _client_dir, _index_conn, _index_path, _run_order
+from src.utils.resources import clear_resources, get_resource
+
+_log = logging.getLogger(__name__)
+
+# ---- Índice de runs (mismo _index.sqlite que el de clientes) ----
+# run_summaries: una fila por run de cliente con sus métricas principales.
+# run_exposures: una fila por (run, dimensión, categoría) con el peso.
+# Los índices compuestos permiten filtrar ("Argentina > 40%", "Top3 > 55% y perfil
+# Conservadora") y ordenar sin abrir carpetas de runs. Lo mantienen al día
+# save_run_artifacts y append_history.
+
+RUN_FIELDS = ("client_id", "run_id", "created_at", "perfil", "score", "vol", "top1", "top3", "hhi",
+              "valor_total", "alerts_count")
+EXPOSURE_DIMENSIONS = ("Pais", "Tipo", "Moneda")
+OPERATORS = ("=", "!=", ">", ">=", "<", "<=", "in")
+_NEGATED = {">": "<=", ">=": "<", "<": ">=", "<=": ">", "=": "!=", "!=": "="}
+
+
+def _create_run_schema(conn: sqlite3.Connection) -> None:
+    with conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS run_summaries ("
+            " run_pk INTEGER PRIMARY KEY, client_id TEXT NOT NULL, run_id TEXT NOT NULL, created_at TEXT,"
+            " perfil TEXT, score REAL, vol REAL, top1 REAL, top3 REAL, hhi REAL, valor_total REAL,"
+            " alerts_count INTEGER, alert_types TEXT, is_latest INTEGER NOT NULL DEFAULT 0,"
+            " UNIQUE (client_id, run_id))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS run_exposures ("
+            " run_pk INTEGER NOT NULL, dim TEXT NOT NULL, category TEXT, category_key TEXT NOT NULL, weight REAL NOT NULL,"
+            " PRIMARY KEY (run_pk, dim, category_key)) WITHOUT ROWID"
+        )
+        # filtro por exposición: rango sobre weight dentro de (dim, categoría)
+        conn.execute("CREATE INDEX IF NOT EXISTS run_exposures_dim_cat ON run_exposures(dim, category_key, weight, run_pk)")
+        conn.execute("CREATE INDEX IF NOT EXISTS run_summaries_latest ON run_summaries(is_latest, client_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS run_summaries_client ON run_summaries(client_id, created_at)")
+
+
+def _run_conn() -> sqlite3.Connection:
+    conn = _index_conn()
+    path = _index_path()
+    get_resource(("run_index_schema", path), lambda: _create_run_schema(conn) or path)
+
+    def _ensure_built():
+        if conn.execute("SELECT 1 FROM index_meta WHERE key = 'runs_built'").fetchone() is None:
+            reindex_runs()
+        return True
+
+    # la primera vez se cargan los summary.json existentes (una vez por proceso)
+    get_resource(("run_index", path), _ensure_built)
+    return conn
+
+
+def _num(x) -> float | None:
+    try:
+        v = float(x)
+    except (TypeError, ValueError):
+        return None
+    return None if v != v else v
+
+
+def _upsert_run(conn: sqlite3.Connection, client_id: str, summary: Dict[str, Any]) -> None:
+    run_id = str(summary.get("run_id") or "")
+    created_at = str(summary["created_at"]) if summary.get("created_at") else None
+    conn.execute(
+        "INSERT INTO run_summaries (client_id, run_id, created_at, perfil, score, vol, top1, top3, hhi,"
+        " valor_total, alerts_count, alert_types) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        " ON CONFLICT(client_id, run_id) DO UPDATE SET created_at = excluded.created_at,"
+        " perfil = COALESCE(excluded.perfil, perfil), score = excluded.score, vol = excluded.vol,"
+        " top1 = excluded.top1, top3 = excluded.top3, hhi = excluded.hhi,"
+        " valor_total = COALESCE(excluded.valor_total, valor_total), alerts_count = excluded.alerts_count,"
+        " alert_types = COALESCE(excluded.alert_types, alert_types)",
+        (
+            client_id, run_id, created_at, summary.get("perfil"),
+            _num(summary.get("score")), _num(summary.get("vol")), _num(summary.get("top1")),
+            _num(summary.get("top3")), _num(summary.get("hhi")), _num(summary.get("valor_total")),
+            summary.get("alerts_count"),
+            json.dumps(summary["alert_types"], ensure_ascii=False) if "alert_types" in summary else None,
+        ),
+    )
+    run_pk = conn.execute(
+        "SELECT run_pk FROM run_summaries WHERE client_id = ? AND run_id = ?", (client_id, run_id)
+    ).fetchone()[0]
+    exposures = summary.get("exposures")
+    if exposures:
+        conn.execute("DELETE FROM run_exposures WHERE run_pk = ?", (run_pk,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO run_exposures (run_pk, dim, category, category_key, weight) VALUES (?, ?, ?, ?, ?)",
+            [
+                (run_pk, dim, str(cat), str(cat).strip().casefold(), float(w))
+                for dim in EXPOSURE_DIMENSIONS
+                for cat, w in (exposures.get(dim) or {}).items()
+                if _num(w) is not None
+            ],
+        )
+    # is_latest: solo el run más nuevo de cada cliente. created_at se compara como
+    # instante (_run_order, igual que el libro y el índice de posiciones), no como texto
+    runs = conn.execute("SELECT run_pk, run_id, created_at FROM run_summaries WHERE client_id = ?", (client_id,))
+    latest = max(runs, key=lambda r: _run_order(r["created_at"], r["run_id"]))["run_pk"]
+    conn.execute("UPDATE run_summaries SET is_latest = (run_pk = ?) WHERE client_id = ?", (latest, client_id))
+
+
+def index_run(client_id: str, summary: Dict[str, Any]) -> None:
+    """
+    Agrega o actualiza un run en el índice (idempotente por client_id + run_id).
+    """
+    if not summary.get("run_id"):
+        return
+    conn = _run_conn()
+    with conn:
+        _upsert_run(conn, client_id, summary)
+
+
+def reindex_runs() -> int:
+    """
+    Reconstruye el índice de runs desde los summary.json (solo la primera vez o a pedido).
+    """
+    conn = _index_conn()
+    _create_run_schema(conn)
+    rows: List[Tuple[str, Dict[str, Any]]] = []
+    base = _base_dir()
+    if os.path.exists(base):
+        for cid in sorted(os.listdir(base)):
+            runs = os.path.join(_client_dir(cid), "runs")
+            if cid.startswith((".", "_")) or not os.path.isdir(runs):
+                continue
+            for run_id in sorted(os.listdir(runs)):
+                path = os.path.join(runs, run_id, "summary.json")
+                if not os.path.exists(path):
+                    continue
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        rows.append((cid, {"run_id": run_id, **json.load(f)}))
+                except (OSError, ValueError):
+                    continue
+    with conn:
+        conn.execute("DELETE FROM run_exposures")
+        conn.execute("DELETE FROM run_summaries")
+        for cid, summary in rows:
+            _upsert_run(conn, cid, summary)
+        conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('runs_built', ?)", (datetime.utcnow().isoformat() + "Z",))
+    return len(rows)
+
+
+def mark_runs_dirty() -> None:
+    """
+    Pide reconstruir el índice de runs (ej. falló index_run): borra runs_built, así
+    el próximo _run_conn() de cualquier proceso llama a reindex_runs().
+    """
+    clear_resources(("run_index", _index_path()))
+    try:
+        conn = _index_conn()
+        with conn:
+            conn.execute("DELETE FROM index_meta WHERE key = 'runs_built'")
+    except Exception:
+        _log.exception("No se pudo marcar el índice de runs para reconstruir")
+
+
+# ---- consultas ----
+
+def _field(name: str) -> Tuple[str, Tuple[str, str] | None]:
+    """
+    "top3" -> columna de run_summaries; "Pais.Argentina" -> exposición (dim, categoría).
+    """
+    if name in RUN_FIELDS:
+        return name, None
+    dim, sep, cat = name.partition(".")
+    if sep and dim in EXPOSURE_DIMENSIONS and cat:
+        return name, (dim, cat.strip().casefold())
+    raise ValueError(f"Campo desconocido: {name} (usar {', '.join(RUN_FIELDS)} o Pais./Tipo./Moneda.<categoría>)")
+
+
+def _predicate(name: str, op: str, value: Any) -> Tuple[str, list]:
+    op = op.lower()
+    if op not in OPERATORS:
+        raise ValueError(f"Operador desconocido: {op} (usar {', '.join(OPERATORS)})")
+    _, exposure = _field(name)
+    if op == "in":
+        values = list(value)
+        marks = ", ".join("?" * len(values)) or "NULL"
+        if exposure is None:
+            return f"r.{name} IN ({marks})", values
+        return ("r.run_pk IN (SELECT run_pk FROM run_exposures WHERE dim = ? AND category_key = ?"
+                f" AND weight IN ({marks}))"), [*exposure, *values]
+    if exposure is None:
+        return f"r.{name} {op} ?", [value]
+    # una categoría que no está en la cartera pesa 0: si 0 cumple el predicado, se
+    # filtra por complemento (los runs que NO tienen un peso que lo incumpla)
+    zero_ok = {"=": 0 == value, "!=": 0 != value, ">": 0 > value, ">=": 0 >= value,
+               "<": 0 < value, "<=": 0 <= value}[op]
+    sub = "SELECT run_pk FROM run_exposures WHERE dim = ? AND category_key = ? AND weight {} ?"
+    if zero_ok:
+        return f"r.run_pk NOT IN ({sub.format(_NEGATED[op])})", [*exposure, value]
+    return f"r.run_pk IN ({sub.format(op)})", [*exposure, value]
+
+
+def _where(filters: Iterable[Sequence[Any]], latest_only: bool) -> Tuple[str, list]:
+    clauses, params = (["r.is_latest = 1"] if latest_only else []), []
+    for name, op, value in filters:
+        sql, p = _predicate(name, op, value)
+        clauses.append(sql)
+        params.extend(p)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def screen_runs(filters: Iterable[Sequence[Any]] = (), sort_by: str | None = None, descending: bool = True,
+                limit: int | None = 100, latest_only: bool = True) -> List[Dict[str, Any]]:
+    """
+    Filtra runs por predicados (AND) y ordena. Cada filtro es (campo, operador, valor):
+    - campo: métrica del run (top3, vol, perfil, ...) o exposición "Pais.Argentina",
+      "Tipo.Bono", "Moneda.ARS" (fracción 0-1; categoría sin distinguir mayúsculas)
+    - operador: =, !=, >, >=, <, <=, in
+    latest_only: solo el último run de cada cliente.
+
+    Ej.: screen_runs([("Pais.Argentina", ">", 0.40)])
+         screen_runs([("top3", ">", 0.55), ("perfil", "=", "Conservadora")], sort_by="top3")
+    """
+    filters = [tuple(f) for f in filters]
+    where, params = _where(filters, latest_only)
+
+    # columnas de exposición pedidas (en filtros u orden) se devuelven con el run
+    exposure_cols = list(dict.fromkeys(
+        n for n in [f[0] for f in filters] + ([sort_by] if sort_by else []) if _field(n)[1] is not None
+    ))
+    # los nombres tipeados por el usuario nunca entran al SQL: alias exp_0, exp_1, ...
+    # y ORDER BY por posición de columna; los nombres se reponen en Python
+    select = ["r." + c for c in RUN_FIELDS] + ["r.alert_types"]
+    select_params: list = []
+    aliases: Dict[str, str] = {}
+    for i, name in enumerate(exposure_cols):
+        aliases[f"exp_{i}"] = name
+        select.append(f"COALESCE((SELECT weight FROM run_exposures e WHERE e.run_pk = r.run_pk"
+                      f" AND e.dim = ? AND e.category_key = ?), 0) AS exp_{i}")
+        select_params.extend(_field(name)[1])
+
+    sql = f"SELECT {', '.join(select)} FROM run_summaries r" + where
+    if sort_by:
+        _field(sort_by)
+        position = (RUN_FIELDS.index(sort_by) if sort_by in RUN_FIELDS
+                    else len(RUN_FIELDS) + 1 + exposure_cols.index(sort_by)) + 1
+        sql += f" ORDER BY {position} {'DESC' if descending else 'ASC'}, r.client_id"
+    else:
+        sql += " ORDER BY r.client_id, r.created_at"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    out = []
+    for row in _run_conn().execute(sql, select_params + params):
+        rec = {aliases.get(k, k): row[k] for k in row.keys()}
+        rec["alert_types"] = json.loads(rec["alert_types"]) if rec["alert_types"] else []
+        out.append(rec)
+    return out
+
+
+def count_runs(filters: Iterable[Sequence[Any]] = (), latest_only: bool = True) -> int:
+    where, params = _where(filters, latest_only)
+    return _run_conn().execute("SELECT COUNT(*) FROM run_summaries r" + where, params).fetchone()[0]
+
+
+def run_exposures(client_id: str, run_id: str) -> Dict[str, Dict[str, float]]:
+    """
+    Exposiciones indexadas de un run, por dimensión y de mayor a menor.
+    """
+    out: Dict[str, Dict[str, float]] = {d: {} for d in EXPOSURE_DIMENSIONS}
+    rows = _run_conn().execute(
+        "SELECT e.dim, e.category, e.weight FROM run_exposures e JOIN run_summaries r ON r.run_pk = e.run_pk"
+        " WHERE r.client_id = ? AND r.run_id = ? ORDER BY e.dim, e.weight DESC",
+        (client_id, run_id),
+    )
+    for row in rows:
+        out[row["dim"]][row["category"]] = row["weight"]
+    return out
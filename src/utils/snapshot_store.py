@@ -0,0 +1,101 @@
+import os
+import uuid
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow as pa
+except ImportError:  # snapshot opcional: sin pyarrow se sigue leyendo el Excel
+    pa = None
+
+SNAPSHOT_FILE = "holdings.arrow"
+
+STRING_COLUMNS = ["Activo", "Tipo", "Pais", "ISO", "Moneda"]
+NUMERIC_COLUMNS = ["Valor en USD", "Peso", "VolatilidadFinal", "ScoreActivoFinal", "CountryContextScore"]
+CATEGORY_COLUMNS = ["Tipo", "Pais", "Moneda"]
+
+
+def snapshot_path(run_base: str) -> str:
+    return os.path.join(run_base, SNAPSHOT_FILE)
+
+
+def _as_str(v) -> Optional[str]:
+    if v is None or (isinstance(v, float) and v != v):
+        return None
+    return str(v)
+
+
+def _as_float(v) -> Optional[float]:
+    # NaN se guarda como NaN; la ausencia del dato como null (compute_metrics los distingue)
+    if v is None:
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def write_holdings_snapshot(run_base: str, activos: List[Dict]) -> Optional[str]:
+    """
+    Guarda los activos normalizados como Arrow IPC (columnar, apto para memory-map).
+    Pais/Tipo/Moneda van dictionary-encoded. Devuelve la ruta, o None sin pyarrow.
+    """
+    if pa is None:
+        return None
+
+    arrays = {}
+    for col in STRING_COLUMNS:
+        arr = pa.array([_as_str(a.get(col)) for a in activos], type=pa.string())
+        arrays[col] = arr.dictionary_encode() if col in CATEGORY_COLUMNS else arr
+    for col in NUMERIC_COLUMNS:
+        arrays[col] = pa.array([_as_float(a.get(col)) for a in activos], type=pa.float64())
+    table = pa.table(arrays)
+
+    os.makedirs(run_base, exist_ok=True)
+    path = snapshot_path(run_base)
+    # temporal + os.replace: un lector concurrente nunca mapea un archivo a medio escribir
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+    return path
+
+
+def _read_table(run_base: str) -> Optional["pa.Table"]:
+    path = snapshot_path(run_base)
+    if pa is None or not os.path.exists(path):
+        return None
+    # memory-map: las columnas numéricas se leen sin copiar
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def load_holdings_snapshot(run_base: str) -> Optional[List[Dict]]:
+    """
+    Activos del run como lista de dicts (mismo formato que read_portfolio_excel).
+    None si el run no tiene snapshot.
+    """
+    table = _read_table(run_base)
+    if table is None:
+        return None
+    rows = table.to_pylist()
+    for r in rows:
+        if r.get("CountryContextScore") is None:
+            r.pop("CountryContextScore", None)
+    return rows
+
+
+def load_run_holdings(run_base: str) -> List[Dict]:
+    """
+    Activos de un run guardado: usa el snapshot y, si no existe (runs viejos),
+    lee portfolio.xlsx una vez y deja el snapshot escrito para la próxima.
+    """
+    rows = load_holdings_snapshot(run_base)
+    if rows is not None:
+        return rows
+
+    from src.io_excel import read_portfolio_excel
+
+    activos = read_portfolio_excel(os.path.join(run_base, "portfolio.xlsx"))["activos"]
+    write_holdings_snapshot(run_base, activos)
+    return activos
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import heapq
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+
+if __package__:
+    from .engine_v1 import (
+        CATEGORY_KEYS,
+        DEFAULT_THRESHOLDS,
+        Portfolio,
+        compute_metrics_columnar,
+        generate_alerts,
+    )
+else:
+    from engine_v1 import (
+        CATEGORY_KEYS,
+        DEFAULT_THRESHOLDS,
+        Portfolio,
+        compute_metrics_columnar,
+        generate_alerts,
+    )
+
+
+class IncrementalMetrics:
+    """
+    Métricas de cartera que se actualizan por cambio de peso, sin recalcular todo.
+
+    - Promedios ponderados y HHI: sumas acumuladas, O(1) por cambio.
+    - Exposición por país/tipo/moneda: suma por grupo, O(1) por cambio.
+    - Top1/Top3: heap de máximos con invalidación perezosa, O(log n) amortizado.
+
+    Los activos se identifican por nombre (Activo) o por posición.
+    """
+
+    def __init__(self, portfolio: Portfolio, perfil_declarado: str | None = None, thresholds: dict | None = None):
+        self.portfolio = portfolio
+        self.perfil_declarado = perfil_declarado
+        self.thresholds = thresholds or DEFAULT_THRESHOLDS
+        self._initial = portfolio.peso.copy()
+        self._index: Dict[Any, int] = {}
+        for i, name in enumerate(portfolio.activo):
+            self._index.setdefault(name, i)
+        self.reset()
+
+    @classmethod
+    def from_records(cls, activos: List[dict], perfil_declarado: str | None = None,
+                     thresholds: dict | None = None) -> "IncrementalMetrics":
+        return cls(Portfolio.from_records(activos), perfil_declarado, thresholds)
+
+    # ---- estado ----
+
+    def reset(self) -> None:
+        """
+        Vuelve a los pesos originales y recalcula todas las sumas.
+        """
+        p = self.portfolio
+        self.peso = self._initial.copy()
+        self._score = np.nan_to_num(p.score, nan=0.0)
+        self._vol = np.nan_to_num(p.vol, nan=0.0)
+        self._ctx = np.nan_to_num(p.country_ctx, nan=0.0)
+
+        base = compute_metrics_columnar(p.with_columns(peso=self.peso).columns())
+        self._score_w = base["ScorePromedioCartera"]
+        self._vol_w = base["VolPromedioCartera"]
+        self._ctx_w = base.get("RiesgoPaisPromedioPonderado", 0.0)
+        self._hhi = base["IndiceHerfindahl"]
+
+        valid = ~np.isnan(self.peso)
+        self._ctx_missing = int(np.count_nonzero(p.country_ctx_missing & valid))
+        self._groups: Dict[str, np.ndarray] = {}
+        self._group_first: Dict[str, np.ndarray] = {}
+        for key in CATEGORY_KEYS:
+            codes, labels = p.groups[key]
+            mask = valid & (codes >= 0)
+            # bincount sin elementos devuelve int64: los deltas de _set deben sumarse en float
+            self._groups[key] = np.bincount(codes[mask], weights=self.peso[mask], minlength=len(labels)).astype(float)
+            first = np.full(len(labels), len(p), dtype=np.int64)
+            np.minimum.at(first, codes[mask], np.nonzero(mask)[0])
+            self._group_first[key] = first
+
+        self._version = np.zeros(len(p), dtype=np.int64)
+        self._heap: List[Tuple[float, int, int]] = [(-float(w), i, 0) for i, w in enumerate(self.peso) if w == w]
+        heapq.heapify(self._heap)
+
+    def _resolve(self, asset: Any) -> int:
+        if isinstance(asset, (int, np.integer)) and not isinstance(asset, bool):
+            if not 0 <= asset < len(self.peso):
+                raise KeyError(f"Activo fuera de rango: {asset}")
+            return int(asset)
+        if asset not in self._index:
+            raise KeyError(f"Activo no encontrado: {asset}")
+        return self._index[asset]
+
+    def weight(self, asset: Any) -> float:
+        return float(self.peso[self._resolve(asset)])
+
+    # ---- cambios ----
+
+    def _set(self, i: int, new_w: float) -> None:
+        p = self.portfolio
+        old_w = self.peso[i]
+        was_valid = old_w == old_w
+        old = old_w if was_valid else 0.0
+        d = new_w - old
+
+        self._score_w += d * self._score[i]
+        self._vol_w += d * self._vol[i]
+        self._ctx_w += d * self._ctx[i]
+        self._hhi += new_w * new_w - old * old
+        if not was_valid and p.country_ctx_missing[i]:
+            self._ctx_missing += 1
+
+        for key in CATEGORY_KEYS:
+            code = p.groups[key][0][i]
+            if code >= 0:
+                self._groups[key][code] += d
+                if not was_valid:
+                    self._group_first[key][code] = min(self._group_first[key][code], i)
+
+        self.peso[i] = new_w
+        self._version[i] += 1
+        heapq.heappush(self._heap, (-new_w, i, int(self._version[i])))
+        # el heap acumula entradas viejas; se compacta cuando duplica el tamaño
+        if len(self._heap) > 2 * len(self.peso) + 16:
+            self._heap = [(-float(w), j, int(self._version[j])) for j, w in enumerate(self.peso) if w == w]
+            heapq.heapify(self._heap)
+
+    def update_weight(self, asset: Any, new_w: float) -> dict:
+        new_w = float(new_w)
+        if new_w != new_w or new_w < 0:
+            raise ValueError(f"Peso inválido: {new_w}")
+        self._set(self._resolve(asset), new_w)
+        return self.metrics()
+
+    def move_weight(self, src: Any, dst: Any, delta: float) -> dict:
+        i, j = self._resolve(src), self._resolve(dst)
+        delta = float(delta)
+        w_src = self.peso[i] if self.peso[i] == self.peso[i] else 0.0
+        if delta < 0 or delta > w_src:
+            raise ValueError(f"No se puede mover {delta:.4f}: {self.portfolio.activo[i]} pesa {w_src:.4f}.")
+        w_dst = self.peso[j] if self.peso[j] == self.peso[j] else 0.0
+        self._set(i, w_src - delta)
+        self._set(j, w_dst + delta)
+        return self.metrics()
+
+    # ---- lectura ----
+
+    def _top(self, k: int) -> List[float]:
+        found: List[Tuple[float, int, int]] = []
+        while self._heap and len(found) < k:
+            entry = heapq.heappop(self._heap)
+            if entry[2] == self._version[entry[1]]:
+                found.append(entry)
+        for entry in found:
+            heapq.heappush(self._heap, entry)
+        return [-e[0] for e in found]
+
+    def _exposure(self, key: str) -> Dict[str, float]:
+        labels = self.portfolio.groups[key][1]
+        sums = self._groups[key]
+        first = self._group_first[key]
+        present = np.nonzero(first < len(self.peso))[0]
+        order = sorted(present, key=lambda g: (-sums[g], first[g]))
+        return {labels[g]: float(sums[g]) for g in order}
+
+    def metrics(self) -> dict:
+        top = self._top(3)
+        metrics = {
+            "ScorePromedioCartera": float(self._score_w),
+            "VolPromedioCartera": float(self._vol_w),
+            "ConcentracionTop1": top[0] if top else 0.0,
+            "ConcentracionTop3": sum(top),
+            "IndiceHerfindahl": float(self._hhi),
+            "ExposicionPorPais": self._exposure("Pais"),
+            "ExposicionPorTipo": self._exposure("Tipo"),
+            "ExposicionPorMoneda": self._exposure("Moneda"),
+        }
+        if self._ctx_missing == 0:
+            metrics["RiesgoPaisPromedioPonderado"] = float(self._ctx_w)
+        return metrics
+
+    def alerts(self) -> List[dict]:
+        return generate_alerts(self.metrics(), self.perfil_declarado, self.thresholds)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# mismo sys.path que `streamlit run src/app_streamlit.py`: raíz del repo y src/
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (os.path.join(ROOT_DIR, "src"), ROOT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def client_base(tmp_path, monkeypatch):
+    """
+    data/clients en un directorio temporal (ruta absoluta: las conexiones SQLite
+    por hilo se cachean por ruta).
+    """
+    from src.utils import client_store
+
+    base = str(tmp_path / "clients")
+    monkeypatch.setattr(client_store, "BASE_DIR", base)
+    return base
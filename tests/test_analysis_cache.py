@@ -0,0 +1,36 @@
+import io
+
+from openpyxl import Workbook
+
+from analysis_cache import cached_analysis
+
+
+def _xlsx() -> bytes:
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "InputActivos"
+    ws.append(["Activo", "Tipo", "Pais", "Moneda", "Valor en USD", "Peso", "VolatilidadFinal", "ScoreActivoFinal"])
+    ws.append(["AL30", "Bono", "Argentina", "USD", 700, 0.7, 12, 60])
+    ws.append(["SPY", "ETF", "USA", "USD", 300, 0.3, 18, 70])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def test_cached_results_are_not_shared_between_callers(monkeypatch):
+    import price_store
+
+    monkeypatch.setattr(price_store, "default_price_store", lambda: None)
+    data = _xlsx()
+    payload, analysis = cached_analysis(data, "Conservadora")
+    expected_alerts = list(analysis["alerts"])
+    payload["activos"][0]["Peso"] = 0.0
+    analysis["metrics"]["VolPromedioCartera"] = -1.0
+    analysis["alerts"].clear()
+    analysis["scenarios"][0]["delta"].clear()
+
+    payload, analysis = cached_analysis(data, "Conservadora")
+    assert payload["activos"][0]["Peso"] == 0.7
+    assert analysis["metrics"]["VolPromedioCartera"] > 0
+    assert analysis["alerts"] == expected_alerts and expected_alerts
+    assert analysis["scenarios"][0]["delta"]
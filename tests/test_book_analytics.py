@@ -0,0 +1,31 @@
+import pytest
+
+from src.utils import book_analytics
+
+
+def _summary(run_id, created_at, valor, pais, alerts=()):
+    return {"run_id": run_id, "created_at": created_at, "valor_total": valor, "vol": 10.0,
+            "alert_types": list(alerts), "exposures": {"Pais": pais, "Tipo": {}, "Moneda": {}}}
+
+
+def test_upsert_replaces_client_contribution(client_base):
+    book_analytics.update_book("a", _summary("2026-01-01_100000_aaaaaa", "2026-01-01T10:00:00.100000Z",
+                                             100.0, {"Argentina": 1.0}, ["hhi"]))
+    book_analytics.update_book("b", _summary("2026-01-01_100000_bbbbbb", "2026-01-01T10:00:00.200000Z",
+                                             300.0, {"USA": 0.5, "Argentina": 0.5}, ["hhi"]))
+    assert book_analytics.update_book("a", _summary("2026-01-02_100000_cccccc", "2026-01-02T10:00:00Z",
+                                                    200.0, {"USA": 1.0}))
+
+    totals = book_analytics.load_book()["totals"]
+    assert totals["valor"] == pytest.approx(500.0)
+    assert totals["Pais"] == pytest.approx({"USA": 350.0, "Argentina": 150.0})
+    assert book_analytics.load_book()["alert_counts"] == {"hhi": 1}
+
+
+def test_late_older_run_is_ignored(client_base):
+    # isoformat sin microsegundos: como texto, "10:00:00Z" queda después de "10:00:00.5Z"
+    newer = _summary("2026-01-01_100000_aaaaaa", "2026-01-01T10:00:00.500000Z", 100.0, {"USA": 1.0})
+    older = _summary("2026-01-01_100000_bbbbbb", "2026-01-01T10:00:00Z", 100.0, {"Argentina": 1.0})
+    assert book_analytics.update_book("a", newer)
+    assert not book_analytics.update_book("a", older)
+    assert book_analytics.load_book()["clients"]["a"]["run_id"] == newer["run_id"]
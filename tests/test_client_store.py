@@ -0,0 +1,19 @@
+import os
+from datetime import datetime
+
+from src.utils import client_store
+
+
+def test_query_history_limit_and_corrupt_lines(client_base, monkeypatch):
+    # un segmento por evento; el segundo arrastra una línea corrupta (ts = -1 en el índice)
+    monkeypatch.setattr(client_store, "HISTORY_SEGMENT_BYTES", 1)
+    client_store.append_history("c1", {"event": "A"})
+    with open(os.path.join(client_base, "c1", client_store.HISTORY_FILE), "ab") as f:
+        f.write(b"{no es json\n")
+    client_store.append_history("c1", {"event": "B"})
+    client_store.append_history("c1", {"event": "C"})
+
+    since = datetime(2000, 1, 1)
+    assert [r["event"] for r in client_store.query_history("c1", since=since)] == ["A", "B", "C"]
+    assert [r["event"] for r in client_store.query_history("c1", limit=2)] == ["B", "C"]
+    assert client_store.query_history("c1", limit=0) == []
@@ -0,0 +1,39 @@
+import numpy as np
+
+from engine_v1 import DEFAULT_SCENARIOS, apply_scenario, compute_metrics, run_analysis
+
+SCENARIOS = {
+    **DEFAULT_SCENARIOS,
+    "sin_efecto": {"type": "multiply_vol_by_country", "country": "Japón", "multiplier": 1.5, "label": "Sin activos"},
+    "neutro": {"type": "multiply_vol", "multiplier": 1.0, "label": "Neutro"},
+}
+KEYS = ("VolPromedioCartera", "IndiceHerfindahl", "ConcentracionTop3")
+
+
+def _activos(rng):
+    n = int(rng.integers(3, 25))
+    w = rng.dirichlet(np.ones(n))
+    return [
+        {"Activo": f"A{i}", "Peso": float(w[i]) if rng.random() > 0.1 else None,
+         "VolatilidadFinal": float(rng.uniform(3, 40)) if rng.random() > 0.1 else None,
+         "ScoreActivoFinal": 50, "Pais": ("Argentina", "USA", "Brasil")[int(rng.integers(3))],
+         "Tipo": "Accion", "Moneda": "USD"}
+        for i in range(n)
+    ]
+
+
+def test_scenarios_match_per_scenario_metrics(monkeypatch):
+    import price_store
+
+    monkeypatch.setattr(price_store, "default_price_store", lambda: None)
+    rng = np.random.default_rng(7)
+    for _ in range(100):
+        activos = _activos(rng)
+        res = run_analysis({"activos": activos}, None, scenarios=SCENARIOS)
+        base = compute_metrics(activos)
+        for sc in res["scenarios"]:
+            after = compute_metrics(apply_scenario(activos, SCENARIOS[sc["id"]]))
+            assert sc["metrics_after"] == {k: after[k] for k in KEYS}
+            assert sc["delta"] == {k: after[k] - base[k] for k in KEYS}
+        unshocked = {sc["id"]: sc["delta"]["VolPromedioCartera"] for sc in res["scenarios"]}
+        assert unshocked["sin_efecto"] == 0.0 and unshocked["neutro"] == 0.0
@@ -0,0 +1,40 @@
+from src.utils import holdings_index
+
+
+def _holdings(activo):
+    return [{"Activo": activo, "Peso": 1.0, "Valor en USD": 100.0, "Pais": "USA", "Tipo": "ETF", "Moneda": "USD"}]
+
+
+def test_late_older_run_keeps_newer_holdings(client_base):
+    # isoformat sin microsegundos: como texto, "10:00:00Z" queda después de "10:00:00.5Z"
+    assert holdings_index.index_holdings("a", "2026-01-01_100000_aaaaaa", _holdings("SPY"),
+                                         "2026-01-01T10:00:00.500000Z")
+    assert not holdings_index.index_holdings("a", "2026-01-01_100000_bbbbbb", _holdings("QQQ"),
+                                             "2026-01-01T10:00:00Z")
+    assert [h["run_id"] for h in holdings_index.who_holds("SPY")] == ["2026-01-01_100000_aaaaaa"]
+    assert holdings_index.who_holds("QQQ") == []
+
+
+
+def test_failed_index_holdings_rebuilds_on_next_use(client_base, monkeypatch, caplog):
+    import os
+    import sqlite3
+
+    from src.utils import client_store
+
+    assert holdings_index.who_holds("SPY") == []  # índice ya armado en este proceso
+    replace = holdings_index._replace_holdings
+    calls = []
+
+    def locked_once(*args):
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return replace(*args)
+
+    monkeypatch.setattr(holdings_index, "_replace_holdings", locked_once)
+    run_base = os.path.join(client_base, "a", "runs", "r1")
+    client_store.save_run_artifacts(run_base, summary={"run_id": "r1", "created_at": "2026-01-01T10:00:00Z"},
+                                    holdings=_holdings("SPY"))
+    assert "No se pudieron indexar las posiciones del run r1 de a" in caplog.text
+    assert [h["client_id"] for h in holdings_index.who_holds("SPY")] == ["a"]
@@ -0,0 +1,93 @@
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _run(code: str, pythonpath: str = "") -> dict:
+    # proceso limpio desde la raíz del repo: por defecto solo la raíz en sys.path, no src/
+    env = {**os.environ, "PYTHONPATH": pythonpath}
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_engine_runs_as_src_package_without_bare_copies():
+    res = _run(
+        "import json, sys\n"
+        "import numpy as np\n"
+        "from src.engine_v1 import run_analysis\n"
+        "from src.risk_covariance import RiskModel\n"
+        "activos = [{'Activo': a, 'Peso': w, 'VolatilidadFinal': 20.0, 'ScoreActivoFinal': 50,\n"
+        "            'Pais': 'Argentina', 'Tipo': 'Accion', 'Moneda': 'ARS'}\n"
+        "           for a, w in (('A', 0.7), ('B', 0.2), ('C', 0.1))]\n"
+        "model = RiskModel(['A', 'B', 'C'], np.eye(3), kind='corr')\n"
+        "res = run_analysis({'activos': activos}, 'Conservadora', risk_model=model)\n"
+        "names = ('engine_v1', 'risk_var', 'risk_covariance', 'rebalance_opt', 'price_store')\n"
+        "print(json.dumps({'bare': [m for m in names if m in sys.modules],\n"
+        "                  'pkg': [m for m in names if 'src.' + m in sys.modules],\n"
+        "                  'recs': len(res['recommendations'])}))\n"
+    )
+    assert res["bare"] == []
+    assert set(res["pkg"]) == {"engine_v1", "risk_var", "risk_covariance", "rebalance_opt", "price_store"}
+    assert res["recs"] > 0
+
+
+# módulos que el diagnóstico carga recién al usarse (ver HEAVY_MODULES en la página)
+HEAVY = ("engine_v1", "src.engine_v1", "io_excel", "whatif", "stress_mc", "artifact_writer",
+         "report_pdf", "openpyxl", "reportlab")
+IMPORT_BUDGET_S = 1.5
+
+
+def _page_imports(path: str) -> list:
+    # imports de nivel módulo de la página; streamlit (y ui, que lo importa) no están en los tests
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.append(node.module)
+    return [n for n in names if n.split(".")[0] not in ("streamlit", "ui")]
+
+
+def test_diagnosis_page_imports_stay_light():
+    modules = _page_imports(os.path.join(ROOT_DIR, "src", "pages", "2_Asesor_Diagnostico.py"))
+    assert "analysis_cache" in modules
+    res = _run(
+        "import importlib, json, sys, time\n"
+        "t = time.perf_counter()\n"
+        f"for m in {modules!r}:\n"
+        "    importlib.import_module(m)\n"
+        "elapsed = time.perf_counter() - t\n"
+        f"print(json.dumps({{'elapsed': elapsed, 'heavy': [m for m in {HEAVY!r} if m in sys.modules]}}))\n",
+        pythonpath=os.pathsep.join([os.path.join(ROOT_DIR, "src"), ROOT_DIR]),
+    )
+    assert res["heavy"] == []
+    assert res["elapsed"] < IMPORT_BUDGET_S
+
+
+def test_old_run_holdings_load_from_root_only(tmp_path):
+    # run viejo sin snapshot: lee portfolio.xlsx (io_excel) con solo la raíz en sys.path
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "InputActivos"
+    ws.append(["Activo", "Tipo", "Pais", "Moneda", "Valor en USD", "Peso", "VolatilidadFinal", "ScoreActivoFinal"])
+    ws.append(["AL30", "Bono", "Argentina", "USD", 600, 0.6, 12, 60])
+    ws.append(["SPY", "ETF", "USA", "USD", 400, 0.4, 18, 70])
+    wb.save(str(tmp_path / "portfolio.xlsx"))
+
+    res = _run(
+        "import json, os\n"
+        "from src.utils.snapshot_store import load_run_holdings, snapshot_path\n"
+        f"rows = load_run_holdings({str(tmp_path)!r})\n"
+        f"print(json.dumps({{'activos': [r['Activo'] for r in rows],\n"
+        f"                  'snapshot': os.path.exists(snapshot_path({str(tmp_path)!r}))}}))\n"
+    )
+    assert res == {"activos": ["AL30", "SPY"], "snapshot": True}
@@ -0,0 +1,29 @@
+import numpy as np
+
+from price_store import PriceStore
+
+
+def _history():
+    rng = np.random.default_rng(1)
+    dates = np.datetime64("2024-01-01") + np.arange(200)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (200, 3)), axis=0))
+    prices[100:140, 1] = np.nan  # hueco que cruza el inicio de la ventana de la vol móvil
+    prices[::17, 2] = np.nan
+    return dates, ["AAA", "BBB", "CCC"], prices
+
+
+def test_append_matches_full_rebuild(tmp_path):
+    dates, assets, prices = _history()
+    full = PriceStore(str(tmp_path / "full"))
+    full.ingest_arrays(dates, assets, prices)
+
+    inc = PriceStore(str(tmp_path / "inc"))
+    inc.ingest_arrays(dates[:170], assets, prices[:170])
+    assert inc.ingest_arrays(dates[170:185], assets, prices[170:185])["mode"] == "append"
+    for i in range(185, 200):
+        inc.append(dates[i], dict(zip(assets, prices[i])))
+
+    a, b = inc.stats(), full.stats()
+    assert np.array_equal(a["n_obs"], b["n_obs"])
+    for key in ("vol_ewma", "vol_rolling", "last_return", "corr"):
+        np.testing.assert_allclose(a[key], b[key], rtol=1e-9, atol=1e-12, equal_nan=True)
@@ -0,0 +1,67 @@
+import numpy as np
+
+from engine_v1 import DEFAULT_THRESHOLDS, Portfolio, compute_metrics_columnar, generate_alerts
+from rebalance_opt import solve_rebalancing_batch
+
+PERFILES = ("Conservadora", "Moderada", "Agresiva")
+
+
+def _book(n_portfolios=300, seed=3):
+    rng = np.random.default_rng(seed)
+    portfolios, perfiles = [], []
+    for _ in range(n_portfolios):
+        n = int(rng.integers(6, 14))
+        w = rng.dirichlet(np.full(n, 0.5))
+        activos = [
+            {"Activo": f"A{i}", "Peso": w[i], "VolatilidadFinal": rng.uniform(5, 30), "ScoreActivoFinal": 50,
+             "Pais": ("Argentina", "USA", "Brasil")[int(rng.integers(3))], "Tipo": "Accion", "Moneda": "USD"}
+            for i in range(n)
+        ]
+        portfolios.append(Portfolio.from_records(activos))
+        perfiles.append(PERFILES[int(rng.integers(3))])
+    return portfolios, perfiles
+
+
+def test_feasible_proposals_raise_no_alerts():
+    portfolios, perfiles = _book()
+    results = solve_rebalancing_batch(portfolios, DEFAULT_THRESHOLDS, perfiles)
+    assert sum(r["feasible"] for r in results) > 200
+    for p, perfil, r in zip(portfolios, perfiles, results):
+        assert np.isclose(np.nansum(r["weights"]), np.nansum(p.peso))
+        if not r["feasible"]:
+            continue
+        assert max(r["violations"].values()) <= 0
+        metrics = compute_metrics_columnar(p.with_columns(peso=r["weights"]).columns())
+        assert generate_alerts(metrics, perfil, DEFAULT_THRESHOLDS) == []
+
+
+def _concentrated():
+    pesos = (0.40, 0.15, 0.15, 0.10, 0.10, 0.10)
+    vols = (15, 15, 8, 8, 8, 8)
+    return [
+        {"Activo": f"A{i}", "Peso": w, "VolatilidadFinal": v, "ScoreActivoFinal": 50,
+         "Pais": ("Argentina", "USA", "Brasil")[i % 3], "Tipo": "Accion", "Moneda": "USD"}
+        for i, (w, v) in enumerate(zip(pesos, vols))
+    ]
+
+
+def test_rebalancing_uses_the_alert_vol_basis():
+    from engine_v1 import recommend_rebalancing
+
+    activos = _concentrated()
+    metrics = compute_metrics_columnar(Portfolio.from_records(activos).columns())
+    assert metrics["VolPromedioCartera"] > 10.0
+
+    # con correlaciones la vol queda bajo el límite: no hay alerta ni restricción de vol
+    thresholds = {**DEFAULT_THRESHOLDS, "vol_profile_limits": {"Conservadora": 10.0}}
+    diversified = {**metrics, "VolCovarianzaCartera": 9.0}
+    rec, = recommend_rebalancing(activos, diversified, thresholds, "Conservadora")
+    assert "vol" not in rec["constraints"]
+
+    # sobre el límite: se acota la vol promedio ponderada y el texto lo dice
+    correlated = {**metrics, "VolCovarianzaCartera": 10.5}
+    rec, = recommend_rebalancing(activos, correlated, thresholds, "Conservadora")
+    assert "vol" in rec["constraints"]
+    assert "promedio ponderada" in rec["detail"]
+    propuesta = {w["Activo"]: w["Peso"] for w in rec["proposed_weights"]}
+    assert sum(propuesta[a["Activo"]] * a["VolatilidadFinal"] for a in activos) <= 10.0
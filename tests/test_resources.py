@@ -0,0 +1,30 @@
+import json
+import os
+
+from src.utils import resources
+from src.utils.book_analytics import cached_book_view, update_book
+
+
+def _entries(prefix) -> list:
+    return [k for k in resources._resources if isinstance(k, tuple) and k[:len(prefix)] == prefix]
+
+
+def test_file_text_keeps_one_version_per_path(tmp_path):
+    path = tmp_path / "config.json"
+    for i in range(5):
+        path.write_text(json.dumps({"i": i}))
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+        assert resources.load_json(str(path)) == {"i": i}
+    assert len(_entries(("file", str(path)))) == 1
+
+
+def test_book_view_replaces_stale_versions(client_base):
+    for i in range(4):
+        summary = {"run_id": f"2024-01-0{i + 1}_000000", "created_at": f"2024-01-0{i + 1}T00:00:00Z",
+                   "vol": 10.0 + i, "valor_total": 100.0, "alert_types": [], "exposures": {}}
+        update_book(f"c{i}", summary)
+        path = os.path.join(client_base, "_book.json")
+        os.utime(path, ns=(i * 10**9, i * 10**9))  # mtime distinto aunque escriba en el mismo tick
+        assert cached_book_view()["n_clients"] == i + 1
+    assert len(_entries(("book_view", os.path.abspath(path)))) == 1
+    assert len(_entries(("file", os.path.abspath(path)))) == 1
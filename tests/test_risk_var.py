@@ -0,0 +1,37 @@
+import numpy as np
+
+from engine_v1 import DEFAULT_THRESHOLDS, run_analysis
+
+
+def _payload():
+    # cartera Conservadora chica, 85% en Argentina, vol apenas bajo el límite del perfil
+    activos = [
+        {"Activo": "AL30", "Peso": 0.45, "VolatilidadFinal": 11.9, "ScoreActivoFinal": 60, "Pais": "Argentina", "Tipo": "Bono", "Moneda": "USD"},
+        {"Activo": "GD30", "Peso": 0.40, "VolatilidadFinal": 11.9, "ScoreActivoFinal": 60, "Pais": "Argentina", "Tipo": "Bono", "Moneda": "USD"},
+        {"Activo": "SPY", "Peso": 0.10, "VolatilidadFinal": 11.9, "ScoreActivoFinal": 70, "Pais": "USA", "Tipo": "ETF", "Moneda": "USD"},
+        {"Activo": "CASH", "Peso": 0.05, "VolatilidadFinal": 11.9, "ScoreActivoFinal": 80, "Pais": "USA", "Tipo": "Cash", "Moneda": "USD"},
+    ]
+    return {"activos": activos}
+
+
+def test_parametric_cvar_does_not_raise_second_vol_alert(monkeypatch):
+    import price_store
+
+    monkeypatch.setattr(price_store, "default_price_store", lambda: None)
+    res = run_analysis(_payload(), "Conservadora")
+    assert res["metrics"]["RiesgoPerdida"]["fuente_alerta"] == "parametrico"
+    types = [a["type"] for a in res["alerts"]]
+    assert "cvar_perfil" not in types
+    assert "perfil_mismatch" not in types
+    assert "country_concentration" in types
+
+
+def test_scenario_returns_drive_cvar_alert():
+    rng = np.random.default_rng(0)
+    # escenarios con colas pesadas: pérdidas mensuales muy por encima del límite
+    returns = rng.standard_t(2, size=(500, 4)) * 0.05
+    res = run_analysis(_payload(), "Conservadora", var_returns=returns)
+    perdida = res["metrics"]["RiesgoPerdida"]
+    assert perdida["fuente_alerta"] == "escenarios"
+    assert res["metrics"]["CVaRCartera"] > DEFAULT_THRESHOLDS["cvar_profile_limits"]["Conservadora"]
+    assert "cvar_perfil" in [a["type"] for a in res["alerts"]]
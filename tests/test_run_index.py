@@ -0,0 +1,85 @@
+import pytest
+
+from src.utils.run_index import count_runs, index_run, screen_runs
+
+
+def _summary(run_id, created_at, perfil, top3, paises):
+    return {"run_id": run_id, "created_at": created_at, "perfil": perfil, "top3": top3, "vol": 12.0,
+            "alert_types": [], "exposures": {"Pais": paises, "Tipo": {}, "Moneda": {}}}
+
+
+@pytest.fixture
+def runs(client_base):
+    index_run("a", _summary("r1", "2024-01-01T00:00:00Z", "Conservadora", 0.70, {"Argentina": 0.80, "USA": 0.20}))
+    index_run("a", _summary("r2", "2024-02-01T00:00:00Z", "Conservadora", 0.60, {"Argentina": 0.30, "USA": 0.70}))
+    index_run("b", _summary("r1", "2024-01-15T00:00:00Z", "Moderada", 0.50, {"Argentina": 0.50, "Brasil": 0.50}))
+    index_run("c", _summary("r1", "2024-01-20T00:00:00Z", "Agresiva", 0.40, {"USA": 0.60, 'Cote d"Ivoire': 0.40}))
+    return client_base
+
+
+def _ids(rows):
+    return [(r["client_id"], r["run_id"]) for r in rows]
+
+
+def test_exposure_predicate_uses_latest_run_only(runs):
+    assert _ids(screen_runs([("Pais.Argentina", ">", 0.40)])) == [("b", "r1")]
+    assert _ids(screen_runs([("Pais.argentina", ">", 0.40)], latest_only=False)) == [("a", "r1"), ("b", "r1")]
+
+
+def test_missing_category_counts_as_zero(runs):
+    # c no tiene Argentina: pesa 0 y cumple "< 0.4"; a (último run) tiene 0.30
+    rows = screen_runs([("Pais.Argentina", "<", 0.40)], sort_by="Pais.Argentina", descending=False)
+    assert _ids(rows) == [("c", "r1"), ("a", "r2")]
+    assert [r["Pais.Argentina"] for r in rows] == [0, 0.30]
+    assert count_runs([("Pais.Argentina", "=", 0)]) == 1
+
+
+def test_metric_and_text_predicates_combine(runs):
+    rows = screen_runs([("top3", ">", 0.45), ("perfil", "in", ["Conservadora", "Moderada"])], sort_by="top3")
+    assert _ids(rows) == [("a", "r2"), ("b", "r1")]
+
+
+def test_quoted_category_names_stay_out_of_sql(runs):
+    field = 'Pais.Cote d"Ivoire'
+    rows = screen_runs([(field, ">=", 0.40)], sort_by=field)
+    assert _ids(rows) == [("c", "r1")]
+    assert rows[0][field] == pytest.approx(0.40)
+
+
+def test_unknown_field_or_operator_is_rejected(runs):
+    with pytest.raises(ValueError):
+        screen_runs([("top3; DROP TABLE run_summaries", ">", 0)])
+    with pytest.raises(ValueError):
+        screen_runs([("top3", "LIKE", 0)])
+
+
+def test_late_older_run_is_not_latest(client_base):
+    # isoformat sin microsegundos: como texto, "10:00:00Z" queda después de "10:00:00.5Z"
+    index_run("a", _summary("r2", "2026-01-01T10:00:00.500000Z", "Moderada", 0.50, {"USA": 1.0}))
+    index_run("a", _summary("r1", "2026-01-01T10:00:00Z", "Moderada", 0.50, {"Argentina": 1.0}))
+    assert _ids(screen_runs([])) == [("a", "r2")]
+    assert _ids(screen_runs([("Pais.USA", ">", 0.5)])) == [("a", "r2")]
+
+
+def test_failed_index_run_rebuilds_on_next_use(client_base, monkeypatch, caplog):
+    import os
+    import sqlite3
+
+    from src.utils import client_store, run_index
+
+    assert screen_runs([]) == []  # índice ya armado en este proceso
+    upsert = run_index._upsert_run
+    calls = []
+
+    def locked_once(*args):
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return upsert(*args)
+
+    monkeypatch.setattr(run_index, "_upsert_run", locked_once)
+    run_base = os.path.join(client_base, "a", "runs", "r1")
+    client_store.save_run_artifacts(run_base, summary=_summary("r1", "2024-01-01T00:00:00Z", "Moderada", 0.5,
+                                                               {"USA": 1.0}))
+    assert "No se pudo indexar el run r1 de a" in caplog.text
+    assert _ids(screen_runs([])) == [("a", "r1")]
@@ -0,0 +1,37 @@
+import math
+
+from engine_v1 import compute_metrics
+from src.utils.snapshot_store import load_holdings_snapshot, write_holdings_snapshot
+
+ACTIVOS = [
+    {"Activo": "AL30", "Tipo": "Bono", "Pais": "Argentina", "ISO": "AR", "Moneda": "USD", "Valor en USD": 450.0,
+     "Peso": 0.45, "VolatilidadFinal": 12.0, "ScoreActivoFinal": 60.0, "CountryContextScore": 40.0},
+    # vol NaN (dato inválido) vs ausente; sin CountryContextScore
+    {"Activo": "SPY", "Tipo": "ETF", "Pais": "USA", "ISO": "US", "Moneda": "USD", "Valor en USD": 350.0,
+     "Peso": 0.35, "VolatilidadFinal": float("nan"), "ScoreActivoFinal": 70.0},
+    {"Activo": "CASH", "Tipo": None, "Pais": None, "ISO": None, "Moneda": "USD", "Valor en USD": None,
+     "Peso": 0.20, "VolatilidadFinal": None, "ScoreActivoFinal": 80.0, "CountryContextScore": float("nan")},
+]
+
+
+def _same(a, b):
+    return a == b or (isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b))
+
+
+def test_snapshot_round_trip_keeps_nan_null_and_missing(tmp_path):
+    write_holdings_snapshot(str(tmp_path), ACTIVOS)
+    rows = load_holdings_snapshot(str(tmp_path))
+
+    assert len(rows) == len(ACTIVOS)
+    for original, row in zip(ACTIVOS, rows):
+        assert set(row) == set(original)
+        assert all(_same(row[k], v) for k, v in original.items()), (row, original)
+    assert math.isnan(rows[1]["VolatilidadFinal"]) and rows[2]["VolatilidadFinal"] is None
+    assert "CountryContextScore" not in rows[1]
+
+    before, after = compute_metrics(ACTIVOS), compute_metrics(rows)
+    assert all(_same(after[k], v) for k, v in before.items() if not isinstance(v, dict))
+
+
+def test_missing_snapshot_reads_none(tmp_path):
+    assert load_holdings_snapshot(str(tmp_path)) is None
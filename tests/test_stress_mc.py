@@ -0,0 +1,50 @@
+import numpy as np
+
+from stress_mc import run_stress_mc
+
+ACTIVOS = [
+    {"Activo": "AL30", "Peso": 0.40, "VolatilidadFinal": 14, "ScoreActivoFinal": 60, "Pais": "Argentina", "Tipo": "Bono", "Moneda": "USD"},
+    {"Activo": "GGAL", "Peso": 0.25, "VolatilidadFinal": 35, "ScoreActivoFinal": 55, "Pais": "Argentina", "Tipo": "Accion", "Moneda": "ARS"},
+    {"Activo": "SPY", "Peso": 0.25, "VolatilidadFinal": 18, "ScoreActivoFinal": 70, "Pais": "USA", "Tipo": "ETF", "Moneda": "USD"},
+    {"Activo": "CASH", "Peso": 0.10, "VolatilidadFinal": 1, "ScoreActivoFinal": 80, "Pais": None, "Tipo": "Cash", "Moneda": "USD"},
+]
+
+
+def test_same_seed_same_result_for_any_worker_count():
+    config = {"n_draws": 5_000, "block_size": 1_000, "seed": 7}
+    serial = run_stress_mc(ACTIVOS, "Moderada", config={**config, "workers": 1})
+    pooled = run_stress_mc(ACTIVOS, "Moderada", config={**config, "workers": 2})
+    assert serial == pooled
+    assert serial["n_draws"] == 5_000 and serial["breach_prob"]
+
+
+def test_result_records_tail_and_percentiles():
+    res = run_stress_mc(ACTIVOS, None, config={"n_draws": 2_000, "workers": 1, "tail": 0.1, "percentiles": [10, 50, 90]})
+    assert res["tail"] == 0.1 and res["percentiles"] == [10, 50, 90]
+    assert list(res["metrics"]["VolPromedioCartera"]["percentiles"]) == ["p10", "p50", "p90"]
+    assert np.isfinite(res["metrics"]["VolPromedioCartera"]["tail_mean_high"])
+
+
+def test_reports_label_configured_tail_and_percentiles(monkeypatch):
+    import price_store
+    from engine_v1 import run_analysis
+    from render_pipeline import render_all
+
+    monkeypatch.setattr(price_store, "default_price_store", lambda: None)
+    payload = {"metadata": {"source_file": "test.xlsx"}, "activos": ACTIVOS}
+    payload["analysis"] = run_analysis(payload, "Moderada")
+    payload["analysis"]["stress_mc"] = run_stress_mc(
+        ACTIVOS, "Moderada", config={"n_draws": 2_000, "workers": 1, "tail": 0.1, "percentiles": [10, 50, 90]})
+
+    out = render_all(payload, "Moderada", formats=("html", "pdf"))
+    html = out["html"]
+    assert "<th>P10</th><th>P50</th><th>P90</th>" in html
+    assert "Promedio cola 10%" in html
+    assert "P95" not in html and "cola 5%" not in html
+    assert out["pdf"].startswith(b"%PDF")
+
+    from report_pdf import PortfolioPdfWriter
+
+    lines = [item[2][0] for item in PortfolioPdfWriter(payload, out["view"])._stress() if item[0] == "text"]
+    assert lines[0].startswith("Volatilidad P50 / P90:")
+    assert lines[1].startswith("Volatilidad promedio en la peor cola (10%)")
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from whatif import IncrementalMetrics
+
+
+def test_weights_set_from_missing_keep_fractional_exposure():
+    # ningún peso válido al inicio: las sumas por grupo arrancan vacías
+    activos = [
+        {"Activo": "AL30", "Peso": None, "VolatilidadFinal": 12, "ScoreActivoFinal": 60, "Pais": "Argentina", "Tipo": "Bono", "Moneda": "USD"},
+        {"Activo": "SPY", "Peso": None, "VolatilidadFinal": 18, "ScoreActivoFinal": 70, "Pais": "USA", "Tipo": "ETF", "Moneda": "USD"},
+    ]
+    wm = IncrementalMetrics.from_records(activos)
+    wm.update_weight("AL30", 0.3)
+    wm.update_weight("SPY", 0.7)
+    m = wm.metrics()
+    assert m["ExposicionPorPais"] == {"USA": 0.7, "Argentina": 0.3}
+    assert m["ExposicionPorMoneda"] == {"USD": 1.0}
+
+
+def test_edit_sequence_matches_full_recompute():
+    # cualquier secuencia de cambios debe dar lo mismo que recalcular sobre los pesos editados
+    from engine_v1 import DEFAULT_THRESHOLDS, compute_metrics, generate_alerts
+
+    rng = np.random.default_rng(7)
+    paises = ["Argentina", "USA", "Brasil", None]
+    activos = [
+        {
+            "Activo": f"A{i}",
+            "Peso": None if i % 7 == 3 else float(rng.uniform(0.01, 0.2)),
+            "VolatilidadFinal": None if i % 5 == 2 else float(rng.uniform(5, 40)),
+            "ScoreActivoFinal": float(rng.uniform(30, 90)),
+            "CountryContextScore": None if i == 10 else float(rng.uniform(20, 80)),
+            "Pais": paises[i % 4],
+            "Tipo": ["Bono", "ETF", "Accion"][i % 3],
+            "Moneda": ["USD", "ARS"][i % 2],
+        }
+        for i in range(20)
+    ]
+    wm = IncrementalMetrics.from_records(activos, perfil_declarado="Moderada")
+
+    for _ in range(200):
+        if rng.random() < 0.5:
+            i = int(rng.integers(len(activos)))
+            wm.update_weight(f"A{i}", float(rng.uniform(0, 0.3)))
+        else:
+            i, j = (int(x) for x in rng.choice(len(activos), 2, replace=False))
+            w = wm.weight(i)
+            if w == w and w > 0:
+                wm.move_weight(i, j, float(rng.uniform(0, w)))
+
+        edited = [dict(a, Peso=None if w != w else float(w)) for a, w in zip(activos, wm.peso)]
+        expected = compute_metrics(edited)
+        got = wm.metrics()
+        assert got.keys() == expected.keys()
+        for key, value in expected.items():
+            if isinstance(value, dict):
+                assert list(got[key]) == list(value)
+                assert list(got[key].values()) == pytest.approx(list(value.values()), abs=1e-9)
+            else:
+                assert got[key] == pytest.approx(value, abs=1e-9)
+        full = generate_alerts(expected, "Moderada", DEFAULT_THRESHOLDS)
+        assert [a["type"] for a in wm.alerts()] == [a["type"] for a in full]